@@ -0,0 +1,243 @@
+"""
+Amistades materializadas y caché de amigos por usuario.
+
+PeticionAmistad guarda la solicitud en una sola dirección, así que sacar
+los amigos era un UNION de dos joins. La tabla Amistad tiene una fila por
+cada lado de cada amistad aceptada, con índice (usuario, amigo); las
+señales de PeticionAmistad la mantienen al aceptar, borrar o bloquear.
+
+El conjunto de ids de amigos de cada usuario se guarda en caché bajo
+amigos:<id>:<versión>, igual que cache_relatos: invalidar es subir la
+versión de los dos usuarios.
+
+Las sugerencias de amistad ("gente que quizá conozcas") salen de recorrer
+dos saltos del grafo (amigos de mis amigos) con un tope de amigos de
+partida, más los coautores de mis relatos.
+"""
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Amistad, ParticipacionRelato, PeticionAmistad
+
+
+# ——— Amigos ——————————————————————————————————————————————————————————
+
+def _clave_version(usuario_id):
+    return f"amigos:{usuario_id}:version"
+
+
+def _version(usuario_id):
+    return cache.get_or_set(_clave_version(usuario_id), int(time.time() * 1000), timeout=None)
+
+
+def ids_amigos(usuario_id):
+    """frozenset con los ids de los amigos del usuario (caché o una query por índice)."""
+    clave = f"amigos:{usuario_id}:{_version(usuario_id)}"
+    amigos = cache.get(clave)
+    if amigos is None:
+        amigos = frozenset(Amistad.objects.filter(usuario_id=usuario_id).values_list('amigo_id', flat=True))
+        cache.set(clave, amigos, settings.AMISTADES_CACHE_TTL)
+    return amigos
+
+
+def ids_amigos_varios(usuario_ids):
+    """{usuario_id: frozenset de amigos} para muchos usuarios: dos lecturas de caché y, si faltan, una query."""
+    usuario_ids = set(usuario_ids)
+    versiones = cache.get_many([_clave_version(u) for u in usuario_ids])
+    claves = {
+        u: f"amigos:{u}:{versiones.get(_clave_version(u)) or _version(u)}" for u in usuario_ids
+    }
+    en_cache = cache.get_many(claves.values())
+    amigos = {u: en_cache[clave] for u, clave in claves.items() if clave in en_cache}
+    faltan = usuario_ids - set(amigos)
+    if faltan:
+        cargados = {u: set() for u in faltan}
+        for u, amigo in Amistad.objects.filter(usuario_id__in=faltan).values_list('usuario_id', 'amigo_id'):
+            cargados[u].add(amigo)
+        cargados = {u: frozenset(ids) for u, ids in cargados.items()}
+        cache.set_many({claves[u]: ids for u, ids in cargados.items()}, settings.AMISTADES_CACHE_TTL)
+        amigos.update(cargados)
+    return amigos
+
+
+def ids_bloqueados(usuario_id):
+    """Usuarios con un bloqueo con este (en cualquier dirección). Misma versión de caché que los amigos."""
+    clave = f"bloqueados:{usuario_id}:{_version(usuario_id)}"
+    bloqueados = cache.get(clave)
+    if bloqueados is None:
+        bloqueados = frozenset(
+            otro
+            for par in PeticionAmistad.objects.filter(
+                Q(de_usuario_id=usuario_id) | Q(a_usuario_id=usuario_id), estado='BLOQUEADA'
+            ).values_list('de_usuario_id', 'a_usuario_id')
+            for otro in par
+            if otro != usuario_id
+        )
+        cache.set(clave, bloqueados, settings.AMISTADES_CACHE_TTL)
+    return bloqueados
+
+
+def son_amigos(usuario_id, otro_id):
+    return otro_id in ids_amigos(usuario_id)
+
+
+def invalidar_amigos(*usuario_ids):
+    for usuario_id in usuario_ids:
+        try:
+            cache.incr(_clave_version(usuario_id))
+        except ValueError:
+            cache.set(_clave_version(usuario_id), int(time.time() * 1000), timeout=None)
+
+
+# Relación de un usuario con otro, vista desde el primero
+YO = 'yo'
+AMIGO = 'amigo'
+SOLICITUD_ENVIADA = 'solicitud_enviada'
+SOLICITUD_RECIBIDA = 'solicitud_recibida'
+BLOQUEADO = 'bloqueado'
+NINGUNA = 'ninguna'
+
+
+def estados_relacion(usuario_id, otros_ids):
+    """
+    {otro_id: {'relacion': ..., 'amigos_comunes': n}} para muchos usuarios a
+    la vez: una query a PeticionAmistad para la relación y los amigos en común
+    como intersección de los conjuntos de amigos (caché).
+    Si el otro me ha bloqueado no se dice: sale como NINGUNA.
+    """
+    otros_ids = set(otros_ids)
+    relaciones = {otro: NINGUNA for otro in otros_ids}
+    for de, para, estado in PeticionAmistad.objects.filter(
+        Q(de_usuario_id=usuario_id, a_usuario_id__in=otros_ids)
+        | Q(de_usuario_id__in=otros_ids, a_usuario_id=usuario_id)
+    ).values_list('de_usuario_id', 'a_usuario_id', 'estado'):
+        enviada = de == usuario_id
+        otro = para if enviada else de
+        if estado == 'ACEPTADA':
+            relaciones[otro] = AMIGO
+        elif estado == 'PENDIENTE':
+            relaciones[otro] = SOLICITUD_ENVIADA if enviada else SOLICITUD_RECIBIDA
+        elif estado == 'BLOQUEADA' and enviada:
+            relaciones[otro] = BLOQUEADO
+    if usuario_id in relaciones:
+        relaciones[usuario_id] = YO
+
+    amigos = ids_amigos_varios(otros_ids | {usuario_id})
+    mios = amigos[usuario_id]
+    return {
+        otro: {'relacion': relacion, 'amigos_comunes': len(mios & amigos[otro]) if otro != usuario_id else 0}
+        for otro, relacion in relaciones.items()
+    }
+
+
+# ——— Mantenimiento de la tabla ——————————————————————————————————————
+
+def sincronizar_amistad(de_usuario_id, a_usuario_id):
+    """
+    Deja Amistad igual que PeticionAmistad para ese par de usuarios: las dos
+    filas si hay una solicitud ACEPTADA en cualquier dirección y ninguna si no.
+    """
+    par = [de_usuario_id, a_usuario_id]
+    aceptada = PeticionAmistad.objects.filter(
+        Q(de_usuario_id=de_usuario_id, a_usuario_id=a_usuario_id)
+        | Q(de_usuario_id=a_usuario_id, a_usuario_id=de_usuario_id),
+        estado='ACEPTADA',
+    ).exists()
+    if aceptada:
+        Amistad.objects.bulk_create(
+            [Amistad(usuario_id=de_usuario_id, amigo_id=a_usuario_id),
+             Amistad(usuario_id=a_usuario_id, amigo_id=de_usuario_id)],
+            ignore_conflicts=True,
+        )
+    else:
+        Amistad.objects.filter(usuario_id__in=par, amigo_id__in=par).delete()
+    # Ya y otra vez al confirmar, por si alguien lee la versión vieja entre medias
+    invalidar_amigos(*par)
+    transaction.on_commit(lambda: invalidar_amigos(*par))
+
+
+def reconstruir_amistades():
+    """Rehace la tabla Amistad entera desde PeticionAmistad. Devuelve cuántas amistades hay."""
+    aceptadas = list(PeticionAmistad.objects.filter(estado='ACEPTADA').values_list('de_usuario_id', 'a_usuario_id'))
+    with transaction.atomic():
+        afectados = set(Amistad.objects.values_list('usuario_id', flat=True).distinct())
+        Amistad.objects.all().delete()
+        Amistad.objects.bulk_create(
+            [Amistad(usuario_id=a, amigo_id=b) for de, para in aceptadas for a, b in ((de, para), (para, de))],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+    invalidar_amigos(*afectados.union(u for par in aceptadas for u in par))
+    return len(aceptadas)
+
+
+# ——— Sugerencias —————————————————————————————————————————————————————
+
+def _excluidos(usuario_id):
+    # Yo, mis amigos y cualquiera con una solicitud pendiente o un bloqueo conmigo (en las dos direcciones)
+    excluidos = {usuario_id} | ids_amigos(usuario_id)
+    for de, para in PeticionAmistad.objects.filter(
+        Q(de_usuario_id=usuario_id) | Q(a_usuario_id=usuario_id),
+        estado__in=['PENDIENTE', 'BLOQUEADA'],
+    ).values_list('de_usuario_id', 'a_usuario_id'):
+        excluidos.update((de, para))
+    return excluidos
+
+
+def calcular_sugerencias(usuario_id):
+    """
+    Lista de (usuario_id, amigos_comunes, relatos_comunes) ordenada por
+    puntuación. Tres queries, cada una acotada:
+    1) amigos de (como mucho SUGERENCIAS_MAX_AMIGOS de) mis amigos, agrupados;
+    2) coautores de mis relatos, agrupados;
+    3) solicitudes pendientes y bloqueos, para excluirlos.
+    """
+    amigos = sorted(ids_amigos(usuario_id))[:settings.SUGERENCIAS_MAX_AMIGOS]
+    excluidos = _excluidos(usuario_id)
+
+    comunes = Counter(dict(
+        Amistad.objects
+        .filter(usuario_id__in=amigos)
+        .exclude(amigo_id__in=excluidos)
+        .values('amigo_id')
+        .annotate(n=Count('usuario_id'))
+        .order_by('-n')
+        .values_list('amigo_id', 'n')[:settings.SUGERENCIAS_MAX_CANDIDATOS]
+    )) if amigos else Counter()
+
+    relatos = Counter(dict(
+        ParticipacionRelato.objects
+        .filter(relato__in=ParticipacionRelato.objects.filter(usuario_id=usuario_id).values('relato'))
+        .exclude(usuario_id__in=excluidos)
+        .values('usuario_id')
+        .annotate(n=Count('relato', distinct=True))
+        .order_by('-n')
+        .values_list('usuario_id', 'n')[:settings.SUGERENCIAS_MAX_CANDIDATOS]
+    ))
+
+    candidatos = [
+        (candidato, comunes[candidato], relatos[candidato])
+        for candidato in set(comunes) | set(relatos)
+    ]
+    candidatos.sort(key=lambda c: (
+        -(c[1] * settings.SUGERENCIAS_PESO_AMIGO + c[2] * settings.SUGERENCIAS_PESO_RELATO), -c[1], c[0]
+    ))
+    return candidatos[:settings.SUGERENCIAS_LIMITE]
+
+
+def sugerencias_amistad(usuario_id):
+    """
+    Sugerencias cacheadas SUGERENCIAS_CACHE_TTL segundos. La clave lleva la
+    versión de mis amigos, así que al aceptar o borrar una amistad se recalculan.
+    """
+    clave = f"sugerencias:{usuario_id}:{_version(usuario_id)}"
+    sugerencias = cache.get(clave)
+    if sugerencias is None:
+        sugerencias = calcular_sugerencias(usuario_id)
+        cache.set(clave, sugerencias, settings.SUGERENCIAS_CACHE_TTL)
+    return sugerencias
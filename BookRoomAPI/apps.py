@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BookroomapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'BookRoomAPI'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,22 @@
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+
+from .cache_tokens import resolver_token
+
+
+class OAuth2AuthenticationCacheada(OAuth2Authentication):
+    """
+    OAuth2Authentication que resuelve el token de `Authorization: Bearer`
+    con cache_tokens en vez de consultar AccessToken en cada petición.
+    Sin cabecera Bearer o con un token que no vale se delega en la clase
+    original, que es la que rellena el error del WWW-Authenticate.
+    """
+
+    def authenticate(self, request):
+        if request is None:
+            return None
+        tipo, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if tipo.lower() == 'bearer' and token.strip():
+            access_token = resolver_token(token.strip())
+            if access_token is not None:
+                return access_token.user, access_token
+        return super().authenticate(request)
@@ -0,0 +1,297 @@
+"""
+Modo write-behind de los votos de relatos (VOTOS_WRITE_BEHIND).
+
+En lugar de guardar cada voto en la petición, api_votar_relato solo lo
+apunta en un buffer en memoria y en un diario en disco, y responde
+enseguida; un hilo vuelca el buffer cada
+VOTOS_FLUSH_MS milisegundos a Voto, Estadistica y los contadores de los
+autores, todo el lote en una transacción:
+
+- si un usuario vota varias veces el mismo relato antes del volcado, solo
+  cuenta el último voto;
+- volcar es idempotente (se compara con el voto guardado), así que repetir
+  un lote tras un fallo no cuenta nada dos veces;
+- cada voto lleva el instante en que se emitió y no pisa un Voto con
+  fecha_actualizacion posterior (p. ej. al recuperar un diario antiguo
+  cuando el usuario ya ha vuelto a votar desde otro worker);
+- los votos de relatos o usuarios que ya no existen se descartan, y un voto
+  que hace fallar VOTOS_FLUSH_MAX_INTENTOS volcados seguidos pasa a un
+  fichero de cuarentena (cuarentena-<pid>-<instante>.jsonl) para que no
+  bloquee al resto.
+
+Durabilidad: cada proceso escribe su diario (un JSON por línea) en
+VOTOS_BUFFER_DIR. Al salir de forma ordenada se vuelca lo pendiente; si el
+proceso muere antes, el siguiente que arranque recupera los diarios de los
+procesos que ya no existen.
+"""
+import atexit
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as tz
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .cola_estadisticas import encolar_recalculo
+from .contadores import incrementar_contador_por_usuario
+from .models import ParticipacionRelato, Relato, Usuario, Voto
+from .utils import aplicar_histograma_votos, columna_votos
+
+logger = logging.getLogger(__name__)
+
+# ——— Escritura de un lote de votos ——————————————————————————————————
+
+def guardar_votos(votos):
+    """
+    Guarda {(usuario_id, relato_id): (puntuacion, instante)} en una
+    transacción y devuelve cuántos votos son nuevos. `instante` es el
+    time.time() en que se emitió el voto.
+    """
+    if not votos:
+        return 0
+    # Relatos o usuarios borrados desde que se votó: su FK haría fallar todo el lote
+    relatos = set(Relato.objects.filter(pk__in={r for _, r in votos}).values_list('pk', flat=True))
+    usuarios = set(Usuario.objects.filter(pk__in={u for u, _ in votos}).values_list('pk', flat=True))
+    descartados = [clave for clave in votos if clave[0] not in usuarios or clave[1] not in relatos]
+    if descartados:
+        logger.warning("Votos descartados (relato o usuario borrado): %s", descartados)
+        votos = {clave: valor for clave, valor in votos.items() if clave[0] in usuarios and clave[1] in relatos}
+        if not votos:
+            return 0
+    with transaction.atomic():
+        # 1) Votos ya guardados de esos pares usuario/relato
+        candidatos = (
+            Voto.objects.select_for_update()
+            .filter(usuario_id__in={u for u, _ in votos}, relato_id__in={r for _, r in votos})
+            .only('id', 'usuario_id', 'relato_id', 'puntuacion', 'fecha_actualizacion')
+        )
+        existentes = {
+            (v.usuario_id, v.relato_id): v for v in candidatos if (v.usuario_id, v.relato_id) in votos
+        }
+
+        # 2) Nuevos, cambiados y deltas del histograma de cada relato
+        nuevos, cambiados = [], []
+        histogramas = defaultdict(lambda: defaultdict(int))
+        votos_nuevos_por_relato = defaultdict(int)
+        for (usuario_id, relato_id), (puntuacion, instante) in votos.items():
+            voto = existentes.get((usuario_id, relato_id))
+            fecha = datetime.fromtimestamp(instante, tz.utc)
+            if voto is None:
+                nuevos.append(Voto(
+                    usuario_id=usuario_id, relato_id=relato_id, puntuacion=puntuacion, fecha_actualizacion=fecha
+                ))
+                votos_nuevos_por_relato[relato_id] += 1
+            elif voto.puntuacion != puntuacion and voto.fecha_actualizacion < fecha:
+                histogramas[relato_id][columna_votos(voto.puntuacion)] -= 1
+                voto.puntuacion, voto.fecha_actualizacion = puntuacion, fecha
+                cambiados.append(voto)
+            else:
+                # Igual que el guardado o más antiguo que él
+                continue
+            histogramas[relato_id][columna_votos(puntuacion)] += 1
+
+        Voto.objects.bulk_create(nuevos)
+        Voto.objects.bulk_update(cambiados, ['puntuacion', 'fecha_actualizacion'])
+        for relato_id, deltas in histogramas.items():
+            aplicar_histograma_votos(relato_id, deltas)
+            encolar_recalculo(relato_id)
+
+        # 3) Votos recibidos de los autores: un UPDATE para todos
+        if votos_nuevos_por_relato:
+            recibidos = defaultdict(int)
+            for autor_id, relato_id in ParticipacionRelato.objects.filter(
+                relato_id__in=votos_nuevos_por_relato
+            ).values_list('usuario_id', 'relato_id'):
+                recibidos[autor_id] += votos_nuevos_por_relato[relato_id]
+            incrementar_contador_por_usuario('total_votos_recibidos', recibidos)
+    return len(nuevos)
+
+
+# ——— Buffer write-behind ————————————————————————————————————————————
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class BufferVotos:
+
+    def __init__(self, directorio, intervalo_ms, iniciar_worker=True):
+        self.intervalo = intervalo_ms / 1000
+        self.iniciar_worker = iniciar_worker
+        self._pendientes = {}  # (usuario_id, relato_id) -> (puntuacion, instante)
+        self._intentos = defaultdict(int)  # volcados fallidos seguidos de cada voto
+        self._lock = threading.Lock()
+        self._vaciando = threading.Lock()
+        self._parar = threading.Event()
+        self._hilo = None
+
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        self.ruta_diario = os.path.join(directorio, f"votos-{os.getpid()}.jsonl")
+        self._recuperados = self._recuperar_diarios()
+        self._diario = open(self.ruta_diario, 'a', encoding='utf-8')
+        self._reescribir_diario()
+        if self._pendientes:
+            self._arrancar_worker()
+
+    # — Diario en disco —
+
+    def _recuperar_diarios(self):
+        # Diarios de procesos que ya no existen (y el nuestro si quedó de un pid reciclado)
+        recuperados = []
+        for nombre in os.listdir(self.directorio):
+            if not (nombre.startswith('votos-') and nombre.endswith('.jsonl')):
+                continue
+            try:
+                pid = int(nombre[len('votos-'):-len('.jsonl')])
+            except ValueError:
+                continue
+            if pid != os.getpid() and _proceso_vivo(pid):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                # Diarios sin instante por voto (formato anterior): el del fichero
+                por_defecto = os.path.getmtime(ruta)
+                with open(ruta, encoding='utf-8') as f:
+                    lineas = f.readlines()
+            except FileNotFoundError:
+                continue  # otro worker lo ha recuperado y volcado ya
+            for linea in lineas:
+                try:
+                    usuario_id, relato_id, puntuacion, *instante = json.loads(linea)
+                except ValueError:
+                    continue  # última línea a medio escribir
+                instante = instante[0] if instante else por_defecto
+                anterior = self._pendientes.get((usuario_id, relato_id))
+                if anterior is None or anterior[1] <= instante:
+                    self._pendientes[(usuario_id, relato_id)] = (puntuacion, instante)
+            if ruta != self.ruta_diario:
+                recuperados.append(ruta)
+        return recuperados
+
+    def _reescribir_diario(self):
+        # Deja en el diario solo lo que sigue pendiente (con el lock tomado)
+        self._diario.seek(0)
+        self._diario.truncate()
+        for (usuario_id, relato_id), (puntuacion, instante) in self._pendientes.items():
+            self._diario.write(json.dumps([usuario_id, relato_id, puntuacion, instante]) + '\n')
+        self._diario.flush()
+
+    # — API —
+
+    def registrar(self, usuario_id, relato_id, puntuacion):
+        instante = time.time()
+        with self._lock:
+            self._diario.write(json.dumps([usuario_id, relato_id, puntuacion, instante]) + '\n')
+            self._diario.flush()
+            self._pendientes[(usuario_id, relato_id)] = (puntuacion, instante)
+            self._intentos.pop((usuario_id, relato_id), None)
+            self._arrancar_worker()
+
+    def _arrancar_worker(self):
+        if self.iniciar_worker and (self._hilo is None or not self._hilo.is_alive()):
+            self._hilo = threading.Thread(target=self._bucle, name='buffer-votos', daemon=True)
+            self._hilo.start()
+
+    def pendiente(self, usuario_id, relato_id):
+        with self._lock:
+            pendiente = self._pendientes.get((usuario_id, relato_id))
+        return pendiente[0] if pendiente else None
+
+    def vaciar(self):
+        """Vuelca lo pendiente a la base de datos. Devuelve cuántos votos se escribieron."""
+        with self._vaciando:
+            with self._lock:
+                lote, self._pendientes = self._pendientes, {}
+            try:
+                guardar_votos(lote)
+            except Exception:
+                # Se devuelven al buffer sin pisar votos más nuevos (el diario los sigue teniendo),
+                # salvo los que ya han fallado demasiadas veces: esos van a cuarentena
+                with self._lock:
+                    reintentar, cuarentena = {}, {}
+                    for clave, valor in lote.items():
+                        self._intentos[clave] += 1
+                        destino = cuarentena if self._intentos[clave] >= settings.VOTOS_FLUSH_MAX_INTENTOS else reintentar
+                        destino[clave] = valor
+                    for clave in cuarentena:
+                        del self._intentos[clave]
+                    self._pendientes = {**reintentar, **self._pendientes}
+                    if cuarentena:
+                        self._poner_en_cuarentena(cuarentena)
+                        self._reescribir_diario()
+                raise
+            with self._lock:
+                for clave in lote:
+                    self._intentos.pop(clave, None)
+                self._reescribir_diario()
+            # Otro worker puede haber recuperado (y borrado) el mismo diario huérfano
+            for ruta in list(self._recuperados):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(ruta)
+                self._recuperados.remove(ruta)
+            return len(lote)
+
+    def _poner_en_cuarentena(self, votos):
+        ruta = os.path.join(self.directorio, f"cuarentena-{os.getpid()}-{int(time.time() * 1000)}.jsonl")
+        with open(ruta, 'a', encoding='utf-8') as f:
+            for (usuario_id, relato_id), (puntuacion, instante) in votos.items():
+                f.write(json.dumps([usuario_id, relato_id, puntuacion, instante]) + '\n')
+        logger.error("%s votos no se pudieron volcar tras varios intentos; guardados en %s", len(votos), ruta)
+
+    def cerrar(self):
+        self._parar.set()
+        try:
+            self.vaciar()
+        except Exception:
+            logger.exception("No se pudo volcar el buffer de votos al salir; queda en %s", self.ruta_diario)
+        self._diario.close()
+        if not self._pendientes:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.ruta_diario)
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo):
+            if not self._pendientes:
+                continue
+            close_old_connections()
+            try:
+                self.vaciar()
+            except Exception:
+                logger.exception("Error volcando el buffer de votos; se reintenta en el siguiente ciclo")
+            close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def obtener_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = BufferVotos(settings.VOTOS_BUFFER_DIR, settings.VOTOS_FLUSH_MS)
+            # Salida ordenada del worker: se vuelca lo pendiente
+            atexit.register(_buffer.cerrar)
+        return _buffer
+
+
+def cerrar_buffer():
+    """Vuelca y cierra el buffer del proceso (la próxima petición abre otro)."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            atexit.unregister(_buffer.cerrar)
+            _buffer.cerrar()
+            _buffer = None
@@ -0,0 +1,256 @@
+"""
+Búsqueda de texto completo de relatos publicados.
+
+En lugar de LIKE '%x%' (que recorre la tabla entera) mantenemos un índice
+invertido propio en la tabla TerminoRelato: una fila por (relato, término,
+campo) con su peso. Cada idioma de Relato.IDIOMAS tiene su analizador:
+stemming Snowball para es/en/de/ru y bigramas de caracteres para ja.
+Las consultas se resuelven con el índice (termino, relato) y se ordenan
+por relevancia (peso del término en el relato x idf del término).
+"""
+import math
+import re
+import threading
+import unicodedata
+
+import snowballstemmer
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.utils.html import strip_tags
+from html import unescape
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Relato, TerminoRelato
+
+# ——— Analizadores ————————————————————————————————————————————————————
+
+STEMMERS = {
+    'es': 'spanish',
+    'en': 'english',
+    'de': 'german',
+    'ru': 'russian',
+}
+
+PALABRAS_VACIAS = {
+    'es': {
+        'a', 'al', 'con', 'de', 'del', 'el', 'en', 'es', 'la', 'las', 'lo', 'los', 'me', 'mi',
+        'no', 'o', 'para', 'por', 'que', 'se', 'si', 'su', 'sus', 'te', 'un', 'una', 'y', 'ya',
+    },
+    'en': {
+        'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'he', 'in', 'is', 'it',
+        'its', 'of', 'on', 'or', 'she', 'that', 'the', 'to', 'was', 'were', 'with',
+    },
+    'de': {
+        'das', 'dem', 'den', 'der', 'des', 'die', 'ein', 'eine', 'einen', 'er', 'es', 'ich',
+        'im', 'in', 'ist', 'mit', 'nicht', 'sie', 'und', 'von', 'zu',
+    },
+    'ru': {
+        'а', 'в', 'во', 'да', 'же', 'и', 'из', 'к', 'как', 'на', 'не', 'но', 'о', 'он', 'она',
+        'по', 'с', 'со', 'то', 'у', 'что', 'я',
+    },
+}
+
+PALABRA = re.compile(r'\w+', re.UNICODE)
+# Hiragana, katakana, kanji y katakana de ancho medio
+CJK = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff66-\uff9f]+')
+
+LONGITUD_MAXIMA_TERMINO = 50
+
+_local = threading.local()
+
+
+def _stemmer(idioma):
+    # Los stemmers de Snowball guardan estado: uno por hilo y por idioma
+    stemmers = getattr(_local, 'stemmers', None)
+    if stemmers is None:
+        stemmers = _local.stemmers = {}
+    if idioma not in stemmers:
+        stemmers[idioma] = snowballstemmer.stemmer(STEMMERS[idioma])
+    return stemmers[idioma]
+
+
+def _quitar_tildes(texto):
+    return ''.join(
+        c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c)
+    )
+
+
+def _analizar_con_stemming(texto, idioma):
+    vacias = PALABRAS_VACIAS[idioma]
+    palabras = [p for p in PALABRA.findall(texto.lower()) if p not in vacias and not p.isdigit()]
+    raices = _stemmer(idioma).stemWords(palabras)
+    if idioma in ('es', 'en', 'de'):
+        # Así "cancion" y "canción" dan el mismo término
+        raices = [_quitar_tildes(r) for r in raices]
+    return raices
+
+
+def _analizar_japones(texto):
+    terminos = []
+    texto = unicodedata.normalize('NFKC', texto).lower()
+    for bloque in CJK.findall(texto):
+        if len(bloque) == 1:
+            terminos.append(bloque)
+        else:
+            terminos.extend(bloque[i:i + 2] for i in range(len(bloque) - 1))
+    # Palabras en alfabeto latino u otros dentro del texto japonés
+    terminos.extend(p for p in PALABRA.findall(CJK.sub(' ', texto)) if not p.isdigit())
+    return terminos
+
+
+def analizar(texto, idioma):
+    """Convierte un texto en la lista de términos del índice para ese idioma."""
+    if not texto:
+        return []
+    if idioma == 'ja':
+        terminos = _analizar_japones(texto)
+    else:
+        terminos = _analizar_con_stemming(texto, idioma if idioma in STEMMERS else 'en')
+    return [t[:LONGITUD_MAXIMA_TERMINO] for t in terminos if t]
+
+
+def texto_plano(html):
+    return unescape(strip_tags(html or ''))
+
+
+def terminos_por_idioma(consulta, idioma=None):
+    """
+    Analiza la consulta con el analizador de cada idioma (o solo con el
+    indicado). Cada relato se indexó con el de su idioma, así que solo se
+    compara con los términos de ese mismo analizador.
+    """
+    idiomas = [idioma] if idioma in dict(Relato.IDIOMAS) else [c for c, _ in Relato.IDIOMAS]
+    terminos = {codigo: set(analizar(consulta, codigo)) for codigo in idiomas}
+    return {codigo: ts for codigo, ts in terminos.items() if ts}
+
+
+# ——— Indexación ——————————————————————————————————————————————————————
+
+PESOS_CAMPO = {
+    TerminoRelato.TITULO: 3.0,
+    TerminoRelato.DESCRIPCION: 2.0,
+    TerminoRelato.CONTENIDO: 1.0,
+}
+
+
+def indexar_relato(relato):
+    """
+    (Re)genera las filas del índice de un relato. Solo se indexan los
+    relatos publicados; para el resto se borra lo que hubiera.
+    """
+    with transaction.atomic():
+        TerminoRelato.objects.filter(relato_id=relato.pk).delete()
+        if relato.estado != 'PUBLICADO':
+            return
+
+        textos = {
+            TerminoRelato.TITULO: relato.titulo,
+            TerminoRelato.DESCRIPCION: relato.descripcion,
+            TerminoRelato.CONTENIDO: texto_plano(relato.contenido),
+        }
+        filas = []
+        for campo, texto in textos.items():
+            frecuencias = {}
+            for termino in analizar(texto, relato.idioma):
+                frecuencias[termino] = frecuencias.get(termino, 0) + 1
+            for termino, frecuencia in frecuencias.items():
+                filas.append(TerminoRelato(
+                    relato_id=relato.pk,
+                    termino=termino,
+                    campo=campo,
+                    peso=PESOS_CAMPO[campo] * (1 + math.log(frecuencia)),
+                ))
+        TerminoRelato.objects.bulk_create(filas, batch_size=1000)
+
+
+# ——— Consultas ———————————————————————————————————————————————————————
+
+def _idf(terminos):
+    total = Relato.objects.filter(estado='PUBLICADO').count()
+    frecuencias = dict(
+        TerminoRelato.objects
+        .filter(termino__in=terminos)
+        .values('termino')
+        .annotate(df=Count('relato', distinct=True))
+        .values_list('termino', 'df')
+    )
+    return {
+        termino: math.log(1 + (total - df + 0.5) / (df + 0.5))
+        for termino, df in frecuencias.items()
+    }
+
+
+def buscar_relatos(queryset, consulta, idioma=None):
+    """
+    Filtra `queryset` a los relatos que contienen algún término de la consulta
+    y lo anota con `relevancia` (mayor es mejor).
+    """
+    terminos = terminos_por_idioma(consulta, idioma)
+    idf = _idf(set().union(*terminos.values()))
+
+    filtro = Q()
+    relevancias = []
+    for codigo, ts in terminos.items():
+        ts = [t for t in ts if t in idf]
+        if not ts:
+            continue
+        peso_idf = Case(
+            *[When(termino=t, then=Value(idf[t])) for t in ts],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        puntuacion = (
+            TerminoRelato.objects
+            .filter(relato=OuterRef('pk'), termino__in=ts)
+            .values('relato')
+            .annotate(total=Sum(F('peso') * peso_idf))
+            .values('total')
+        )
+        filtro |= Q(idioma=codigo, id__in=TerminoRelato.objects.filter(termino__in=ts).values('relato'))
+        relevancias.append(When(idioma=codigo, then=Subquery(puntuacion, output_field=FloatField())))
+
+    if not relevancias:
+        return queryset.none().annotate(relevancia=Value(0.0, output_field=FloatField()))
+    return queryset.filter(filtro).annotate(
+        relevancia=Case(*relevancias, default=Value(0.0), output_field=FloatField())
+    )
+
+
+def filtrar_por_campo(queryset, texto, campo, idioma=None):
+    # Todos los términos del texto deben aparecer en ese campo del relato
+    filtro = Q()
+    for codigo, ts in terminos_por_idioma(texto, idioma).items():
+        condicion = Q(idioma=codigo)
+        for termino in ts:
+            condicion &= Q(id__in=TerminoRelato.objects.filter(termino=termino, campo=campo).values('relato'))
+        filtro |= condicion
+    if not filtro:
+        return queryset.none()
+    return queryset.filter(filtro)
+
+
+class BusquedaRelatosFilter(BaseFilterBackend):
+    """
+    Sustituye a SearchFilter en los listados de relatos publicados:
+    ?search= usa el índice y, si no se pide otro ?ordering=, ordena por relevancia.
+    Debe ir después de OrderingFilter en filter_backends.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        consulta = request.query_params.get(self.search_param, '').strip()
+        if not consulta:
+            return queryset
+        queryset = buscar_relatos(queryset, consulta, request.query_params.get('idioma'))
+        if 'ordering' not in request.query_params:
+            queryset = queryset.order_by('-relevancia', '-id')
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Búsqueda de texto completo (título, descripción y contenido).',
+            'schema': {'type': 'string'},
+        }]
@@ -0,0 +1,119 @@
+"""
+Búsqueda de usuarios por nombre de usuario.
+
+Sustituye a username__icontains (que recorre toda la tabla) por:
+- Usuario.username_normalizado (minúsculas y sin tildes) con índice: los
+  resultados exactos y por prefijo salen de un rango del índice;
+- la tabla TrigramaUsuario (una fila por trigrama del nombre normalizado,
+  índice (trigrama, usuario)): los que contienen la consulta en medio son
+  los que tienen todos sus trigramas, y se comprueba el nombre al final.
+
+Orden: exacto, después prefijo y después el resto, cada grupo por longitud
+y nombre. Como mucho BUSQUEDA_USUARIOS_MAX_RESULTADOS resultados.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Length
+
+from .busqueda import _quitar_tildes
+from .models import TrigramaUsuario, Usuario
+
+LONGITUD_MINIMA = 3
+
+
+def normalizar(texto):
+    return _quitar_tildes((texto or '').strip().lower())
+
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+# ——— Indexación ——————————————————————————————————————————————————————
+
+def indexar_usuario(usuario):
+    """
+    Pone al día username_normalizado y los trigramas si ha cambiado el
+    username. Devuelve si ha habido cambios.
+    """
+    normalizado = normalizar(usuario.username)
+    if normalizado == usuario.username_normalizado:
+        return False
+    with transaction.atomic():
+        Usuario.objects.filter(pk=usuario.pk).update(username_normalizado=normalizado)
+        usuario.username_normalizado = normalizado
+        TrigramaUsuario.objects.filter(usuario_id=usuario.pk).delete()
+        TrigramaUsuario.objects.bulk_create(
+            [TrigramaUsuario(usuario_id=usuario.pk, trigrama=t) for t in trigramas(normalizado)]
+        )
+    return True
+
+
+def reindexar_usuarios(lote=2000):
+    """Rehace el índice de todos los usuarios. Devuelve cuántos se han indexado."""
+    total = 0
+    ultimo = 0
+    while True:
+        usuarios = list(Usuario.objects.filter(pk__gt=ultimo).order_by('pk').values_list('pk', 'username')[:lote])
+        if not usuarios:
+            return total
+        ids = [pk for pk, _ in usuarios]
+        with transaction.atomic():
+            TrigramaUsuario.objects.filter(usuario_id__in=ids).delete()
+            filas, cambiados = [], []
+            for pk, username in usuarios:
+                normalizado = normalizar(username)
+                cambiados.append(Usuario(pk=pk, username_normalizado=normalizado))
+                filas.extend(TrigramaUsuario(usuario_id=pk, trigrama=t) for t in trigramas(normalizado))
+            Usuario.objects.bulk_update(cambiados, ['username_normalizado'], batch_size=500)
+            TrigramaUsuario.objects.bulk_create(filas, batch_size=5000)
+        total += len(usuarios)
+        ultimo = ids[-1]
+
+
+# ——— Consultas ———————————————————————————————————————————————————————
+
+def buscar_usuarios(consulta, excluir=()):
+    """
+    Ids de los usuarios que contienen `consulta`, ya ordenados por relevancia.
+    `excluir` son ids que no deben salir (yo, bloqueados...).
+    """
+    q = normalizar(consulta)
+    if len(q) < LONGITUD_MINIMA:
+        return []
+    maximo = settings.BUSQUEDA_USUARIOS_MAX_RESULTADOS
+    excluir = set(excluir)
+
+    # 1) Exactos y prefijos: rango del índice de username_normalizado
+    # (istartswith en MySQL es LIKE 'q%' con la collation _ci, que usa el índice;
+    # startswith sería LIKE BINARY)
+    por_prefijo = list(
+        Usuario.objects
+        .filter(username_normalizado__istartswith=q)
+        .exclude(pk__in=excluir)
+        .order_by('username_normalizado')
+        .values_list('pk', 'username_normalizado')[:maximo]
+    )
+    resultados = [pk for pk, _ in sorted(por_prefijo, key=lambda u: (len(u[1]), u[1]))]
+    if len(resultados) >= maximo:
+        return resultados
+
+    # 2) Contienen la consulta en medio: todos sus trigramas y el nombre lo confirma
+    tris = trigramas(q)
+    candidatos = (
+        TrigramaUsuario.objects
+        .filter(trigrama__in=tris)
+        .values('usuario_id')
+        .annotate(n=Count('id'))
+        .filter(n=len(tris))
+        .values('usuario_id')
+    )
+    en_medio = (
+        Usuario.objects
+        .filter(pk__in=candidatos, username_normalizado__icontains=q)
+        .exclude(pk__in=excluir.union(resultados))
+        .order_by(Length('username_normalizado'), 'username_normalizado')
+        .values_list('pk', flat=True)[:maximo - len(resultados)]
+    )
+    return resultados + list(en_medio)
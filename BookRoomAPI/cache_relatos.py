@@ -0,0 +1,50 @@
+"""
+Caché de la respuesta pública de un relato publicado (api_ver_relato_publicado).
+
+Cada relato tiene una "versión" en caché y el payload se guarda bajo
+relato_publicado:<id>:<versión>. Invalidar es subir la versión, así una
+lectura que empezó antes de una edición no puede dejar guardado el
+contenido antiguo con la clave nueva.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def _clave_version(relato_id):
+    return f"relato_publicado:{relato_id}:version"
+
+
+def _version(relato_id):
+    # Si la versión se ha perdido de la caché empezamos por un valor nuevo (ms actuales)
+    return cache.get_or_set(_clave_version(relato_id), int(time.time() * 1000), timeout=None)
+
+
+def calcular_etag(data):
+    contenido = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+    return '"%s"' % hashlib.sha256(contenido.encode()).hexdigest()[:40]
+
+
+def obtener_relato_publicado(relato_id, generar):
+    """
+    Devuelve (etag, data) del relato desde la caché. Si no está, llama a
+    `generar()` (que consulta la BD y serializa) y guarda el resultado.
+    """
+    clave = f"relato_publicado:{relato_id}:{_version(relato_id)}"
+    en_cache = cache.get(clave)
+    if en_cache is None:
+        data = generar()
+        en_cache = (calcular_etag(data), data)
+        cache.set(clave, en_cache, settings.RELATO_PUBLICADO_CACHE_TTL)
+    return en_cache
+
+
+def invalidar_relato_publicado(relato_id):
+    try:
+        cache.incr(_clave_version(relato_id))
+    except ValueError:
+        cache.set(_clave_version(relato_id), int(time.time() * 1000), timeout=None)
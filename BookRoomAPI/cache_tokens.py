@@ -0,0 +1,98 @@
+"""
+Caché de los access tokens de OAuth2, compartida por la autenticación de la
+API (autenticacion.OAuth2AuthenticationCacheada) y la de los WebSockets
+(middleware.TokenAuthMiddleware).
+
+Sin ella cada petición autenticada hace el join AccessToken + Usuario
+(+ Application). Aquí el AccessToken, con su usuario y su aplicación ya
+cargados, se guarda bajo token:<sha256 del token> (el mismo checksum que
+usa django-oauth-toolkit) durante TOKENS_CACHE_TTL segundos como mucho y
+nunca más allá de su `expires`.
+
+Si la caché por defecto es la de memoria del proceso (locmem), invalidar
+solo llega al worker que atiende el logout: los demás seguirían aceptando
+el token hasta que caduque su copia. Por eso con locmem se guarda solo
+TOKENS_CACHE_TTL_LOCAL segundos; con varios workers, CACHE_URL debe
+apuntar a una caché compartida (redis://...).
+
+Se invalida al momento (y otra vez al confirmar la transacción):
+- al guardar o borrar el AccessToken (logout, revocar, purgar...);
+- al guardar o borrar su usuario, para no servir un Usuario antiguo.
+Los contadores del usuario (total_votos_recibidos...) se suben con UPDATE
+sin pasar por save(), así que request.user puede llevarlos algo atrasados:
+quien los necesite al día debe leerlos de la base de datos.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from . import metricas
+
+metricas.registrar('tokens', 'aciertos', 'fallos', 'rechazados')
+
+
+def checksum(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def _clave(token_checksum):
+    return f"token:{token_checksum}"
+
+
+def _ttl():
+    if isinstance(caches['default'], LocMemCache):
+        return settings.TOKENS_CACHE_TTL_LOCAL
+    return settings.TOKENS_CACHE_TTL
+
+
+def resolver_token(token):
+    """
+    El AccessToken (con .user y .application) si existe y no ha caducado;
+    None si no. Normalmente sin ir a la base de datos.
+    """
+    if not token:
+        return None
+    token_checksum = checksum(token)
+    clave = _clave(token_checksum)
+    access_token = cache.get(clave)
+    if access_token is not None and access_token.expires > timezone.now():
+        metricas.incrementar('tokens', 'aciertos')
+        return access_token
+
+    access_token = (
+        AccessToken.objects
+        .select_related('user', 'application')
+        .filter(token_checksum=token_checksum)
+        .first()
+    )
+    if access_token is None or access_token.is_expired():
+        metricas.incrementar('tokens', 'rechazados')
+        return None
+    metricas.incrementar('tokens', 'fallos')
+    restante = (access_token.expires - timezone.now()).total_seconds()
+    cache.set(clave, access_token, min(_ttl(), int(restante)))
+    return access_token
+
+
+def olvidar_tokens(checksums):
+    """Quita de la caché los tokens con esos checksums (sin esperar a la transacción)."""
+    claves = [_clave(c) for c in checksums if c]
+    if claves:
+        cache.delete_many(claves)
+
+
+def invalidar_token(token_checksum):
+    # Ya y otra vez al confirmar, por si alguien lo vuelve a cachear entre medias
+    olvidar_tokens([token_checksum])
+    transaction.on_commit(lambda: olvidar_tokens([token_checksum]))
+
+
+def invalidar_tokens_usuario(usuario_id):
+    checksums = list(AccessToken.objects.filter(user_id=usuario_id).values_list('token_checksum', flat=True))
+    olvidar_tokens(checksums)
+    transaction.on_commit(lambda: olvidar_tokens(checksums))
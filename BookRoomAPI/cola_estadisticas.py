@@ -0,0 +1,144 @@
+"""
+Cola de recálculo de estadísticas de relatos.
+
+Las vistas ya mantienen Estadistica con deltas atómicos; además encolan el
+relato para un recálculo completo (actualizar_estadisticas) que deja los
+contadores exactos. La cola agrupa las peticiones: un relato pendiente no
+se vuelve a encolar y se recalcula como mucho una vez cada
+ESTADISTICAS_RECALCULO_SEGUNDOS, reciba 1 o 500 votos en ese intervalo.
+
+Dos brokers, sin servicios externos (ESTADISTICAS_BROKER):
+- 'local': diccionario en memoria + un hilo trabajador dentro del proceso.
+- 'db': tabla RecalculoEstadistica, procesada por el comando
+  `python manage.py procesar_recalculos` (sirve con varios procesos).
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Relato, RecalculoEstadistica
+from .utils import actualizar_estadisticas
+
+logger = logging.getLogger(__name__)
+
+
+def recalcular_relato(relato_id):
+    relato = Relato.objects.filter(pk=relato_id).first()
+    if relato is not None:
+        actualizar_estadisticas(relato)
+
+
+class ColaLocal:
+    """Broker en memoria del proceso con un hilo trabajador propio."""
+
+    def __init__(self, segundos, iniciar_worker=True):
+        self.segundos = segundos
+        self.iniciar_worker = iniciar_worker
+        self._pendientes = {}  # relato_id -> instante (monotonic) en que toca recalcular
+        self._condicion = threading.Condition()
+        self._hilo = None
+
+    def encolar(self, relato_id):
+        with self._condicion:
+            if relato_id in self._pendientes:
+                return
+            self._pendientes[relato_id] = time.monotonic() + self.segundos
+            self._condicion.notify()
+            if self.iniciar_worker and (self._hilo is None or not self._hilo.is_alive()):
+                self._hilo = threading.Thread(target=self._bucle, name='recalculo-estadisticas', daemon=True)
+                self._hilo.start()
+
+    def vencidos(self, ahora=None):
+        # Saca de la cola los relatos a los que ya les toca
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._condicion:
+            ids = [relato_id for relato_id, cuando in self._pendientes.items() if cuando <= ahora]
+            for relato_id in ids:
+                del self._pendientes[relato_id]
+        return ids
+
+    def procesar_pendientes(self, ahora=None):
+        ids = self.vencidos(ahora)
+        for relato_id in ids:
+            try:
+                recalcular_relato(relato_id)
+            except Exception:
+                logger.exception("Error recalculando estadísticas del relato %s", relato_id)
+        return len(ids)
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                if self._pendientes:
+                    espera = min(self._pendientes.values()) - time.monotonic()
+                    if espera > 0:
+                        self._condicion.wait(espera)
+                else:
+                    self._condicion.wait()
+            close_old_connections()
+            self.procesar_pendientes()
+            close_old_connections()
+
+
+class ColaBD:
+    """Broker sobre la tabla RecalculoEstadistica (una fila por relato pendiente)."""
+
+    def __init__(self, segundos):
+        self.segundos = segundos
+
+    def encolar(self, relato_id):
+        # Un solo INSERT; si el relato ya está pendiente no hace nada
+        RecalculoEstadistica.objects.bulk_create(
+            [RecalculoEstadistica(
+                relato_id=relato_id,
+                programado_para=timezone.now() + timedelta(seconds=self.segundos),
+            )],
+            ignore_conflicts=True,
+        )
+
+    def procesar_pendientes(self, ahora=None, limite=500):
+        vencidos = list(
+            RecalculoEstadistica.objects
+            .filter(programado_para__lte=ahora or timezone.now())
+            .order_by('programado_para')
+            .values_list('relato_id', flat=True)[:limite]
+        )
+        procesados = 0
+        for relato_id in vencidos:
+            # Borrar la fila es "reclamarla": si hay dos trabajadores solo uno la procesa
+            if not RecalculoEstadistica.objects.filter(relato_id=relato_id).delete()[0]:
+                continue
+            try:
+                recalcular_relato(relato_id)
+            except Exception:
+                logger.exception("Error recalculando estadísticas del relato %s", relato_id)
+            procesados += 1
+        return procesados
+
+
+_colas = {}
+_lock = threading.Lock()
+
+
+def obtener_cola():
+    nombre = settings.ESTADISTICAS_BROKER
+    with _lock:
+        if nombre not in _colas:
+            segundos = settings.ESTADISTICAS_RECALCULO_SEGUNDOS
+            if nombre == 'local':
+                _colas[nombre] = ColaLocal(segundos)
+            elif nombre == 'db':
+                _colas[nombre] = ColaBD(segundos)
+            else:
+                raise ValueError(f"ESTADISTICAS_BROKER desconocido: {nombre}")
+        return _colas[nombre]
+
+
+def encolar_recalculo(relato_id):
+    """Pide un recálculo de las estadísticas del relato cuando termine la transacción."""
+    transaction.on_commit(lambda: obtener_cola().encolar(relato_id))
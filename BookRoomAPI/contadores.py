@@ -0,0 +1,81 @@
+"""
+Contadores desnormalizados de Usuario (total_relatos_publicados,
+total_votos_recibidos, total_palabras_escritas, total_tiempo_escritura).
+
+Todas las subidas pasan por aquí y se aplican con un único
+UPDATE ... WHERE id IN (...), así el número de escrituras no depende de
+cuántos usuarios (p. ej. autores de un relato) haya. Si el contador tiene
+ranking (rankings.CAMPO_USUARIO) se suman también sus puntos.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import ParticipacionRelato, Usuario
+from .rankings import CAMPO_USUARIO, sumar_puntos
+
+CONTADORES = (
+    'total_relatos_publicados',
+    'total_votos_recibidos',
+    'total_palabras_escritas',
+    'total_tiempo_escritura',
+)
+
+# Métrica del ranking de cada contador (los que no tienen ranking no salen)
+METRICA_CONTADOR = {campo: metrica for metrica, campo in CAMPO_USUARIO.items()}
+
+
+def _comprobar(campos):
+    desconocidos = set(campos) - set(CONTADORES)
+    if desconocidos:
+        raise ValueError(f"Contador de usuario desconocido: {', '.join(sorted(desconocidos))}")
+
+
+def incrementar_contadores(usuario_ids, **incrementos):
+    """
+    Suma la misma cantidad a todos los usuarios, p. ej.
+    incrementar_contadores([1, 2], total_votos_recibidos=1).
+    """
+    _comprobar(incrementos)
+    usuario_ids = set(usuario_ids)
+    incrementos = {campo: n for campo, n in incrementos.items() if n}
+    if not usuario_ids or not incrementos:
+        return
+    with transaction.atomic():
+        Usuario.objects.filter(pk__in=usuario_ids).update(
+            **{campo: F(campo) + n for campo, n in incrementos.items()}
+        )
+        for campo, n in incrementos.items():
+            if campo in METRICA_CONTADOR:
+                sumar_puntos(METRICA_CONTADOR[campo], usuario_ids, n)
+
+
+def incrementar_contador_por_usuario(campo, cantidades):
+    """Suma a cada usuario su cantidad: {usuario_id: n}, en un solo UPDATE con CASE."""
+    _comprobar([campo])
+    cantidades = {usuario_id: n for usuario_id, n in cantidades.items() if n}
+    if not cantidades:
+        return
+    with transaction.atomic():
+        Usuario.objects.filter(pk__in=cantidades).update(**{campo: F(campo) + Case(
+            *[When(pk=usuario_id, then=Value(n)) for usuario_id, n in cantidades.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )})
+        if campo in METRICA_CONTADOR:
+            # Los puntos van por cantidad: un sumar_puntos por cada valor distinto
+            por_cantidad = defaultdict(list)
+            for usuario_id, n in cantidades.items():
+                por_cantidad[n].append(usuario_id)
+            for n, usuario_ids in por_cantidad.items():
+                sumar_puntos(METRICA_CONTADOR[campo], usuario_ids, n)
+
+
+def incrementar_contadores_autores(relato_id, **incrementos):
+    """Sube los contadores de todos los autores de un relato. Devuelve sus ids."""
+    autores = list(
+        ParticipacionRelato.objects.filter(relato_id=relato_id).values_list('usuario_id', flat=True)
+    )
+    incrementar_contadores(autores, **incrementos)
+    return autores
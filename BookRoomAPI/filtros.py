@@ -1,6 +1,7 @@
 import django_filters
 from django_filters import rest_framework as filters
-from .models import Relato
+from .models import Relato, TerminoRelato
+from .busqueda import filtrar_por_campo
 
 class RelatoFilter(filters.FilterSet):
     # Búsqueda específica por título o descripción (co-existentes al SearchFilter)
@@ -42,4 +43,21 @@ class RelatoFilter(filters.FilterSet):
             'fecha_desde',
             'fecha_hasta',
             'autor',
-        ]
\ No newline at end of file
+        ]
+
+class RelatoPublicadoFilter(RelatoFilter):
+    """
+    Igual que RelatoFilter, pero la búsqueda por título o descripción usa el
+    índice de texto completo (solo cubre relatos publicados) en vez de LIKE '%x%'.
+    """
+    titulo__icontains      = filters.CharFilter(method='filtrar_titulo')
+    descripcion__icontains = filters.CharFilter(method='filtrar_descripcion')
+
+    def filtrar_titulo(self, queryset, name, value):
+        return filtrar_por_campo(queryset, value, TerminoRelato.TITULO, self.data.get('idioma'))
+
+    def filtrar_descripcion(self, queryset, name, value):
+        return filtrar_por_campo(queryset, value, TerminoRelato.DESCRIPCION, self.data.get('idioma'))
+
+    class Meta(RelatoFilter.Meta):
+        pass
@@ -0,0 +1,191 @@
+"""
+Índice de usernames en memoria para el autocompletado.
+
+Cada proceso guarda dos estructuras alineadas, ordenadas por nombre:
+- claves: lista de "username_normalizado\\0username";
+- ids: array('q') con el id del usuario de cada clave;
+y un dict id -> clave para quitar un usuario con bisect en vez de recorrer ids.
+Un prefijo es un rango contiguo que se encuentra con bisect, así que
+autocompletar no hace ninguna query.
+
+Se carga al arrancar el worker (asgi.py / wsgi.py, en un hilo) y se
+mantiene así:
+- en el propio proceso, las señales de Usuario lo actualizan al momento;
+- de los demás procesos, cada USUARIOS_INDICE_REFRESCO_SEGUNDOS se cargan
+  los usuarios nuevos y, si alguien ha renombrado o borrado un usuario
+  (versión en la caché compartida), se reconstruye entero en segundo plano.
+  Los nuevos se leen desde el último id visto en la base de datos (no en las
+  señales locales) menos USUARIOS_INDICE_SOLAPE_IDS, para no perder altas que
+  se confirman en otro orden que el de sus ids.
+Memoria medida con `python manage.py medir_indice_usuarios`.
+"""
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .busqueda_usuarios import normalizar
+from .models import Usuario
+
+logger = logging.getLogger(__name__)
+
+SEPARADOR = '\0'
+# Mayor que cualquier carácter de un username: "prefijo" + FIN acota el rango
+FIN = '\U0010ffff'
+CLAVE_VERSION = 'indice_usuarios:version'
+
+
+def _clave(username):
+    return f"{normalizar(username)}{SEPARADOR}{username}"
+
+
+class IndiceUsuarios:
+
+    def __init__(self, usuarios=()):
+        """`usuarios` es un iterable de (id, username)."""
+        pares = sorted((_clave(username), pk) for pk, username in usuarios)
+        self.claves = [clave for clave, _ in pares]
+        self.ids = array('q', (pk for _, pk in pares))
+        self.por_id = {pk: clave for clave, pk in pares}
+        # Último id leído de la base de datos; agregar() no lo mueve
+        self.ultimo_id = max(self.ids, default=0)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.claves)
+
+    def agregar(self, pk, username):
+        """Alta o cambio de username; con el mismo username no hace nada."""
+        clave = _clave(username)
+        with self._lock:
+            if self.por_id.get(pk) == clave:
+                return
+            self._quitar(pk)
+            posicion = bisect_left(self.claves, clave)
+            self.claves.insert(posicion, clave)
+            self.ids.insert(posicion, pk)
+            self.por_id[pk] = clave
+
+    def quitar(self, pk):
+        with self._lock:
+            self._quitar(pk)
+
+    def _quitar(self, pk):
+        clave = self.por_id.pop(pk, None)
+        if clave is None:
+            return
+        # La clave lleva el username completo: es única
+        posicion = bisect_left(self.claves, clave)
+        del self.claves[posicion]
+        del self.ids[posicion]
+
+    def buscar(self, prefijo, limite=10, excluir=()):
+        """[(id, username)] cuyo nombre normalizado empieza por `prefijo`, en orden alfabético."""
+        prefijo = normalizar(prefijo)
+        if not prefijo:
+            return []
+        resultados = []
+        with self._lock:
+            inicio = bisect_left(self.claves, prefijo)
+            fin = bisect_left(self.claves, prefijo + FIN, lo=inicio)
+            for posicion in range(inicio, fin):
+                pk = self.ids[posicion]
+                if pk in excluir:
+                    continue
+                resultados.append((pk, self.claves[posicion].split(SEPARADOR, 1)[1]))
+                if len(resultados) == limite:
+                    break
+        return resultados
+
+
+# ——— Índice del proceso ——————————————————————————————————————————————
+
+_indice = None
+_version = None
+_revisado = 0.0
+_cargando = threading.Lock()
+
+
+def _version_compartida():
+    return cache.get_or_set(CLAVE_VERSION, int(time.time() * 1000), timeout=None)
+
+
+def _cargar():
+    global _indice, _version, _revisado
+    with _cargando:
+        version = _version_compartida()
+        nuevo = IndiceUsuarios(Usuario.objects.values_list('pk', 'username').iterator(chunk_size=10000))
+        _indice, _version, _revisado = nuevo, version, time.monotonic()
+        logger.info("Índice de usuarios cargado: %s usuarios", len(nuevo))
+
+
+def _cargar_en_segundo_plano():
+    def cargar():
+        try:
+            _cargar()
+        except Exception:
+            logger.exception("No se pudo cargar el índice de usuarios")
+        finally:
+            close_old_connections()
+
+    if not _cargando.locked():
+        threading.Thread(target=cargar, name='indice-usuarios', daemon=True).start()
+
+
+def precargar_indice():
+    """Arranque del worker: carga el índice sin bloquear el arranque."""
+    if settings.USUARIOS_INDICE_MEMORIA:
+        _cargar_en_segundo_plano()
+
+
+def obtener_indice():
+    """El índice del proceso, o None si todavía se está cargando."""
+    global _revisado
+    if not settings.USUARIOS_INDICE_MEMORIA:
+        return None
+    if _indice is None:
+        _cargar_en_segundo_plano()
+        return None
+    if time.monotonic() - _revisado > settings.USUARIOS_INDICE_REFRESCO_SEGUNDOS:
+        _revisado = time.monotonic()
+        if _version_compartida() != _version:
+            _cargar_en_segundo_plano()
+        else:
+            # Usuarios dados de alta en otros procesos (los del solape ya estarán casi todos)
+            desde = _indice.ultimo_id - settings.USUARIOS_INDICE_SOLAPE_IDS
+            for pk, username in Usuario.objects.filter(pk__gt=desde).values_list('pk', 'username'):
+                _indice.agregar(pk, username)
+                _indice.ultimo_id = max(_indice.ultimo_id, pk)
+    return _indice
+
+
+def usuario_guardado(pk, username, creado):
+    """Alta o cambio de username (señal de Usuario, ya confirmada la transacción)."""
+    if not creado:
+        # Los demás procesos se enteran por la versión y se reconstruyen
+        cambiar_version()
+    if _indice is not None:
+        _indice.agregar(pk, username)
+
+
+def usuario_borrado(usuario_id):
+    if _indice is not None:
+        _indice.quitar(usuario_id)
+    cambiar_version()
+
+
+def cambiar_version():
+    global _version
+    try:
+        nueva = cache.incr(CLAVE_VERSION)
+    except ValueError:
+        nueva = int(time.time() * 1000)
+        cache.set(CLAVE_VERSION, nueva, timeout=None)
+    if _indice is not None:
+        # Nuestro índice ya tiene el cambio: no hace falta reconstruirlo
+        _version = nueva
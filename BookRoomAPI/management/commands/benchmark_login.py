@@ -0,0 +1,81 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from oauth2_provider.models import AccessToken
+from rest_framework.test import APIRequestFactory
+
+from BookRoomAPI.models import Usuario
+from BookRoomAPI.tokens import aplicacion_oauth
+from BookRoomAPI.views import login_usuario
+
+HASHER_RAPIDO = 'django.contrib.auth.hashers.MD5PasswordHasher'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia (p50/p99) de login_usuario. Separa el coste del hasher de "
+        "contraseñas repitiendo la prueba con un hasher trivial. Crea un usuario temporal "
+        "y lo borra al terminar (necesita la Application 'BookRoomAPI')."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+
+    def handle(self, *args, **options):
+        aplicacion_oauth()  # Http404 aquí mejor que en mitad de la medida
+        username = f"bench_login_{int(time.time())}"
+        password = 'Clave-benchmark-1234'
+        usuario = Usuario.objects.create_user(username=username, password=password)
+        # Cientos de logins seguidos del mismo usuario e IP: sin límites, o se mediría el 429
+        sin_limites = {ambito: (10 ** 9, 10 ** 9) for ambito in settings.THROTTLE_LIMITES}
+        try:
+            with override_settings(THROTTLE_LIMITES=sin_limites):
+                caches[settings.THROTTLE_CACHE].clear()
+                real = self.medir(username, password, options['logins'])
+                hasher = self.percentiles([self.cronometrar(lambda: usuario.check_password(password))
+                                           for _ in range(min(options['logins'], 50))])
+                with override_settings(PASSWORD_HASHERS=[HASHER_RAPIDO]):
+                    Usuario.objects.filter(pk=usuario.pk).update(password=make_password(password))
+                    sin_hasher = self.medir(username, password, options['logins'])
+        finally:
+            caches[settings.THROTTLE_CACHE].clear()
+            AccessToken.objects.filter(user__username=username).delete()
+            Usuario.objects.filter(username=username).delete()
+
+        self.stdout.write(f"Logins por prueba: {options['logins']}")
+        self.stdout.write(f"Login completo:    p50 {real['p50']:7.2f} ms   p99 {real['p99']:7.2f} ms")
+        self.stdout.write(f"Solo el hasher:    p50 {hasher['p50']:7.2f} ms   p99 {hasher['p99']:7.2f} ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"Login sin hasher:  p50 {sin_hasher['p50']:7.2f} ms   p99 {sin_hasher['p99']:7.2f} ms   "
+            f"({sin_hasher['queries']} queries)"
+        ))
+
+    def medir(self, username, password, logins):
+        factory = APIRequestFactory()
+        tiempos = []
+        with CaptureQueriesContext(connection) as consultas:
+            for _ in range(logins):
+                peticion = factory.post('/api/login/', {'username': username, 'password': password}, format='json')
+                tiempos.append(self.cronometrar(lambda: self.comprobar(login_usuario(peticion))))
+        resultado = self.percentiles(tiempos)
+        resultado['queries'] = round(len(consultas.captured_queries) / logins, 1)
+        return resultado
+
+    def comprobar(self, respuesta):
+        assert respuesta.status_code == 200, respuesta.data
+
+    def cronometrar(self, funcion):
+        inicio = time.perf_counter()
+        funcion()
+        return (time.perf_counter() - inicio) * 1000
+
+    def percentiles(self, tiempos):
+        cortes = statistics.quantiles(tiempos, n=100)
+        return {'p50': statistics.median(tiempos), 'p99': cortes[98]}
@@ -0,0 +1,67 @@
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from BookRoomAPI.buffer_votos import cerrar_buffer
+from BookRoomAPI.models import Estadistica, ParticipacionRelato, Relato, Usuario, Voto
+from BookRoomAPI.views import api_votar_relato
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el rendimiento de api_votar_relato guardando cada voto en la "
+        "petición y en modo write-behind. Crea datos temporales y los borra al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votos', type=int, default=2000)
+        parser.add_argument('--votantes', type=int, default=300)
+        parser.add_argument('--autores', type=int, default=3)
+
+    def handle(self, *args, **options):
+        prefijo = f"bench{int(time.time())}_"
+        relato = Relato.objects.create(titulo="Benchmark votos", descripcion="Temporal", estado='PUBLICADO')
+        Estadistica.objects.create(relato=relato)
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(username=f"{prefijo}{i}") for i in range(options['votantes'] + options['autores'])
+        ])
+        usuarios = list(Usuario.objects.filter(username__startswith=prefijo).order_by('id'))
+        votantes, autores = usuarios[:options['votantes']], usuarios[options['votantes']:]
+        ParticipacionRelato.objects.bulk_create([
+            ParticipacionRelato(usuario=autor, relato=relato, orden=i + 1) for i, autor in enumerate(autores)
+        ])
+
+        # Misma secuencia de votos (con revotos) para los dos modos
+        azar = random.Random(42)
+        secuencia = [(azar.choice(votantes), azar.randint(1, 5)) for _ in range(options['votos'])]
+        try:
+            directo = self.medir(relato, secuencia, write_behind=False)
+            Voto.objects.filter(relato=relato).delete()
+            with tempfile.TemporaryDirectory() as directorio:
+                with override_settings(VOTOS_BUFFER_DIR=directorio):
+                    buffer = self.medir(relato, secuencia, write_behind=True)
+        finally:
+            relato.delete()
+            Usuario.objects.filter(username__startswith=prefijo).delete()
+
+        self.stdout.write(f"Votos enviados: {len(secuencia)}")
+        self.stdout.write(f"Directo:       {directo:8.0f} votos/s")
+        self.stdout.write(f"Write-behind:  {buffer:8.0f} votos/s (incluye el volcado final)")
+        self.stdout.write(self.style.SUCCESS(f"Mejora: x{buffer / directo:.1f}"))
+
+    def medir(self, relato, secuencia, write_behind):
+        factory = APIRequestFactory()
+        with override_settings(VOTOS_WRITE_BEHIND=write_behind):
+            inicio = time.perf_counter()
+            for usuario, puntuacion in secuencia:
+                peticion = factory.post(f'/api/relatos/{relato.id}/votar/', {'puntuacion': puntuacion}, format='json')
+                force_authenticate(peticion, user=usuario)
+                respuesta = api_votar_relato(peticion, relato_id=relato.id)
+                assert respuesta.status_code in (200, 201, 202), respuesta.data
+            if write_behind:
+                cerrar_buffer()
+            return len(secuencia) / (time.perf_counter() - inicio)
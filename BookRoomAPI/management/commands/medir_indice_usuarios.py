@@ -0,0 +1,45 @@
+import random
+import string
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from BookRoomAPI.indice_usuarios import IndiceUsuarios
+
+
+class Command(BaseCommand):
+    help = "Mide la memoria y el tiempo de consulta del índice de usernames con usuarios sintéticos (sin base de datos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=1_000_000)
+        parser.add_argument('--consultas', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        n = options['usuarios']
+        azar = random.Random(1)
+        letras = string.ascii_lowercase + string.digits + '_'
+        # 1) Usernames sintéticos de 6 a 16 caracteres, algunos con mayúsculas y tildes
+        usernames = [
+            ''.join(azar.choice(letras) for _ in range(azar.randint(6, 16))) for _ in range(n)
+        ]
+        for i in range(0, n, 10):
+            usernames[i] = usernames[i].capitalize().replace('a', 'á', 1)
+
+        # 2) Memoria del índice ya construido (los usernames de entrada no cuentan)
+        tracemalloc.start()
+        indice = IndiceUsuarios(enumerate(usernames, start=1))
+        actual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # 3) Consultas de 1 a 3 letras, como las del autocompletado
+        prefijos = [usernames[azar.randrange(n)][:azar.randint(1, 3)] for _ in range(options['consultas'])]
+        inicio = time.perf_counter()
+        for prefijo in prefijos:
+            indice.buscar(prefijo, 10)
+        por_consulta = (time.perf_counter() - inicio) / len(prefijos)
+
+        self.stdout.write(f"Usuarios:          {len(indice)}")
+        self.stdout.write(f"Memoria:           {actual / 2**20:.1f} MB ({actual / n:.0f} bytes/usuario)")
+        self.stdout.write(f"Pico al construir: {pico / 2**20:.1f} MB")
+        self.stdout.write(self.style.SUCCESS(f"Consulta media:    {por_consulta * 1e6:.1f} µs"))
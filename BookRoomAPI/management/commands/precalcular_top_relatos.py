@@ -0,0 +1,24 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from BookRoomAPI.top_relatos import precalcular_top_relatos
+
+
+class Command(BaseCommand):
+    help = (
+        "Guarda en caché el top de relatos general, por género y por idioma. "
+        "Con --continuo lo repite antes de que caduque la caché."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true')
+
+    def handle(self, *args, **options):
+        while True:
+            total = precalcular_top_relatos()
+            if not options['continuo']:
+                self.stdout.write(self.style.SUCCESS(f"Tops precalculados: {total}"))
+                return
+            time.sleep(max(settings.TOP_RELATOS_CACHE_TTL - 5, 1))
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from BookRoomAPI.cola_estadisticas import ColaBD
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de recálculo de estadísticas guardada en la base de datos (broker 'db')."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true',
+                            help="Procesa lo que haya vencido y termina (para cron).")
+        parser.add_argument('--intervalo', type=float, default=1.0,
+                            help="Segundos entre comprobaciones en modo continuo.")
+
+    def handle(self, *args, **options):
+        cola = ColaBD(settings.ESTADISTICAS_RECALCULO_SEGUNDOS)
+        if options['una_vez']:
+            total = cola.procesar_pendientes()
+            self.stdout.write(self.style.SUCCESS(f"Relatos recalculados: {total}"))
+            return
+
+        self.stdout.write("Procesando recálculos de estadísticas (Ctrl+C para salir)...")
+        try:
+            while True:
+                if not cola.procesar_pendientes():
+                    time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            pass
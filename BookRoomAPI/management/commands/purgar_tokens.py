@@ -0,0 +1,36 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from BookRoomAPI.tokens import purgar_tokens_caducados, registrar_metrica
+
+
+class Command(BaseCommand):
+    help = "Borra por lotes los access tokens caducados y guarda el tamaño de la tabla (para cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=None,
+                            help="Tokens por lote (por defecto TOKENS_PURGA_LOTE).")
+        parser.add_argument('--pausa', type=float, default=None,
+                            help="Segundos de pausa entre lotes (por defecto TOKENS_PURGA_PAUSA).")
+        parser.add_argument('--margen-horas', type=float, default=0,
+                            help="Solo los caducados hace más de estas horas.")
+        parser.add_argument('--solo-metrica', action='store_true',
+                            help="No borra nada, solo guarda el tamaño actual de la tabla.")
+
+    def handle(self, *args, **options):
+        purgados, segundos = 0, 0.0
+        if not options['solo_metrica']:
+            inicio = time.perf_counter()
+            purgados = purgar_tokens_caducados(
+                lote=options['lote'],
+                pausa=options['pausa'],
+                antes_de=timezone.now() - timedelta(hours=options['margen_horas']),
+            )
+            segundos = time.perf_counter() - inicio
+        metrica = registrar_metrica(purgados, segundos)
+        self.stdout.write(self.style.SUCCESS(
+            f"Tokens purgados: {purgados} en {segundos:.1f}s. En la tabla: {metrica.total} ({metrica.activos} activos)"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from BookRoomAPI.models import Comentario
+from BookRoomAPI.votos_comentarios import recalcular_puntuaciones
+
+
+class Command(BaseCommand):
+    help = (
+        "Recuenta los votos de los comentarios y recalcula sus puntuaciones best y hot "
+        "(p. ej. tras cambiar COMENTARIOS_WILSON_Z o COMENTARIOS_HOT_VIDA_MEDIA_HORAS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--relato', type=int, help="Solo los comentarios de este relato")
+
+    def handle(self, *args, **options):
+        comentarios = Comentario.objects.all()
+        if options['relato']:
+            comentarios = comentarios.filter(relato_id=options['relato'])
+        total = recalcular_puntuaciones(comentarios)
+        self.stdout.write(self.style.SUCCESS(f"Puntuaciones recalculadas: {total} comentarios"))
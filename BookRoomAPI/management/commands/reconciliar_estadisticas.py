@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from BookRoomAPI.models import Relato
+from BookRoomAPI.utils import actualizar_estadisticas
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula desde cero las estadísticas de los relatos para corregir "
+        "cualquier desvío de los contadores incrementales."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--relato', type=int, help="Solo el relato con este id.")
+
+    def handle(self, *args, **options):
+        relatos = Relato.objects.order_by('id')
+        if options['relato']:
+            relatos = relatos.filter(id=options['relato'])
+        total = 0
+        for relato in relatos.iterator(chunk_size=200):
+            actualizar_estadisticas(relato)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Estadísticas reconciliadas: {total}"))
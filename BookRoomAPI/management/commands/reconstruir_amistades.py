@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from BookRoomAPI.amistades import reconstruir_amistades
+
+
+class Command(BaseCommand):
+    help = (
+        "Rehace la tabla Amistad desde las solicitudes ACEPTADA (por si se han "
+        "cambiado solicitudes sin pasar por las señales, p. ej. con update())."
+    )
+
+    def handle(self, *args, **options):
+        total = reconstruir_amistades()
+        self.stdout.write(self.style.SUCCESS(f"Amistades reconstruidas: {total}"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from BookRoomAPI.rankings import purgar_periodos_antiguos, reconstruir_totales
+
+
+class Command(BaseCommand):
+    help = (
+        "Rehace el ranking histórico de usuarios desde sus contadores y borra "
+        "las semanas y meses ya cerrados. La caché se pone al día en RANKING_CACHE_TTL segundos."
+    )
+
+    def handle(self, *args, **options):
+        reconstruir_totales()
+        borradas = purgar_periodos_antiguos()
+        self.stdout.write(self.style.SUCCESS(f"Ranking histórico reconstruido. Filas antiguas borradas: {borradas}"))
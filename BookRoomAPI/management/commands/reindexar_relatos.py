@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from BookRoomAPI.busqueda import indexar_relato
+from BookRoomAPI.models import Relato, TerminoRelato
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de todos los relatos publicados."
+
+    def handle(self, *args, **options):
+        TerminoRelato.objects.exclude(relato__estado='PUBLICADO').delete()
+        relatos = Relato.objects.filter(estado='PUBLICADO').order_by('id')
+        total = 0
+        for relato in relatos.iterator(chunk_size=200):
+            indexar_relato(relato)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Relatos indexados: {total}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from BookRoomAPI.busqueda_usuarios import reindexar_usuarios
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de usuarios (username normalizado y trigramas)."
+
+    def handle(self, *args, **options):
+        total = reindexar_usuarios()
+        self.stdout.write(self.style.SUCCESS(f"Usuarios indexados: {total}"))
@@ -0,0 +1,60 @@
+"""
+Contadores de funcionamiento (aciertos de caché, rechazos...) para el panel
+de administración.
+
+Cada contador vive en la caché compartida como metricas:<grupo>.<nombre>,
+así suman los de todos los procesos y apuntar un evento es un solo incr.
+No son persistentes: si se vacía la caché vuelven a cero (sirven para
+vigilar, no para contabilidad).
+
+Cada módulo registra sus contadores con `registrar` y `resumen()` los
+devuelve todos agrupados; los grupos con `aciertos` y `fallos` llevan
+además su tasa de aciertos.
+"""
+from django.core.cache import cache
+
+PREFIJO = 'metricas:'
+
+# {grupo: (nombres...)}
+REGISTRADAS = {}
+
+
+def registrar(grupo, *nombres):
+    REGISTRADAS[grupo] = tuple(dict.fromkeys(REGISTRADAS.get(grupo, ()) + nombres))
+
+
+def incrementar(grupo, nombre, n=1):
+    clave = f"{PREFIJO}{grupo}.{nombre}"
+    try:
+        cache.incr(clave, n)
+    except ValueError:
+        # Primera vez (o se ha perdido): si otro proceso la crea a la vez, sumamos sobre la suya
+        if not cache.add(clave, n, timeout=None):
+            cache.incr(clave, n)
+
+
+def tasa_aciertos(aciertos, fallos):
+    total = aciertos + fallos
+    return round(aciertos / total, 4) if total else None
+
+
+def resumen():
+    """{grupo: {nombre: valor, ..., 'tasa_aciertos': x}} con una sola lectura de caché."""
+    claves = {
+        (grupo, nombre): f"{PREFIJO}{grupo}.{nombre}"
+        for grupo, nombres in REGISTRADAS.items() for nombre in nombres
+    }
+    valores = cache.get_many(claves.values())
+    datos = {grupo: {} for grupo in REGISTRADAS}
+    for (grupo, nombre), clave in claves.items():
+        datos[grupo][nombre] = valores.get(clave, 0)
+    for contadores in datos.values():
+        if 'aciertos' in contadores and 'fallos' in contadores:
+            contadores['tasa_aciertos'] = tasa_aciertos(contadores['aciertos'], contadores['fallos'])
+    return datos
+
+
+def reiniciar():
+    cache.delete_many([
+        f"{PREFIJO}{grupo}.{nombre}" for grupo, nombres in REGISTRADAS.items() for nombre in nombres
+    ])
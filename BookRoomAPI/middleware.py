@@ -1,9 +1,9 @@
 from urllib.parse import parse_qs
 from django.contrib.auth.models import AnonymousUser
-from oauth2_provider.models import AccessToken
-from django.utils import timezone
 from channels.db import database_sync_to_async
 
+from .cache_tokens import resolver_token
+
 class TokenAuthMiddleware:
     """
     Middleware Channels que extrae ?token=<access_token> de la URL
@@ -36,13 +36,8 @@ class TokenAuthMiddleware:
     @database_sync_to_async
     def get_user(self, token):
         """
-        Busca el AccessToken en la base de datos y devuelve el usuario
-        sólo si el token existe y no está expirado.
+        Devuelve el usuario del AccessToken sólo si el token existe y no
+        está expirado (caché compartida con la API, ver cache_tokens).
         """
-        try:
-            at = AccessToken.objects.select_related('user').get(token=token)
-            if at.expires > timezone.now():
-                return at.user
-        except AccessToken.DoesNotExist:
-            pass
-        return None
+        access_token = resolver_token(token)
+        return access_token.user if access_token else None
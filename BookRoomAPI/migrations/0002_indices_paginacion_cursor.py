@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comentario',
+            index=models.Index(fields=['relato', 'fecha', 'id'], name='comentario_relato_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comentario',
+            index=models.Index(fields=['fecha', 'id'], name='comentario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relato',
+            index=models.Index(fields=['estado', 'fecha_creacion', 'id'], name='relato_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relato',
+            index=models.Index(fields=['fecha_creacion', 'id'], name='relato_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voto',
+            index=models.Index(fields=['fecha', 'id'], name='voto_fecha_idx'),
+        ),
+    ]
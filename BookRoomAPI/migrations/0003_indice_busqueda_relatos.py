@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 02:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0002_indices_paginacion_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TerminoRelato',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termino', models.CharField(max_length=50)),
+                ('campo', models.CharField(choices=[('t', 'Título'), ('d', 'Descripción'), ('c', 'Contenido')], max_length=1)),
+                ('peso', models.FloatField()),
+                ('relato', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terminos', to='BookRoomAPI.relato')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['termino', 'campo', 'relato'], name='termino_relato_idx')],
+                'unique_together': {('relato', 'termino', 'campo')},
+            },
+        ),
+    ]
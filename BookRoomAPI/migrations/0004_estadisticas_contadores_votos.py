@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 02:30
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def rellenar_contadores_votos(apps, schema_editor):
+    Estadistica = apps.get_model('BookRoomAPI', 'Estadistica')
+    Voto = apps.get_model('BookRoomAPI', 'Voto')
+    totales = Voto.objects.values('relato').annotate(suma=Sum('puntuacion'), num=Count('id'))
+    for fila in totales.iterator():
+        Estadistica.objects.filter(relato_id=fila['relato']).update(
+            suma_votos=fila['suma'],
+            num_votos=fila['num'],
+            promedio_votos=round(fila['suma'] / fila['num'], 2),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0003_indice_busqueda_relatos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadistica',
+            name='num_votos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='estadistica',
+            name='suma_votos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(rellenar_contadores_votos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 02:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0004_estadisticas_contadores_votos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecalculoEstadistica',
+            fields=[
+                ('relato', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='BookRoomAPI.relato')),
+                ('programado_para', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 02:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from datetime import date
+
+
+def rellenar_ranking_total(apps, schema_editor):
+    # El histórico sale de los contadores de Usuario; semana y mes empiezan vacíos
+    Usuario = apps.get_model('BookRoomAPI', 'Usuario')
+    PuntuacionRanking = apps.get_model('BookRoomAPI', 'PuntuacionRanking')
+    campos = {
+        'relatos': 'total_relatos_publicados',
+        'votos': 'total_votos_recibidos',
+        'palabras': 'total_palabras_escritas',
+    }
+    for metrica, campo in campos.items():
+        filas = [
+            PuntuacionRanking(usuario_id=usuario_id, metrica=metrica, periodo='total',
+                              inicio_periodo=date(1970, 1, 1), puntos=puntos)
+            for usuario_id, puntos in Usuario.objects.filter(**{f'{campo}__gt': 0}).values_list('id', campo)
+        ]
+        PuntuacionRanking.objects.bulk_create(filas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0005_cola_recalculo_estadisticas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PuntuacionRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metrica', models.CharField(choices=[('relatos', 'Relatos publicados'), ('votos', 'Votos recibidos'), ('palabras', 'Palabras escritas')], max_length=10)),
+                ('periodo', models.CharField(choices=[('semana', 'Semanal'), ('mes', 'Mensual'), ('total', 'Histórico')], max_length=10)),
+                ('inicio_periodo', models.DateField()),
+                ('puntos', models.PositiveIntegerField(default=0)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='puntuaciones_ranking', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['metrica', 'periodo', 'inicio_periodo', '-puntos', 'usuario'], name='ranking_puntos_idx')],
+                'unique_together': {('metrica', 'periodo', 'inicio_periodo', 'usuario')},
+            },
+        ),
+        migrations.RunPython(rellenar_ranking_total, migrations.RunPython.noop),
+    ]
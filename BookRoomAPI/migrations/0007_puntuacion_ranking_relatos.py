@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 02:37
+
+from django.db import migrations, models
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.functions import Cast
+
+# Valores de TOP_RELATOS_VOTOS_PREVIOS / TOP_RELATOS_MEDIA_PREVIA de cuando se escribió
+# la migración: así no depende de la configuración actual al volver a aplicarla
+VOTOS_PREVIOS = 5
+MEDIA_PREVIA = 3.0
+
+
+def calcular_puntuacion_ranking(apps, schema_editor):
+    Estadistica = apps.get_model('BookRoomAPI', 'Estadistica')
+    Estadistica.objects.update(puntuacion_ranking=Case(
+        When(num_votos=0, then=Value(0.0)),
+        default=(Value(VOTOS_PREVIOS * MEDIA_PREVIA) + Cast('suma_votos', FloatField()))
+        / (Value(float(VOTOS_PREVIOS)) + Cast('num_votos', FloatField())),
+        output_field=FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0006_rankings_usuarios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadistica',
+            name='puntuacion_ranking',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='estadistica',
+            index=models.Index(fields=['-puntuacion_ranking', 'relato'], name='estadistica_ranking_idx'),
+        ),
+        migrations.RunPython(calcular_puntuacion_ranking, migrations.RunPython.noop),
+    ]
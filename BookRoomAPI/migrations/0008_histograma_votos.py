@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-18 02:43
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rellenar_histograma(apps, schema_editor):
+    Estadistica = apps.get_model('BookRoomAPI', 'Estadistica')
+    Voto = apps.get_model('BookRoomAPI', 'Voto')
+    histogramas = {}
+    filas = Voto.objects.values('relato', 'puntuacion').annotate(n=Count('id'))
+    for fila in filas.iterator():
+        histogramas.setdefault(fila['relato'], {})[f"votos_{fila['puntuacion']}"] = fila['n']
+    for relato_id, columnas in histogramas.items():
+        Estadistica.objects.filter(relato_id=relato_id).update(**columnas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0007_puntuacion_ranking_relatos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadistica',
+            name='votos_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='estadistica',
+            name='votos_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='estadistica',
+            name='votos_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='estadistica',
+            name='votos_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='estadistica',
+            name='votos_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(rellenar_histograma, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='estadistica',
+            name='num_votos',
+        ),
+        migrations.RemoveField(
+            model_name='estadistica',
+            name='suma_votos',
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2 on 2026-10-18 02:48
+
+import math
+from datetime import datetime, timezone as tz
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+# Copia de votos_comentarios.py y de los valores de settings de cuando se escribió
+# la migración: así no depende del código actual al volver a aplicarla
+VOTOARRIBA = 1
+VOTOABAJO = -1
+WILSON_Z = 1.96
+HOT_VIDA_MEDIA_HORAS = 24
+HOT_MINIMO = 0.05
+EPOCA = datetime(1970, 1, 1, tzinfo=tz.utc)
+
+
+def wilson(positivos, negativos):
+    n = positivos + negativos
+    if not n:
+        return 0.0
+    z = WILSON_Z
+    p = positivos / n
+    return (p + z * z / (2 * n) - z * math.sqrt((p * (1 - p) + z * z / (4 * n)) / n)) / (1 + z * z / n)
+
+
+def calcular_puntuaciones(apps, schema_editor):
+    Comentario = apps.get_model('BookRoomAPI', 'Comentario')
+    comentarios = Comentario.objects.annotate(
+        positivos=Count('votos_usuario', filter=Q(votos_usuario__valor=VOTOARRIBA)),
+        negativos=Count('votos_usuario', filter=Q(votos_usuario__valor=VOTOABAJO)),
+    ).only('id', 'fecha').order_by()
+    lote = []
+    for comentario in comentarios.iterator():
+        best = wilson(comentario.positivos, comentario.negativos)
+        horas = (comentario.fecha - EPOCA).total_seconds() / 3600
+        comentario.votos_positivos, comentario.votos_negativos = comentario.positivos, comentario.negativos
+        comentario.votos = comentario.positivos - comentario.negativos
+        comentario.puntuacion_best = best
+        comentario.puntuacion_hot = math.log2(max(best, HOT_MINIMO)) + horas / HOT_VIDA_MEDIA_HORAS
+        lote.append(comentario)
+    Comentario.objects.bulk_update(
+        lote, ['votos', 'votos_positivos', 'votos_negativos', 'puntuacion_best', 'puntuacion_hot'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0008_histograma_votos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comentario',
+            name='puntuacion_best',
+            field=models.FloatField(default=0, help_text='Límite inferior de Wilson de los votos'),
+        ),
+        migrations.AddField(
+            model_name='comentario',
+            name='puntuacion_hot',
+            field=models.FloatField(default=0, help_text='Wilson con decaimiento por antigüedad'),
+        ),
+        migrations.AddField(
+            model_name='comentario',
+            name='votos_negativos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comentario',
+            name='votos_positivos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(calcular_puntuaciones, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comentario',
+            index=models.Index(fields=['relato', '-puntuacion_best', '-id'], name='comentario_relato_best_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comentario',
+            index=models.Index(fields=['relato', '-puntuacion_hot', '-id'], name='comentario_relato_hot_idx'),
+        ),
+    ]
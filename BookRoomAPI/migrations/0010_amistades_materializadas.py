@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 02:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def rellenar_amistades(apps, schema_editor):
+    Amistad = apps.get_model('BookRoomAPI', 'Amistad')
+    PeticionAmistad = apps.get_model('BookRoomAPI', 'PeticionAmistad')
+    aceptadas = PeticionAmistad.objects.filter(estado='ACEPTADA').values_list('de_usuario_id', 'a_usuario_id')
+    Amistad.objects.bulk_create(
+        [Amistad(usuario_id=a, amigo_id=b) for de, para in aceptadas.iterator() for a, b in ((de, para), (para, de))],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0009_orden_comentarios_best_hot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Amistad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde', models.DateTimeField(default=django.utils.timezone.now)),
+                ('amigo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='amistades', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('usuario', 'amigo')},
+            },
+        ),
+        migrations.RunPython(rellenar_amistades, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-18 02:54
+
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copia de busqueda_usuarios.normalizar / trigramas de cuando se escribió la migración
+def normalizar(texto):
+    texto = (texto or '').strip().lower()
+    return ''.join(c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c))
+
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def indexar_usuarios(apps, schema_editor):
+    Usuario = apps.get_model('BookRoomAPI', 'Usuario')
+    TrigramaUsuario = apps.get_model('BookRoomAPI', 'TrigramaUsuario')
+    cambiados, filas = [], []
+    for pk, username in Usuario.objects.values_list('pk', 'username').iterator():
+        normalizado = normalizar(username)
+        cambiados.append(Usuario(pk=pk, username_normalizado=normalizado))
+        filas.extend(TrigramaUsuario(usuario_id=pk, trigrama=t) for t in trigramas(normalizado))
+    Usuario.objects.bulk_update(cambiados, ['username_normalizado'], batch_size=500)
+    TrigramaUsuario.objects.bulk_create(filas, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0010_amistades_materializadas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='username_normalizado',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=150),
+        ),
+        migrations.CreateModel(
+            name='TrigramaUsuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigrama', models.CharField(max_length=3)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigramas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigrama', 'usuario'], name='trigrama_usuario_idx')],
+                'unique_together': {('usuario', 'trigrama')},
+            },
+        ),
+        migrations.RunPython(indexar_usuarios, migrations.RunPython.noop),
+    ]
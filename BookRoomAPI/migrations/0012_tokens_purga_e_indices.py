@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 03:01
+
+from django.db import migrations, models
+
+# La tabla es de django-oauth-toolkit: los índices se crean aquí con el schema editor
+INDICES_ACCESS_TOKEN = [
+    # Login: token vigente de (user, application), el de expires más alto
+    models.Index(fields=['user', 'application', 'expires'], name='oauth2_at_user_app_exp_idx'),
+    # purgar_tokens: lotes de caducados por orden de expires
+    models.Index(fields=['expires'], name='oauth2_at_expires_idx'),
+]
+
+
+def crear_indices(apps, schema_editor):
+    AccessToken = apps.get_model('oauth2_provider', 'AccessToken')
+    for indice in INDICES_ACCESS_TOKEN:
+        schema_editor.add_index(AccessToken, indice)
+
+
+def borrar_indices(apps, schema_editor):
+    AccessToken = apps.get_model('oauth2_provider', 'AccessToken')
+    for indice in INDICES_ACCESS_TOKEN:
+        schema_editor.remove_index(AccessToken, indice)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0011_busqueda_usuarios'),
+        ('oauth2_provider', '0012_add_token_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricaTokens',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('total', models.PositiveIntegerField()),
+                ('activos', models.PositiveIntegerField()),
+                ('purgados', models.PositiveIntegerField(default=0)),
+                ('segundos_purga', models.FloatField(default=0)),
+            ],
+            options={
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0012_tokens_purga_e_indices'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='estadistica',
+            index=models.Index(fields=['promedio_votos', 'id'], name='estadistica_promedio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['fecha', 'id'], name='factura_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mensaje',
+            index=models.Index(fields=['fecha_envio', 'id'], name='mensaje_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participacionrelato',
+            index=models.Index(fields=['fecha_ultima_aportacion', 'id'], name='participacion_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='peticionamistad',
+            index=models.Index(fields=['fecha_solicitud', 'id'], name='peticion_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='suscripcion',
+            index=models.Index(fields=['fecha_inicio', 'id'], name='suscripcion_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 03:29
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def rellenar_fecha_actualizacion(apps, schema_editor):
+    # Los votos existentes no han cambiado desde que se emitieron (o no se sabe cuándo)
+    Voto = apps.get_model('BookRoomAPI', 'Voto')
+    Voto.objects.update(fecha_actualizacion=F('fecha'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookRoomAPI', '0013_indices_listados_admin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voto',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(rellenar_fecha_actualizacion, migrations.RunPython.noop),
+    ]
@@ -43,6 +43,16 @@ class Usuario(AbstractUser):
     total_palabras_escritas  = models.PositiveIntegerField(default=0)
     total_tiempo_escritura   = models.PositiveIntegerField(default=0)
 
+    # username en minúsculas y sin tildes, para la búsqueda (ver busqueda_usuarios.py)
+    username_normalizado = models.CharField(max_length=150, db_index=True, editable=False, default='')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # username tal como está en la BD: las señales lo comparan para saber si ha cambiado
+        instancia._username_guardado = instancia.__dict__.get('username')
+        return instancia
+
     def save(self, *args, **kwargs):
         # Forzar rol según flags de Django
         if self.is_superuser:
@@ -55,15 +65,9 @@ class Usuario(AbstractUser):
 
     # Métodos útiles (sin cambios)
     def amigos(self):
-        desde = Usuario.objects.filter(
-            amistades_enviadas__a_usuario=self,
-            amistades_enviadas__estado='ACEPTADA'
-        )
-        hacia = Usuario.objects.filter(
-            amistades_recibidas__de_usuario=self,
-            amistades_recibidas__estado='ACEPTADA'
-        )
-        return desde.union(hacia)
+        # Ids desde la caché (o la tabla Amistad) y una búsqueda por PK
+        from .amistades import ids_amigos
+        return Usuario.objects.filter(pk__in=ids_amigos(self.pk))
 
     def amistades_pendientes(self):
         return self.amistades_enviadas.filter(estado='PENDIENTE')
@@ -157,6 +161,13 @@ class Relato(models.Model):
         related_name='relatos_colaborados'
     )
 
+    class Meta:
+        # Índices para la paginación por cursor (fecha_creacion, id)
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion', 'id'], name='relato_estado_fecha_idx'),
+            models.Index(fields=['fecha_creacion', 'id'], name='relato_fecha_idx'),
+        ]
+
     def num_colaboradores(self):
         # Devuelve el número de colaboradores en el relato
         return self.autores.count()
@@ -180,6 +191,34 @@ class Relato(models.Model):
     def __str__(self):
         return self.titulo
     
+class TerminoRelato(models.Model):
+    """
+    Índice invertido de búsqueda de los relatos publicados (ver busqueda.py).
+    Una fila por término analizado y campo del relato, con su peso.
+    """
+    TITULO = 't'
+    DESCRIPCION = 'd'
+    CONTENIDO = 'c'
+    CAMPOS = [
+        (TITULO, 'Título'),
+        (DESCRIPCION, 'Descripción'),
+        (CONTENIDO, 'Contenido'),
+    ]
+
+    relato = models.ForeignKey('Relato', on_delete=models.CASCADE, related_name='terminos')
+    termino = models.CharField(max_length=50)
+    campo = models.CharField(max_length=1, choices=CAMPOS)
+    peso = models.FloatField()
+
+    class Meta:
+        unique_together = ('relato', 'termino', 'campo')
+        indexes = [
+            models.Index(fields=['termino', 'campo', 'relato'], name='termino_relato_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.termino} ({self.campo}) → relato {self.relato_id}"
+
 class ParticipacionRelato(models.Model):
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     relato = models.ForeignKey('Relato', on_delete=models.CASCADE)
@@ -194,8 +233,23 @@ class ParticipacionRelato(models.Model):
     fecha_ultima_aportacion = models.DateTimeField(auto_now=True)
 
     class Meta:
+        indexes = [
+            models.Index(fields=['fecha_ultima_aportacion', 'id'], name='participacion_fecha_idx'),
+        ]
         unique_together = ('usuario', 'relato')
     
+class TrigramaUsuario(models.Model):
+    """Trigramas del username normalizado de cada usuario (ver busqueda_usuarios.py)."""
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='trigramas')
+    trigrama = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = ('usuario', 'trigrama')
+        indexes = [
+            models.Index(fields=['trigrama', 'usuario'], name='trigrama_usuario_idx'),
+        ]
+
+
 class PeticionAmistad(models.Model):
     ESTADOS = [
         ('PENDIENTE', 'Pendiente'),
@@ -220,24 +274,124 @@ class PeticionAmistad(models.Model):
     fecha_aceptacion = models.DateTimeField(blank=True, null=True)
 
     class Meta:
+        indexes = [
+            models.Index(fields=['fecha_solicitud', 'id'], name='peticion_fecha_idx'),
+        ]
         # Solo una solicitud entre los mismos dos usuarios
         unique_together = ('de_usuario', 'a_usuario')
 
     def __str__(self):
         return f"{self.de_usuario.username} → {self.a_usuario.username} ({self.estado})"
     
+
+class Amistad(models.Model):
+    """
+    Amistades aceptadas en las dos direcciones (una fila por cada lado).
+    La mantienen las señales de PeticionAmistad; no se escribe a mano.
+    """
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='amistades', on_delete=models.CASCADE)
+    amigo = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    desde = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # (usuario, amigo) es el índice de "mis amigos" y de "¿es mi amigo?"
+        unique_together = ('usuario', 'amigo')
+
+    def __str__(self):
+        return f"{self.usuario_id} ↔ {self.amigo_id}"
+
+
 class Estadistica(models.Model):
     relato = models.OneToOneField('Relato', on_delete=models.CASCADE, related_name='estadisticas')
 
     num_colaboradores = models.PositiveIntegerField(default=0)
     num_comentarios = models.PositiveIntegerField(default=0)
     promedio_votos = models.FloatField(default=0.0)
+    # Histograma de votos (cuántos de 1, 2, 3, 4 y 5 estrellas): el promedio
+    # y la distribución se sacan de aquí sin recorrer Voto
+    votos_1 = models.PositiveIntegerField(default=0)
+    votos_2 = models.PositiveIntegerField(default=0)
+    votos_3 = models.PositiveIntegerField(default=0)
+    votos_4 = models.PositiveIntegerField(default=0)
+    votos_5 = models.PositiveIntegerField(default=0)
+    # Media bayesiana de los votos (utils.puntuacion_bayesiana): ordena el top de relatos
+    puntuacion_ranking = models.FloatField(default=0.0)
     total_palabras = models.PositiveIntegerField(default=0)
     tiempo_total = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['promedio_votos', 'id'], name='estadistica_promedio_idx'),
+            models.Index(fields=['-puntuacion_ranking', 'relato'], name='estadistica_ranking_idx'),
+        ]
+
+    ESTRELLAS = range(1, 6)
+
+    def distribucion(self):
+        return {estrellas: getattr(self, f'votos_{estrellas}') for estrellas in self.ESTRELLAS}
+
+    @property
+    def num_votos(self):
+        return sum(self.distribucion().values())
+
+    @property
+    def suma_votos(self):
+        return sum(estrellas * n for estrellas, n in self.distribucion().items())
+
     def __str__(self):
         return f"Estadísticas de: {self.relato.titulo}"
 
+class PuntuacionRanking(models.Model):
+    """
+    Foto precalculada de los rankings de usuarios (ver rankings.py): los
+    puntos de cada usuario por métrica y periodo (semana, mes o total).
+    Cada semana/mes empieza en filas nuevas, identificadas por inicio_periodo.
+    """
+    RELATOS = 'relatos'
+    VOTOS = 'votos'
+    PALABRAS = 'palabras'
+    METRICAS = [
+        (RELATOS, 'Relatos publicados'),
+        (VOTOS, 'Votos recibidos'),
+        (PALABRAS, 'Palabras escritas'),
+    ]
+    SEMANA = 'semana'
+    MES = 'mes'
+    TOTAL = 'total'
+    PERIODOS = [
+        (SEMANA, 'Semanal'),
+        (MES, 'Mensual'),
+        (TOTAL, 'Histórico'),
+    ]
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='puntuaciones_ranking')
+    metrica = models.CharField(max_length=10, choices=METRICAS)
+    periodo = models.CharField(max_length=10, choices=PERIODOS)
+    inicio_periodo = models.DateField()
+    puntos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('metrica', 'periodo', 'inicio_periodo', 'usuario')
+        indexes = [
+            # Top-K y "cuántos tienen más puntos que yo" salen de este índice
+            models.Index(fields=['metrica', 'periodo', 'inicio_periodo', '-puntos', 'usuario'],
+                         name='ranking_puntos_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario_id} {self.metrica}/{self.periodo} {self.inicio_periodo}: {self.puntos}"
+
+class RecalculoEstadistica(models.Model):
+    """
+    Relatos pendientes de recalcular sus estadísticas (broker 'db' de
+    cola_estadisticas.py). Una fila por relato: así se agrupan las peticiones.
+    """
+    relato = models.OneToOneField('Relato', on_delete=models.CASCADE, primary_key=True, related_name='+')
+    programado_para = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Recálculo de {self.relato_id} ({self.programado_para})"
+
 class Comentario(models.Model):
     usuario = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -255,6 +409,29 @@ class Comentario(models.Model):
         default=0,
         help_text="Contador neto de votos (positivo - negativo)"
     )
+    votos_positivos = models.PositiveIntegerField(default=0)
+    votos_negativos = models.PositiveIntegerField(default=0)
+    # Puntuaciones para ordenar, las mantiene votos_comentarios.py en cada voto
+    puntuacion_best = models.FloatField(default=0, help_text="Límite inferior de Wilson de los votos")
+    puntuacion_hot = models.FloatField(default=0, help_text="Wilson con decaimiento por antigüedad")
+
+    class Meta:
+        # Índices para la paginación por cursor (fecha, id) y los órdenes best/hot
+        indexes = [
+            models.Index(fields=['relato', 'fecha', 'id'], name='comentario_relato_fecha_idx'),
+            models.Index(fields=['fecha', 'id'], name='comentario_fecha_idx'),
+            models.Index(fields=['relato', '-puntuacion_best', '-id'], name='comentario_relato_best_idx'),
+            models.Index(fields=['relato', '-puntuacion_hot', '-id'], name='comentario_relato_hot_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # Sin votos todavía: solo cuenta lo reciente que es
+            from .votos_comentarios import puntuaciones_comentario
+            self.puntuacion_best, self.puntuacion_hot = puntuaciones_comentario(
+                self.votos_positivos, self.votos_negativos, self.fecha or timezone.now()
+            )
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.usuario.username} comentó en '{self.relato.titulo}'"
@@ -298,10 +475,15 @@ class Voto(models.Model):
     )
     puntuacion = models.PositiveSmallIntegerField()
     fecha = models.DateTimeField(auto_now_add=True)
+    # Último cambio de puntuación: el buffer write-behind no pisa un voto más nuevo
+    fecha_actualizacion = models.DateTimeField(default=timezone.now)
 
     class Meta:
         # Un usuario solo puede votar una vez cada relato
         unique_together = ('usuario', 'relato')  
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='voto_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.usuario.username} votó {self.puntuacion} a '{self.relato.titulo}'"
@@ -322,6 +504,12 @@ class Suscripcion(models.Model):
     fecha_inicio = models.DateTimeField(auto_now_add=True)
     fecha_fin = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        # Listado del administrador (paginación por cursor sobre esta columna e id)
+        indexes = [
+            models.Index(fields=['fecha_inicio', 'id'], name='suscripcion_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"{self.usuario.username} - {self.tipo} ({'Activa' if self.activa else 'Inactiva'})"
     
@@ -336,6 +524,11 @@ class Factura(models.Model):
 
     pdf_url = models.URLField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='factura_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"Factura de {self.suscripcion.usuario.username} - {self.total}€"
     
@@ -345,5 +538,27 @@ class Mensaje(models.Model):
     texto = models.TextField()
     fecha_envio = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha_envio', 'id'], name='mensaje_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.autor.username} @ {self.fecha_envio}: {self.texto[:20]}…"
+
+class MetricaTokens(models.Model):
+    """
+    Foto del tamaño de la tabla de access tokens, una por cada pasada de
+    `purgar_tokens` (ver tokens.py): sirve para ver su evolución en el tiempo.
+    """
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+    total = models.PositiveIntegerField()
+    activos = models.PositiveIntegerField()
+    purgados = models.PositiveIntegerField(default=0)
+    segundos_purga = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ['-fecha']
+
     def __str__(self):
-        return f"{self.autor.username} @ {self.fecha_envio}: {self.texto[:20]}…"
\ No newline at end of file
+        return f"{self.fecha}: {self.total} tokens ({self.activos} activos, {self.purgados} purgados)"
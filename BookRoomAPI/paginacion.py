@@ -0,0 +1,189 @@
+import base64
+import json
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PaginacionCursor(PageNumberPagination):
+    """
+    Paginación seleccionable por vista: por número de página (por defecto,
+    misma respuesta de siempre con `count`) o por cursor (keyset).
+
+    El modo cursor se activa con `?paginacion=cursor` y los enlaces `next`/
+    `previous` llevan ya el `?cursor=`. En vez de COUNT(*) + OFFSET filtra
+    por la última fila vista, p. ej. (fecha_creacion, id) < (x, y), así que
+    cualquier página cuesta lo mismo si hay un índice con esas columnas.
+
+    La vista indica las columnas con `orden_cursor` (la última debe ser única)
+    y puede poner `cursor_por_defecto = True` para paginar siempre por cursor.
+    Si la petición ordena por otra cosa (?ordering=titulo, relevancia...)
+    se vuelve a la paginación por número de página.
+    """
+    cursor_query_param = 'cursor'
+    modo_query_param = 'paginacion'
+    orden_cursor = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.orden = tuple(getattr(view, 'orden_cursor', self.orden_cursor))
+        self.modo_cursor = self.usar_cursor(request, queryset, view)
+        if not self.modo_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        valores, hacia_atras = self.decodificar_cursor(request, queryset.model)
+        orden = self.orden if not hacia_atras else tuple(self.invertir(c) for c in self.orden)
+
+        queryset = queryset.order_by(*orden)
+        if valores is not None:
+            queryset = queryset.filter(self.filtro_posicion(orden, valores))
+
+        filas = list(queryset[:self.page_size + 1])
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        if hacia_atras:
+            filas.reverse()
+
+        # Con el cursor hacia delante siempre hay página anterior (y al revés)
+        hay_siguiente = hay_mas if not hacia_atras else True
+        hay_anterior = (valores is not None) if not hacia_atras else hay_mas
+
+        self.cursor_siguiente = self.codificar_cursor(filas[-1], False) if filas and hay_siguiente else None
+        self.cursor_anterior = self.codificar_cursor(filas[0], True) if filas and hay_anterior else None
+        return filas
+
+    def get_paginated_response(self, data):
+        if not self.modo_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.modo_cursor:
+            return super().get_next_link()
+        return self.enlace(self.cursor_siguiente)
+
+    def get_previous_link(self):
+        if not self.modo_cursor:
+            return super().get_previous_link()
+        return self.enlace(self.cursor_anterior)
+
+    def get_schema_operation_parameters(self, view):
+        parametros = super().get_schema_operation_parameters(view)
+        parametros += [
+            {
+                'name': self.modo_query_param,
+                'required': False,
+                'in': 'query',
+                'description': "'cursor' para paginar por cursor o 'paginas' para paginar por número de página.",
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor devuelto en next/previous.',
+                'schema': {'type': 'string'},
+            },
+        ]
+        return parametros
+
+    # ——— Auxiliares ————————————————————————————————————————————————
+
+    def usar_cursor(self, request, queryset, view=None):
+        modo = request.query_params.get(self.modo_query_param)
+        if getattr(view, 'cursor_por_defecto', False):
+            pedido = modo != 'paginas'
+        else:
+            pedido = modo == 'cursor' or self.cursor_query_param in request.query_params
+        if not pedido:
+            return False
+        # Solo si el queryset no viene ordenado por otra columna distinta
+        orden_actual = [str(c) for c in queryset.query.order_by]
+        return not orden_actual or orden_actual[0] == self.orden[0]
+
+    @staticmethod
+    def invertir(columna):
+        return columna[1:] if columna.startswith('-') else '-' + columna
+
+    @staticmethod
+    def filtro_posicion(orden, valores):
+        # (a, b, c) "después de" (x, y, z) => a<x OR (a=x AND b<y) OR (a=x AND b=y AND c<z)
+        filtro = Q()
+        iguales = {}
+        for columna, valor in zip(orden, valores):
+            nombre = columna.lstrip('-')
+            lookup = 'lt' if columna.startswith('-') else 'gt'
+            filtro |= Q(**iguales, **{f'{nombre}__{lookup}': valor})
+            iguales[nombre] = valor
+        return filtro
+
+    def codificar_cursor(self, fila, hacia_atras):
+        valores = []
+        for columna in self.orden:
+            valor = getattr(fila, columna.lstrip('-'))
+            if hasattr(valor, 'isoformat'):
+                valor = valor.isoformat()
+            elif isinstance(valor, Decimal):
+                valor = str(valor)
+            valores.append(valor)
+        datos = json.dumps({'v': valores, 'r': hacia_atras}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(datos.encode()).decode()
+
+    def decodificar_cursor(self, request, modelo):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            valores = list(datos['v'])
+            hacia_atras = bool(datos.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound("Cursor no válido.")
+        if len(valores) != len(self.orden):
+            raise NotFound("Cursor no válido.")
+
+        # Devuelvo cada valor a su tipo (fechas, decimales...) según el campo del modelo
+        convertidos = []
+        for columna, valor in zip(self.orden, valores):
+            try:
+                campo = modelo._meta.get_field(columna.lstrip('-'))
+                valor = campo.to_python(valor)
+            except FieldDoesNotExist:
+                pass
+            except Exception:
+                raise NotFound("Cursor no válido.")
+            convertidos.append(valor)
+        return convertidos, hacia_atras
+
+    def enlace(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        url = remove_query_param(url, self.modo_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+
+class PaginacionComentarios(PaginacionCursor):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class PaginacionBusquedaUsuarios(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
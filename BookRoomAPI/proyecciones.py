@@ -0,0 +1,86 @@
+from django.core.exceptions import FieldDoesNotExist
+from drf_yasg import openapi
+
+
+def leer_lista_parametro(valor):
+    # "a, b,c" -> ['a', 'b', 'c']
+    return [v.strip() for v in (valor or '').split(',') if v.strip()]
+
+
+class CamposDinamicosMixin:
+    """
+    Mixin para serializers: acepta `campos=[...]` en el constructor
+    y quita del serializer cualquier campo que no esté en esa lista.
+    """
+
+    def __init__(self, *args, **kwargs):
+        campos = kwargs.pop('campos', None)
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+
+
+class ProyeccionCamposMixin:
+    """
+    Mixin para vistas de listado con ?fields= y ?expand=.
+
+    - `?fields=id,titulo` limita la respuesta a esos campos.
+    - `?expand=contenido` añade campos pesados que no salen por defecto.
+
+    Los campos elegidos se trasladan a la SQL con `.only()`, así las columnas
+    que no se piden no se leen de la base de datos. `columnas_por_campo`
+    indica qué columnas necesita cada campo del serializer (por defecto, la
+    columna con el mismo nombre si existe en el modelo) y `preparar_queryset`
+    permite añadir anotaciones o prefetch según los campos pedidos.
+    """
+    campos_expandibles = ()
+    columnas_por_campo = {}
+
+    parametros_swagger = [
+        openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description='Campos a devolver, separados por comas'),
+        openapi.Parameter('expand', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description='Campos extra a incluir, separados por comas'),
+    ]
+
+    def get_campos(self):
+        if not hasattr(self, '_campos'):
+            disponibles = list(self.get_serializer_class().Meta.fields)
+            pedidos = leer_lista_parametro(self.request.query_params.get('fields'))
+            expandidos = leer_lista_parametro(self.request.query_params.get('expand'))
+
+            if pedidos:
+                campos = {c for c in pedidos if c in disponibles}
+            else:
+                campos = {c for c in disponibles if c not in self.campos_expandibles}
+            campos |= {c for c in expandidos if c in self.campos_expandibles}
+            campos.add('id')
+
+            self._campos = [c for c in disponibles if c in campos]
+        return self._campos
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('campos', self.get_campos())
+        return super().get_serializer(*args, **kwargs)
+
+    def columnas_para(self, campos):
+        modelo = self.get_serializer_class().Meta.model
+        columnas = {'id'}
+        for campo in campos:
+            for columna in self.columnas_por_campo.get(campo, (campo,)):
+                try:
+                    if modelo._meta.get_field(columna).concrete:
+                        columnas.add(columna)
+                except FieldDoesNotExist:
+                    pass
+        return columnas
+
+    def preparar_queryset(self, queryset, campos):
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        campos = self.get_campos()
+        queryset = queryset.only(*self.columnas_para(campos))
+        return self.preparar_queryset(queryset, campos)
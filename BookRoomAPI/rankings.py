@@ -0,0 +1,150 @@
+"""
+Rankings de usuarios precalculados (relatos publicados, votos recibidos y
+palabras escritas) por semana, mes y total.
+
+Cada vez que cambia un contador se suman los puntos en PuntuacionRanking
+(dos queries para las tres ventanas a la vez), así leer un ranking nunca
+ordena la tabla de usuarios:
+- el top-K ya serializado de cada ranking sale de la caché, que dura
+  RANKING_CACHE_TTL segundos (puede ir un poco por detrás de los contadores,
+  nunca más que eso);
+- la posición de cualquier usuario es un COUNT de los que tienen más puntos,
+  que recorre solo el índice (metrica, periodo, inicio_periodo, -puntos).
+Solo cuentan los usuarios con puntos en el periodo: el que tiene 0 no sale
+en el top y no tiene posición.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PuntuacionRanking, Usuario
+
+METRICAS = dict(PuntuacionRanking.METRICAS)
+PERIODOS = dict(PuntuacionRanking.PERIODOS)
+
+# Contador de Usuario que corresponde a cada métrica (para reconstruir el total)
+CAMPO_USUARIO = {
+    PuntuacionRanking.RELATOS: 'total_relatos_publicados',
+    PuntuacionRanking.VOTOS: 'total_votos_recibidos',
+    PuntuacionRanking.PALABRAS: 'total_palabras_escritas',
+}
+
+INICIO_TOTAL = date(1970, 1, 1)
+
+
+def inicio_periodo(periodo, dia=None):
+    dia = dia or timezone.localdate()
+    if periodo == PuntuacionRanking.SEMANA:
+        return dia - timedelta(days=dia.weekday())
+    if periodo == PuntuacionRanking.MES:
+        return dia.replace(day=1)
+    return INICIO_TOTAL
+
+
+def periodos_actuales(dia=None):
+    return {periodo: inicio_periodo(periodo, dia) for periodo in PERIODOS}
+
+
+# ——— Escritura ———————————————————————————————————————————————————————
+
+def sumar_puntos(metrica, usuario_ids, cantidad):
+    """
+    Suma `cantidad` puntos en `metrica` a los usuarios, en las ventanas
+    semanal, mensual y total a la vez.
+    """
+    usuario_ids = set(usuario_ids)
+    if not usuario_ids or not cantidad:
+        return
+    periodos = periodos_actuales()
+    with transaction.atomic():
+        # 1) Filas que falten (INSERT IGNORE), 2) un único UPDATE para todas
+        PuntuacionRanking.objects.bulk_create(
+            [
+                PuntuacionRanking(usuario_id=usuario_id, metrica=metrica, periodo=periodo, inicio_periodo=inicio)
+                for usuario_id in usuario_ids
+                for periodo, inicio in periodos.items()
+            ],
+            ignore_conflicts=True,
+        )
+        ventanas = Q()
+        for periodo, inicio in periodos.items():
+            ventanas |= Q(periodo=periodo, inicio_periodo=inicio)
+        PuntuacionRanking.objects.filter(ventanas, metrica=metrica, usuario_id__in=usuario_ids).update(
+            puntos=F('puntos') + cantidad
+        )
+
+
+def reconstruir_totales():
+    """Rehace el ranking histórico a partir de los contadores de Usuario."""
+    with transaction.atomic():
+        PuntuacionRanking.objects.filter(periodo=PuntuacionRanking.TOTAL).delete()
+        for metrica, campo in CAMPO_USUARIO.items():
+            filas = (
+                PuntuacionRanking(
+                    usuario_id=usuario_id, metrica=metrica, periodo=PuntuacionRanking.TOTAL,
+                    inicio_periodo=INICIO_TOTAL, puntos=puntos,
+                )
+                for usuario_id, puntos in Usuario.objects.filter(**{f'{campo}__gt': 0}).values_list('id', campo)
+            )
+            PuntuacionRanking.objects.bulk_create(filas, batch_size=1000)
+
+
+def purgar_periodos_antiguos():
+    # Las semanas y meses ya cerrados no se consultan
+    periodos = periodos_actuales()
+    return PuntuacionRanking.objects.filter(
+        Q(periodo=PuntuacionRanking.SEMANA, inicio_periodo__lt=periodos[PuntuacionRanking.SEMANA]) |
+        Q(periodo=PuntuacionRanking.MES, inicio_periodo__lt=periodos[PuntuacionRanking.MES])
+    ).delete()[0]
+
+
+# ——— Lectura —————————————————————————————————————————————————————————
+
+def _filas(metrica, periodo):
+    return PuntuacionRanking.objects.filter(
+        metrica=metrica, periodo=periodo, inicio_periodo=inicio_periodo(periodo), puntos__gt=0
+    )
+
+
+def _clave(tipo, metrica, periodo):
+    return f"ranking:{tipo}:{metrica}:{periodo}:{inicio_periodo(periodo).isoformat()}"
+
+
+def top_ranking(metrica, periodo, serializar):
+    """
+    Devuelve los RANKING_TOP_K primeros del ranking como lista de dicts.
+    `serializar(usuarios)` convierte los Usuario a dicts (se llama solo al
+    regenerar la caché); a cada uno se le añaden `puntos` y `posicion`.
+    """
+    clave = _clave('top', metrica, periodo)
+    top = cache.get(clave)
+    if top is None:
+        filas = list(
+            _filas(metrica, periodo)
+            .order_by('-puntos', 'usuario_id')
+            .values_list('usuario_id', 'puntos')[:settings.RANKING_TOP_K]
+        )
+        usuarios = Usuario.objects.in_bulk([usuario_id for usuario_id, _ in filas])
+        datos = {d['id']: d for d in serializar([usuarios[usuario_id] for usuario_id, _ in filas])}
+        top = []
+        for indice, (usuario_id, puntos) in enumerate(filas):
+            # Empates: misma posición (1, 2, 2, 4...)
+            posicion = top[-1]['posicion'] if top and top[-1]['puntos'] == puntos else indice + 1
+            top.append({**datos[usuario_id], 'puntos': puntos, 'posicion': posicion})
+        cache.set(clave, top, settings.RANKING_CACHE_TTL)
+    return top
+
+
+def posicion_usuario(usuario_id, metrica, periodo):
+    """(posicion, puntos) del usuario; posicion es None si no tiene puntos."""
+    puntos = (
+        _filas(metrica, periodo).filter(usuario_id=usuario_id).values_list('puntos', flat=True).first()
+    ) or 0
+    if not puntos:
+        return None, 0
+    # Usuarios con más puntos que él: rango del índice, sin leer la tabla
+    return _filas(metrica, periodo).filter(puntos__gt=puntos).count() + 1, puntos
@@ -1,6 +1,8 @@
 from datetime import date
 from rest_framework import serializers
 from .models import *
+from .proyecciones import CamposDinamicosMixin
+from .utils import generar_extracto
 import re
 
 class SuscripcionSerializer(serializers.ModelSerializer):
@@ -223,7 +225,8 @@ class ParticipacionRelatoSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'usuario', 'orden', 'fecha_ultima_aportacion')
 
 class RelatoSerializer(serializers.ModelSerializer):
-    autores = serializers.StringRelatedField(many=True)
+    # Los autores salen de las participaciones (precargadas en los listados)
+    autores = serializers.SerializerMethodField()
     participaciones = ParticipacionRelatoSerializer(
         source='participacionrelato_set',
         many=True,
@@ -252,6 +255,42 @@ class RelatoSerializer(serializers.ModelSerializer):
             'participaciones',
         ]
 
+    def get_autores(self, obj):
+        return [p.usuario.username for p in obj.participacionrelato_set.all()]
+
+
+class RelatoResumenSerializer(CamposDinamicosMixin, RelatoSerializer):
+    """
+    Versión ligera de RelatoSerializer para los listados (tarjetas).
+    `contenido` y `participaciones` solo salen si se piden con ?expand=.
+    """
+    extracto = serializers.SerializerMethodField()
+
+    class Meta(RelatoSerializer.Meta):
+        fields = [
+            'id',
+            'titulo',
+            'descripcion',
+            'extracto',
+            'idioma',
+            'idioma_display',
+            'generos',
+            'generos_display',
+            'estado',
+            'fecha_creacion',
+            'num_escritores',
+            'autores',
+            'contenido',
+            'participaciones',
+        ]
+
+    def get_extracto(self, obj):
+        # En los listados viene anotado con solo el principio del contenido
+        html = getattr(obj, 'extracto_html', None)
+        if html is None:
+            html = obj.contenido
+        return generar_extracto(html)
+
 
 class RelatoCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -350,6 +389,14 @@ class SolicitudAmistadSerializer(serializers.Serializer):
         help_text="ID del usuario al que se envía la solicitud"
     )
 
+class EstadosRelacionSerializer(serializers.Serializer):
+    usuarios = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+        help_text="IDs de los usuarios (máximo 100)"
+    )
+
 class PeticionAmistadSerializer(serializers.ModelSerializer):
     de_usuario = UsuarioAmigoSerializer(read_only=True)
     a_usuario = UsuarioAmigoSerializer(read_only=True)
@@ -366,24 +413,49 @@ class PeticionAmistadSerializer(serializers.ModelSerializer):
         ]
 
 #COMENTARIOS----------------------------------------------------------------------------------------
+class ComentarioAutorSerializer(serializers.ModelSerializer):
+    # Solo columnas de Usuario: nada de suscripción ni contadores semanales (queries por autor)
+    rol_nombre = serializers.CharField(source='get_rol_display', read_only=True)
+
+    class Meta:
+        model = Usuario
+        fields = ['id', 'username', 'avatar', 'rol', 'rol_nombre']
+        read_only_fields = fields
+
+
 class ComentarioSerializer(serializers.ModelSerializer):
     mi_voto = serializers.SerializerMethodField()
-    usuario = UsuarioSerializer(read_only=True)
+    usuario = ComentarioAutorSerializer(read_only=True)
     class Meta:
         model = Comentario
         fields = ['id','usuario','texto','fecha','relato','votos','mi_voto']
         read_only_fields = ('id','usuario','fecha','relato','votos','mi_voto')
 
     def get_mi_voto(self, obj):
+        # En los listados la vista pasa `mis_votos` ({comentario_id: valor}) ya cargado
+        mis_votos = self.context.get('mis_votos')
+        if mis_votos is not None:
+            return mis_votos.get(obj.id, 0)
         user = self.context['request'].user
         if user.is_anonymous:
             return 0
-        try:
-            voto = obj.votos_usuario.get(usuario=user)
-            return voto.valor
-        except:
-            return 0
+        voto = obj.votos_usuario.filter(usuario=user).values_list('valor', flat=True).first()
+        return voto or 0
     
+class ResultadoVotoComentarioSerializer(serializers.Serializer):
+    comentario = serializers.IntegerField()
+    votos = serializers.IntegerField(help_text="Puntuación neta del comentario tras el voto")
+    mi_voto = serializers.IntegerField(help_text="1, -1 o 0 si ya no tienes voto")
+
+
+class VotoComentarioItemSerializer(serializers.Serializer):
+    comentario = serializers.IntegerField(min_value=1)
+    valor = serializers.ChoiceField(choices=[1, -1, 0], help_text="1 positivo, -1 negativo, 0 quitar el voto")
+
+
+class VotosComentariosLoteSerializer(serializers.Serializer):
+    votos = VotoComentarioItemSerializer(many=True, allow_empty=False, max_length=100)
+
 #VOTOS----------------------------------------------------------------------------------------
 class VotoSerializer(serializers.ModelSerializer):
     usuario = UsuarioAmigoSerializer(read_only=True)
@@ -411,6 +483,8 @@ class EstadisticaSerializer(serializers.ModelSerializer):
             'num_colaboradores',
             'num_comentarios',
             'promedio_votos',
+            'num_votos',
+            'puntuacion_ranking',
             'total_palabras',
             'tiempo_total'
         ]
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from oauth2_provider.models import AccessToken, Application
+
+from .models import PeticionAmistad, Relato, Usuario
+from .amistades import sincronizar_amistad
+from .busqueda import indexar_relato
+from .busqueda_usuarios import indexar_usuario
+from .cache_tokens import invalidar_token, invalidar_tokens_usuario
+from .tokens import en_purga, invalidar_aplicacion
+from . import indice_usuarios
+
+CAMPOS_INDEXADOS = {'titulo', 'descripcion', 'contenido', 'idioma', 'estado'}
+
+
+@receiver(post_save, sender=Relato)
+def reindexar_relato_guardado(sender, instance, update_fields=None, **kwargs):
+    # Mantiene el índice de búsqueda al publicar o editar un relato
+    if update_fields is not None and not CAMPOS_INDEXADOS.intersection(update_fields):
+        return
+    transaction.on_commit(lambda: indexar_relato(instance))
+
+
+@receiver(post_save, sender=PeticionAmistad)
+@receiver(post_delete, sender=PeticionAmistad)
+def sincronizar_amistad_peticion(sender, instance, **kwargs):
+    # Aceptar, borrar o bloquear una solicitud actualiza la tabla Amistad
+    sincronizar_amistad(instance.de_usuario_id, instance.a_usuario_id)
+
+
+@receiver(post_save, sender=Usuario)
+def indexar_usuario_guardado(sender, instance, created=False, update_fields=None, **kwargs):
+    # Solo hay trabajo si cambia el username (el resto de guardados no tocan los índices)
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    indexar_usuario(instance)
+    # El índice en memoria guarda el username tal cual: 'Ana' -> 'ana' también cuenta
+    # aunque no cambie el normalizado (sin _username_guardado no sabemos el anterior)
+    if created or instance.username != getattr(instance, '_username_guardado', None):
+        instance._username_guardado = instance.username
+        pk, username = instance.pk, instance.username
+        transaction.on_commit(lambda: indice_usuarios.usuario_guardado(pk, username, created))
+
+
+@receiver(post_delete, sender=Usuario)
+def quitar_usuario_borrado(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: indice_usuarios.usuario_borrado(pk))
+
+
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def invalidar_token_cacheado(sender, instance, **kwargs):
+    # Logout, revocación, caducidad forzada o renovación: el token no puede seguir sirviéndose de la caché.
+    # La purga borra de la caché lote a lote (tokens.purgar_tokens_caducados)
+    if en_purga():
+        return
+    invalidar_token(instance.token_checksum)
+
+
+@receiver(post_save, sender=Usuario)
+def invalidar_tokens_usuario_guardado(sender, instance, created=False, **kwargs):
+    # Los tokens cacheados llevan el Usuario dentro: al cambiarlo se vuelven a cargar
+    if not created:
+        invalidar_tokens_usuario(instance.pk)
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def refrescar_aplicacion_oauth(sender, instance, **kwargs):
+    # Cada proceso guarda la Application de la API (tokens.aplicacion_oauth): ya y al confirmar
+    invalidar_aplicacion()
+    transaction.on_commit(invalidar_aplicacion)
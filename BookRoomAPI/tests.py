@@ -1,3 +1,1237 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, QuerySet
+from django.http import Http404
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APIClient
+
+from .amistades import ids_amigos, son_amigos
+from .buffer_votos import BufferVotos, cerrar_buffer
+from .cache_tokens import resolver_token
+from .cola_estadisticas import ColaLocal
+from . import indice_usuarios, metricas
+from .contadores import incrementar_contador_por_usuario, incrementar_contadores
+from .middleware import TokenAuthMiddleware
+from .models import (
+    Usuario, Relato, ParticipacionRelato, Estadistica, Voto, RecalculoEstadistica, PuntuacionRanking,
+    Comentario, ComentarioVoto, PeticionAmistad, Amistad, TrigramaUsuario, MetricaTokens,
+)
+from .rankings import inicio_periodo, sumar_puntos
+from .throttles import consumir
+from .tokens import aplicacion_oauth, emitir_token, purgar_tokens_caducados
+from .utils import actualizar_estadisticas, registrar_voto_estadisticas
+from .votos_comentarios import aplicar_votos_comentarios, recalcular_puntuaciones
+
+
+class ListadosRelatosQueriesTest(TestCase):
+    """
+    Los listados de relatos deben costar un número fijo de queries por página,
+    da igual cuántos relatos o autores haya (COUNT + relatos + participaciones).
+    """
+    QUERIES_POR_PAGINA = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = Usuario.objects.create_user(username='autor', password='Clave1234')
+        cls.coautor = Usuario.objects.create_user(username='coautor', password='Clave1234')
+        cls.admin = Usuario.objects.create_user(username='admin', password='Clave1234', is_superuser=True)
+
+    def crear_relatos(self, cantidad, estado):
+        for i in range(cantidad):
+            relato = Relato.objects.create(
+                titulo=f"Relato {estado} {i}",
+                descripcion="Descripción de prueba",
+                contenido="<p>Contenido</p>",
+                estado=estado,
+                num_escritores=3,
+            )
+            Estadistica.objects.create(relato=relato)
+            ParticipacionRelato.objects.create(usuario=self.autor, relato=relato, orden=1)
+            ParticipacionRelato.objects.create(usuario=self.coautor, relato=relato, orden=2)
+
+    def comprobar_listado(self, url, estado, usuario=None):
+        client = APIClient()
+        if usuario:
+            client.force_authenticate(usuario)
+
+        self.crear_relatos(2, estado)
+        with self.assertNumQueries(self.QUERIES_POR_PAGINA):
+            respuesta = client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['results'][0]['autores'], ['autor', 'coautor'])
+
+        self.crear_relatos(4, estado)
+        with self.assertNumQueries(self.QUERIES_POR_PAGINA):
+            respuesta = client.get(url)
+        self.assertEqual(len(respuesta.data['results']), 6)
+
+    def test_relatos_publicados(self):
+        self.comprobar_listado(reverse('relatos-publicados'), 'PUBLICADO')
+
+    def test_relatos_disponibles(self):
+        self.comprobar_listado(reverse('relatos-disponibles'), 'CREACION')
+
+    def test_mis_relatos(self):
+        self.comprobar_listado(reverse('relatos-mis-relatos'), 'EN_PROCESO', usuario=self.autor)
+
+    def test_administrador_relatos(self):
+        self.comprobar_listado(reverse('admin-relatos'), 'EN_PROCESO', usuario=self.admin)
+
+    def test_proyeccion_campos(self):
+        self.crear_relatos(1, 'PUBLICADO')
+        url = reverse('relatos-publicados')
+
+        respuesta = APIClient().get(url)
+        tarjeta = respuesta.data['results'][0]
+        self.assertEqual(tarjeta['extracto'], 'Contenido')
+        self.assertNotIn('contenido', tarjeta)
+        self.assertNotIn('participaciones', tarjeta)
+
+        with CaptureQueriesContext(connection) as queries:
+            respuesta = APIClient().get(url, {'fields': 'titulo'})
+        self.assertEqual(set(respuesta.data['results'][0]), {'id', 'titulo'})
+        sql_relatos = queries.captured_queries[-1]['sql']
+        self.assertNotIn('contenido', sql_relatos)
+        self.assertNotIn('descripcion', sql_relatos)
+
+        respuesta = APIClient().get(url, {'expand': 'contenido,participaciones'})
+        tarjeta = respuesta.data['results'][0]
+        self.assertEqual(tarjeta['contenido'], '<p>Contenido</p>')
+        self.assertEqual(len(tarjeta['participaciones']), 2)
+
+
+class PaginacionCursorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        autor = Usuario.objects.create_user(username='autor', password='Clave1234')
+        for i in range(14):
+            relato = Relato.objects.create(titulo=f"Relato {i}", descripcion="Descripción", estado='PUBLICADO')
+            ParticipacionRelato.objects.create(usuario=autor, relato=relato, orden=1)
+        # Misma fecha para varios relatos: el id debe desempatar
+        Relato.objects.filter(id__lte=Relato.objects.order_by('id')[5].id).update(
+            fecha_creacion=Relato.objects.order_by('id').first().fecha_creacion
+        )
+
+    def test_recorrer_por_cursor(self):
+        client = APIClient()
+        esperado = list(Relato.objects.order_by('-fecha_creacion', '-id').values_list('id', flat=True))
+
+        respuesta = client.get(reverse('relatos-publicados'), {'paginacion': 'cursor'})
+        self.assertNotIn('count', respuesta.data)
+        self.assertIsNone(respuesta.data['previous'])
+
+        vistos = []
+        while True:
+            vistos += [r['id'] for r in respuesta.data['results']]
+            if not respuesta.data['next']:
+                break
+            respuesta = client.get(respuesta.data['next'])
+        self.assertEqual(vistos, esperado)
+
+        # Y hacia atrás desde la última página
+        anterior = client.get(respuesta.data['previous'])
+        self.assertEqual([r['id'] for r in anterior.data['results']], esperado[6:12])
+
+    def test_numero_de_pagina_por_defecto(self):
+        respuesta = APIClient().get(reverse('relatos-publicados'), {'page': 2})
+        self.assertEqual(respuesta.data['count'], 14)
+        self.assertEqual(len(respuesta.data['results']), 6)
+
+
+class BusquedaRelatosTest(TestCase):
+
+    def publicar(self, titulo, descripcion, contenido, idioma):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Relato.objects.create(
+                titulo=titulo, descripcion=descripcion, contenido=contenido,
+                idioma=idioma, estado='PUBLICADO',
+            )
+
+    def buscar(self, consulta, **extra):
+        respuesta = APIClient().get(reverse('relatos-publicados'), {'search': consulta, **extra})
+        return [r['id'] for r in respuesta.data['results']]
+
+    def test_busqueda_por_idioma_y_relevancia(self):
+        en_titulo = self.publicar("Canciones del mar", "Una historia marinera", "<p>Olas</p>", 'es')
+        en_contenido = self.publicar("El faro", "Un faro en la costa", "<p>Sonaba una <b>canción</b></p>", 'es')
+        ingles = self.publicar("The runners", "Dogs running all night", "<p>Run</p>", 'en')
+        japones = self.publicar("東京物語", "東京の家族の話", "<p>東京</p>", 'ja')
+        self.publicar("Borrador", "Sin publicar", "canción", 'es')
+        Relato.objects.filter(titulo="Borrador").update(estado='CREACION')
+        with self.captureOnCommitCallbacks(execute=True):
+            Relato.objects.get(titulo="Borrador").save()
+
+        self.assertEqual(self.buscar("cancion"), [en_titulo.id, en_contenido.id])
+        self.assertEqual(self.buscar("run"), [ingles.id])
+        self.assertEqual(self.buscar("東京"), [japones.id])
+        self.assertEqual(self.buscar("faro", titulo__icontains="faro"), [en_contenido.id])
+        self.assertEqual(self.buscar("zzz"), [])
+
+    def test_reindexa_al_editar(self):
+        relato = self.publicar("Viaje", "Un viaje largo", "<p>Texto</p>", 'es')
+        relato.titulo = "Dragones"
+        with self.captureOnCommitCallbacks(execute=True):
+            relato.save()
+        self.assertEqual(self.buscar("dragon"), [relato.id])
+        self.assertEqual(self.buscar("viaje"), [relato.id])
+        self.assertEqual(self.buscar("viajes", titulo__icontains="viaje"), [])
+
+
+class CacheRelatoPublicadoTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = Usuario.objects.create_user(username='admin', password='Clave1234', is_superuser=True)
+        self.relato = Relato.objects.create(
+            titulo="Publicado", descripcion="Descripción larga", contenido="<p>Hola</p>", estado='PUBLICADO'
+        )
+        ParticipacionRelato.objects.create(usuario=self.admin, relato=self.relato, orden=1)
+        self.url = reverse('relatos-detalle-publico', args=[self.relato.id])
+
+    def test_etag_y_invalidacion(self):
+        client = APIClient()
+        primera = client.get(self.url)
+        etag = primera['ETag']
+        self.assertEqual(primera.data['titulo'], "Publicado")
+
+        with self.assertNumQueries(0):
+            segunda = client.get(self.url)
+            no_modificado = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(segunda.data, primera.data)
+        self.assertEqual(no_modificado.status_code, 304)
+
+        editor = APIClient()
+        editor.force_authenticate(self.admin)
+        editor.patch(reverse('moderador-editar-relato-final', args=[self.relato.id]),
+                     {'titulo': "Editado"}, format='json')
+
+        tercera = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(tercera.status_code, 200)
+        self.assertEqual(tercera.data['titulo'], "Editado")
+        self.assertNotEqual(tercera['ETag'], etag)
+
+        editor.delete(reverse('relatos-eliminar', args=[self.relato.id]))
+        self.assertEqual(client.get(self.url).status_code, 404)
+
+
+class EstadisticasIncrementalesTest(TestCase):
+    """
+    Las estadísticas se mantienen con deltas y deben coincidir con el
+    recuento completo (actualizar_estadisticas).
+    """
+
+    def setUp(self):
+        self.autor = Usuario.objects.create_user(username='autor', password='Clave1234')
+        self.coautor = Usuario.objects.create_user(username='coautor', password='Clave1234')
+        self.lector = Usuario.objects.create_user(username='lector', password='Clave1234')
+        self.relato = Relato.objects.create(
+            titulo="Relato", descripcion="Descripción", contenido="<p>Había una vez</p>", num_escritores=2
+        )
+        Estadistica.objects.create(relato=self.relato, num_colaboradores=1, total_palabras=3)
+        ParticipacionRelato.objects.create(usuario=self.autor, relato=self.relato, orden=1)
+
+    def cliente(self, usuario):
+        # Instancia nueva por cliente, como en una petición real
+        client = APIClient()
+        client.force_authenticate(Usuario.objects.get(pk=usuario.pk))
+        return client
+
+    def comprobar_reconciliado(self):
+        incremental = Estadistica.objects.values().get(relato=self.relato)
+        self.relato.refresh_from_db()
+        actualizar_estadisticas(self.relato)
+        self.assertEqual(Estadistica.objects.values().get(relato=self.relato), incremental)
+        return incremental
+
+    def test_deltas_coinciden_con_recuento(self):
+        id_ = self.relato.id
+        self.cliente(self.coautor).post(reverse('relatos-unirse', args=[id_]))
+        for usuario, texto in ((self.autor, "<p>un dos</p>"), (self.coautor, "<p>tres</p>")):
+            client = self.cliente(usuario)
+            client.put(reverse('relatos-mi-fragmento', args=[id_]), {'contenido_fragmento': texto}, format='json')
+            client.post(reverse('relatos-fragmento-ready', args=[id_]))
+        self.assertEqual(self.comprobar_reconciliado()['num_colaboradores'], 2)
+
+        lector = self.cliente(self.lector)
+        lector.post(reverse('votar-relato', args=[id_]), {'puntuacion': 2}, format='json')
+        self.cliente(self.autor).post(reverse('votar-relato', args=[id_]), {'puntuacion': 5}, format='json')
+        lector.post(reverse('votar-relato', args=[id_]), {'puntuacion': 4}, format='json')
+        comentario = lector.post(reverse('crear-comentario-relato', args=[id_]), {'texto': "Bien"}, format='json')
+        self.cliente(self.autor).post(reverse('crear-comentario-relato', args=[id_]), {'texto': "Gracias"}, format='json')
+        lector.delete(reverse('borrar-comentario', args=[id_, comentario.data['id']]))
+
+        estad = self.comprobar_reconciliado()
+        self.assertEqual(
+            ([estad[f'votos_{e}'] for e in Estadistica.ESTRELLAS], estad['promedio_votos']),
+            ([0, 0, 0, 1, 1], 4.5),
+        )
+        self.assertEqual(estad['num_comentarios'], 1)
+
+    def test_votar_no_depende_del_numero_de_votos(self):
+        self.relato.estado = 'PUBLICADO'
+        self.relato.save()
+        url = reverse('votar-relato', args=[self.relato.id])
+        self.cliente(self.lector).post(url, {'puntuacion': 3}, format='json')
+        for i in range(5):
+            votante = Usuario.objects.create_user(username=f'votante{i}', password='Clave1234')
+            Voto.objects.create(usuario=votante, relato=self.relato, puntuacion=4)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.cliente(self.lector).post(url, {'puntuacion': 1}, format='json')
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        self.assertNotIn('AVG', sql.upper())
+        self.assertNotIn('COUNT', sql.upper())
+
+    def test_recalculo_no_pisa_columnas_que_no_recalcula(self):
+        def otra_peticion_escribe(texto):
+            # Mientras se recuenta, otra petición cambia una columna que el recuento no toca
+            Estadistica.objects.filter(relato=self.relato).update(tiempo_total=F('tiempo_total') + 30)
+            return 3
+
+        with mock.patch('BookRoomAPI.utils.contar_palabras', side_effect=otra_peticion_escribe):
+            actualizar_estadisticas(self.relato)
+        estad = Estadistica.objects.get(relato=self.relato)
+        self.assertEqual((estad.tiempo_total, estad.total_palabras, estad.num_colaboradores), (30, 3, 1))
+
+    def test_primer_voto_simultaneo(self):
+        self.relato.estado = 'PUBLICADO'
+        self.relato.save()
+        get = QuerySet.get
+
+        def otra_peticion_vota_antes(queryset, *args, **kwargs):
+            # Entre el SELECT y el INSERT de esta petición, otra guarda el primer voto del mismo usuario
+            if queryset.model is Voto and not Voto.objects.filter(usuario=self.lector).exists():
+                Voto.objects.create(usuario=self.lector, relato=self.relato, puntuacion=2)
+                registrar_voto_estadisticas(self.relato.id, 2)
+                raise Voto.DoesNotExist
+            return get(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'get', autospec=True, side_effect=otra_peticion_vota_antes):
+            respuesta = self.cliente(self.lector).post(
+                reverse('votar-relato', args=[self.relato.id]), {'puntuacion': 5}, format='json'
+            )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(Voto.objects.get(usuario=self.lector).puntuacion, 5)
+        self.assertEqual(Estadistica.objects.get(relato=self.relato).distribucion(), {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+
+class ColaRecalculoTest(TestCase):
+
+    def setUp(self):
+        self.lector = Usuario.objects.create_user(username='lector', password='Clave1234')
+        self.relato = Relato.objects.create(titulo="Relato", descripcion="Descripción", estado='PUBLICADO')
+        # Desvío que el recálculo debe corregir
+        Estadistica.objects.create(relato=self.relato, num_comentarios=99)
+
+    def test_cola_local_agrupa_peticiones(self):
+        otro = Relato.objects.create(titulo="Otro", descripcion="Descripción")
+        cola = ColaLocal(segundos=30, iniciar_worker=False)
+        for relato_id in (self.relato.id, self.relato.id, otro.id, self.relato.id):
+            cola.encolar(relato_id)
+
+        self.assertEqual(cola.procesar_pendientes(), 0)
+        self.assertEqual(cola.procesar_pendientes(ahora=time.monotonic() + 31), 2)
+        self.assertEqual(Estadistica.objects.get(relato=self.relato).num_comentarios, 0)
+        self.assertTrue(Estadistica.objects.filter(relato=otro).exists())
+
+    @override_settings(ESTADISTICAS_BROKER='db')
+    def test_cola_bd_desde_las_vistas(self):
+        client = APIClient()
+        client.force_authenticate(self.lector)
+        url = reverse('votar-relato', args=[self.relato.id])
+        for puntuacion in (3, 4, 5):
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post(url, {'puntuacion': puntuacion}, format='json')
+        self.assertEqual(RecalculoEstadistica.objects.filter(relato=self.relato).count(), 1)
+
+        RecalculoEstadistica.objects.update(programado_para=timezone.now())
+        call_command('procesar_recalculos', '--una-vez', stdout=StringIO())
+        self.assertFalse(RecalculoEstadistica.objects.exists())
+        estad = Estadistica.objects.get(relato=self.relato)
+        self.assertEqual((estad.num_comentarios, estad.num_votos, estad.promedio_votos), (0, 1, 5.0))
+
+
+class RankingUsuariosTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuarios = [
+            Usuario.objects.create_user(username=f'escritor{i}', password='Clave1234') for i in range(4)
+        ]
+
+    def test_top_y_posicion(self):
+        a, b, c, d = self.usuarios
+        sumar_puntos(PuntuacionRanking.PALABRAS, [a.id], 50)
+        sumar_puntos(PuntuacionRanking.PALABRAS, [b.id, c.id], 80)
+        sumar_puntos(PuntuacionRanking.PALABRAS, [a.id], 10)
+        # Puntos de una semana pasada: cuentan en el total pero no en la semana actual
+        PuntuacionRanking.objects.create(
+            usuario=d, metrica=PuntuacionRanking.PALABRAS, periodo=PuntuacionRanking.SEMANA,
+            inicio_periodo=inicio_periodo(PuntuacionRanking.SEMANA) - timedelta(days=7), puntos=500,
+        )
+
+        url = reverse('ranking-usuarios')
+        respuesta = APIClient().get(url, {'filtro': 'palabras', 'periodo': 'semana'})
+        self.assertEqual(
+            [(u['username'], u['puntos'], u['posicion']) for u in respuesta.data],
+            [('escritor1', 80, 1), ('escritor2', 80, 1), ('escritor0', 60, 3)],
+        )
+        with self.assertNumQueries(0):
+            APIClient().get(url, {'filtro': 'palabras', 'periodo': 'semana'})
+        # Los usuarios sin puntos no rellenan la lista aunque quepan en el límite
+        respuesta = APIClient().get(url, {'filtro': 'palabras', 'limite': 10})
+        self.assertNotIn('escritor3', [u['username'] for u in respuesta.data])
+        self.assertEqual(len(respuesta.data), 3)
+
+        posicion = reverse('ranking-usuarios-posicion')
+        respuesta = APIClient().get(posicion, {'filtro': 'palabras', 'periodo': 'mes', 'usuario': a.id})
+        self.assertEqual((respuesta.data['posicion'], respuesta.data['puntos']), (3, 60))
+        respuesta = APIClient().get(posicion, {'filtro': 'palabras', 'usuario': d.id})
+        self.assertIsNone(respuesta.data['posicion'])
+        # Lo que acaba de sumar se ve en la posición al momento: no depende de la caché
+        sumar_puntos(PuntuacionRanking.PALABRAS, [a.id], 30)
+        respuesta = APIClient().get(posicion, {'filtro': 'palabras', 'periodo': 'mes', 'usuario': a.id})
+        self.assertEqual((respuesta.data['posicion'], respuesta.data['puntos']), (1, 90))
+
+    def test_votos_suman_al_ranking(self):
+        autor, lector = self.usuarios[:2]
+        relato = Relato.objects.create(titulo="Relato", descripcion="Descripción", estado='PUBLICADO')
+        Estadistica.objects.create(relato=relato)
+        ParticipacionRelato.objects.create(usuario=autor, relato=relato, orden=1)
+        client = APIClient()
+        client.force_authenticate(lector)
+        for puntuacion in (3, 5):
+            client.post(reverse('votar-relato', args=[relato.id]), {'puntuacion': puntuacion}, format='json')
+
+        self.assertEqual(
+            set(PuntuacionRanking.objects.filter(usuario=autor).values_list('periodo', 'puntos')),
+            {('semana', 1), ('mes', 1), ('total', 1)},
+        )
+
+
+class ContadoresUsuarioTest(TestCase):
+    """Subir los contadores de los autores es un solo UPDATE, haya los autores que haya."""
+
+    def setUp(self):
+        self.autores = [Usuario.objects.create_user(username=f'autor{i}', password='Clave1234') for i in range(4)]
+        self.lector = Usuario.objects.create_user(username='lector', password='Clave1234')
+        self.relato = Relato.objects.create(titulo="Relato", descripcion="Descripción", num_escritores=4, estado='EN_PROCESO')
+        Estadistica.objects.create(relato=self.relato)
+        for i, autor in enumerate(self.autores):
+            ParticipacionRelato.objects.create(
+                usuario=autor, relato=self.relato, orden=i + 1, contenido_fragmento="<p>uno dos</p>",
+                listo_para_publicar=i > 0,
+            )
+
+    def updates_de_usuarios(self, queries):
+        return [q for q in queries.captured_queries if q['sql'].startswith('UPDATE') and 'BookRoomAPI_usuario' in q['sql'].split('SET')[0]]
+
+    def test_publicar_y_votar(self):
+        client = APIClient()
+        client.force_authenticate(Usuario.objects.get(pk=self.autores[0].pk))
+        with CaptureQueriesContext(connection) as queries:
+            client.post(reverse('relatos-fragmento-ready', args=[self.relato.id]))
+        # Palabras del que marca el fragmento + relatos publicados de los 4 autores
+        self.assertEqual(len(self.updates_de_usuarios(queries)), 2)
+
+        client = APIClient()
+        client.force_authenticate(self.lector)
+        with CaptureQueriesContext(connection) as queries:
+            client.post(reverse('votar-relato', args=[self.relato.id]), {'puntuacion': 4}, format='json')
+        self.assertEqual(len(self.updates_de_usuarios(queries)), 1)
+
+        self.assertEqual(
+            list(Usuario.objects.filter(pk__in=[a.pk for a in self.autores]).order_by('pk').values_list(
+                'total_relatos_publicados', 'total_votos_recibidos', 'total_palabras_escritas')),
+            [(1, 1, 2), (1, 1, 0), (1, 1, 0), (1, 1, 0)],
+        )
+        self.assertEqual(PuntuacionRanking.objects.filter(metrica=PuntuacionRanking.RELATOS, puntos=1).count(), 12)
+
+    def test_contador_desconocido(self):
+        with self.assertRaises(ValueError):
+            incrementar_contadores([self.lector.id], total_amigos=1)
+        incrementar_contador_por_usuario('total_tiempo_escritura', {self.lector.id: 30, self.autores[0].id: 5})
+        self.lector.refresh_from_db()
+        self.assertEqual(self.lector.total_tiempo_escritura, 30)
+
+
+class TopRelatosTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def relato_con_votos(self, titulo, puntuaciones, **campos):
+        relato = Relato.objects.create(titulo=titulo, descripcion="Descripción", estado='PUBLICADO', **campos)
+        Estadistica.objects.create(relato=relato)
+        for i, puntuacion in enumerate(puntuaciones):
+            votante, _ = Usuario.objects.get_or_create(username=f'votante{i}')
+            Voto.objects.create(usuario=votante, relato=relato, puntuacion=puntuacion)
+            registrar_voto_estadisticas(relato.id, puntuacion)
+        return relato
+
+    def titulos(self, **params):
+        return [e['titulo'] for e in APIClient().get(reverse('listar-estadisticas'), params).data]
+
+    def test_media_bayesiana_y_rebanadas(self):
+        self.relato_con_votos("Un solo cinco", [5], idioma='es', generos='terror')
+        self.relato_con_votos("Muchos buenos", [5, 5, 4, 5, 4, 5, 5, 4, 5, 5], idioma='en', generos='fantasia')
+        self.relato_con_votos("Sin votos", [], idioma='es', generos='terror')
+
+        self.assertEqual(self.titulos(), ["Muchos buenos", "Un solo cinco"])
+        self.assertEqual(self.titulos(idioma='es'), ["Un solo cinco"])
+        self.assertEqual(self.titulos(genero='fantasia'), ["Muchos buenos"])
+        self.assertEqual(APIClient().get(reverse('listar-estadisticas'), {'idioma': 'xx'}).status_code, 400)
+
+        # La puntuación incremental coincide con el recuento completo
+        estad = Estadistica.objects.get(relato__titulo="Muchos buenos")
+        actualizar_estadisticas(estad.relato)
+        self.assertAlmostEqual(Estadistica.objects.get(pk=estad.pk).puntuacion_ranking, estad.puntuacion_ranking)
+
+        with self.assertNumQueries(0):
+            self.titulos()
+
+    def test_distribucion_con_cambio_de_voto(self):
+        relato = self.relato_con_votos("Relato", [5, 4, 4, 1])
+        votante = Usuario.objects.get(username='votante0')
+        client = APIClient()
+        client.force_authenticate(votante)
+        client.post(reverse('votar-relato', args=[relato.id]), {'puntuacion': 2}, format='json')
+
+        with self.assertNumQueries(1):
+            respuesta = APIClient().get(reverse('distribucion-votos-relato', args=[relato.id]))
+        self.assertEqual(respuesta.data['num_votos'], 4)
+        self.assertEqual(respuesta.data['promedio_votos'], 2.75)
+        self.assertEqual([d['votos'] for d in respuesta.data['distribucion']], [1, 1, 0, 2, 0])
+        self.assertEqual(respuesta.data['distribucion'][3]['porcentaje'], 50.0)
+
+
+class ListarComentariosQueriesTest(TestCase):
+    """Listar comentarios cuesta lo mismo con 2 que con 8 comentarios (relato + comentarios + votos + amigos)."""
+
+    def setUp(self):
+        cache.clear()
+        self.lector = Usuario.objects.create_user(username='lector', password='Clave1234')
+        self.relato = Relato.objects.create(titulo="Relato", descripcion="Descripción", estado='PUBLICADO')
+        self.url = reverse('listar-comentarios-relato', args=[self.relato.id])
+        self.client = APIClient()
+        self.client.force_authenticate(self.lector)
+
+    def comentar(self, cantidad):
+        for _ in range(cantidad):
+            i = Usuario.objects.count()
+            autor = Usuario.objects.create_user(username=f'autor{i}', password='Clave1234')
+            comentario = Comentario.objects.create(usuario=autor, relato=self.relato, texto=f"Comentario {i}")
+            if i % 2:
+                PeticionAmistad.objects.create(de_usuario=autor, a_usuario=self.lector, estado='ACEPTADA')
+                ComentarioVoto.objects.create(usuario=self.lector, comentario=comentario, valor=1)
+
+    def test_numero_de_queries_constante(self):
+        self.comentar(2)
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+
+        self.comentar(6)
+        with self.assertNumQueries(4):
+            respuesta = self.client.get(self.url)
+        self.assertEqual((len(respuesta.data['amigos']), len(respuesta.data['otros'])), (4, 4))
+        self.assertTrue(all(c['mi_voto'] == 1 for c in respuesta.data['amigos']))
+        self.assertTrue(all(c['mi_voto'] == 0 for c in respuesta.data['otros']))
+        self.assertEqual(set(respuesta.data['otros'][0]['usuario']), {'id', 'username', 'avatar', 'rol', 'rol_nombre'})
+
+        with self.assertNumQueries(2):
+            anonimo = APIClient().get(self.url)
+        self.assertEqual(len(anonimo.data['otros']), 8)
+
+    def test_feed_amigos_primero_por_cursor(self):
+        self.comentar(7)
+        esperado = (
+            list(Comentario.objects.filter(usuario__username__in=['autor1', 'autor3', 'autor5', 'autor7'])
+                 .order_by('-fecha', '-id').values_list('id', flat=True)) +
+            list(Comentario.objects.filter(usuario__username__in=['autor2', 'autor4', 'autor6'])
+                 .order_by('-fecha', '-id').values_list('id', flat=True))
+        )
+        url = reverse('feed-comentarios-relato', args=[self.relato.id])
+
+        vistos = []
+        respuesta = self.client.get(url, {'page_size': 3})
+        while True:
+            vistos += [(c['id'], c['es_amigo'], c['mi_voto']) for c in respuesta.data['results']]
+            if not respuesta.data['next']:
+                break
+            # Los amigos ya salen de la caché: relato + comentarios + mis votos
+            with self.assertNumQueries(3):
+                respuesta = self.client.get(respuesta.data['next'])
+        self.assertEqual([c[0] for c in vistos], esperado)
+        self.assertEqual([c[1] for c in vistos], [True] * 4 + [False] * 3)
+        self.assertEqual([c[2] for c in vistos], [1] * 4 + [0] * 3)
+
+        por_votos = self.client.get(url, {'orden': 'votos', 'paginacion': 'paginas'})
+        self.assertEqual(por_votos.data['count'], 7)
+
+
+class AmistadesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ana, self.luis, self.eva = (
+            Usuario.objects.create_user(username=nombre, password='Clave1234') for nombre in ('ana', 'luis', 'eva')
+        )
+
+    def cliente(self, usuario):
+        client = APIClient()
+        client.force_authenticate(Usuario.objects.get(pk=usuario.pk))
+        return client
+
+    def hacer_amigos(self, de, a):
+        self.cliente(de).post('/api/amigos/enviar/', {'a_usuario': a.id}, format='json')
+        solicitud = PeticionAmistad.objects.get(de_usuario=de, a_usuario=a)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente(a).post(f'/api/amigos/aceptar/{solicitud.id}/')
+        return solicitud
+
+    def test_aceptar_eliminar_y_bloquear(self):
+        self.hacer_amigos(self.ana, self.luis)
+        self.assertEqual(
+            set(Amistad.objects.values_list('usuario__username', 'amigo__username')),
+            {('ana', 'luis'), ('luis', 'ana')},
+        )
+        self.assertEqual((ids_amigos(self.ana.id), ids_amigos(self.luis.id)), ({self.luis.id}, {self.ana.id}))
+        # Segunda vez desde la caché
+        with self.assertNumQueries(0):
+            self.assertTrue(son_amigos(self.ana.id, self.luis.id))
+        self.assertEqual([u['username'] for u in self.cliente(self.ana).get('/api/amigos/').data], ['luis'])
+        self.assertEqual(self.cliente(self.ana).get(reverse('perfil-usuario', args=[self.luis.id])).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente(self.luis).delete(f'/api/amigos/eliminar/{self.ana.id}/')
+        self.assertFalse(Amistad.objects.exists())
+        self.assertEqual(ids_amigos(self.ana.id), frozenset())
+        self.assertEqual(self.cliente(self.ana).get(reverse('perfil-usuario', args=[self.luis.id])).status_code, 403)
+
+        # Bloquear una solicitud aceptada también deshace la amistad
+        solicitud = self.hacer_amigos(self.eva, self.ana)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente(self.ana).post(f'/api/amigos/bloquear/{solicitud.id}/')
+        self.assertFalse(son_amigos(self.eva.id, self.ana.id))
+        self.assertFalse(Amistad.objects.exists())
+
+    def test_reconstruir_amistades(self):
+        self.hacer_amigos(self.ana, self.luis)
+        self.hacer_amigos(self.eva, self.ana)
+        Amistad.objects.all().delete()
+        call_command('reconstruir_amistades', stdout=StringIO())
+        self.assertEqual(Amistad.objects.count(), 4)
+        self.assertEqual(ids_amigos(self.ana.id), {self.luis.id, self.eva.id})
+
+
+class RedAmistadesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.u = {
+            nombre: Usuario.objects.create_user(username=nombre, password='Clave1234')
+            for nombre in ('ana', 'luis', 'eva', 'pablo', 'marta', 'jorge', 'sara')
+        }
+        for de, a in (('ana', 'luis'), ('eva', 'ana'), ('luis', 'pablo'), ('luis', 'marta'), ('pablo', 'eva'), ('luis', 'sara')):
+            PeticionAmistad.objects.create(de_usuario=self.u[de], a_usuario=self.u[a], estado='ACEPTADA')
+        relato = Relato.objects.create(titulo="Relato", descripcion="Descripción", num_escritores=2)
+        ParticipacionRelato.objects.create(usuario=self.u['ana'], relato=relato, orden=1)
+        ParticipacionRelato.objects.create(usuario=self.u['jorge'], relato=relato, orden=2)
+        # Pendiente con marta y bloqueo de sara: no se sugieren
+        PeticionAmistad.objects.create(de_usuario=self.u['ana'], a_usuario=self.u['marta'])
+        PeticionAmistad.objects.create(de_usuario=self.u['sara'], a_usuario=self.u['ana'], estado='BLOQUEADA')
+
+    def test_amigos_de_amigos_y_coautores(self):
+        client = APIClient()
+        client.force_authenticate(self.u['ana'])
+        url = reverse('sugerencias-amistad')
+        respuesta = client.get(url)
+        self.assertEqual(
+            [(s['username'], s['amigos_comunes'], s['relatos_comunes']) for s in respuesta.data],
+            [('pablo', 2, 0), ('jorge', 0, 1)],
+        )
+        # En caché: solo se leen los usuarios
+        with self.assertNumQueries(1):
+            client.get(url)
+
+        # Hacerse amiga de pablo lo quita de las sugerencias al momento
+        PeticionAmistad.objects.create(de_usuario=self.u['pablo'], a_usuario=self.u['ana'], estado='ACEPTADA')
+        self.assertEqual([s['username'] for s in client.get(url).data], ['jorge'])
+
+    def test_estados_relacion_en_bloque(self):
+        client = APIClient()
+        client.force_authenticate(self.u['ana'])
+        ids = [self.u[n].id for n in ('ana', 'luis', 'pablo', 'marta', 'sara', 'jorge')]
+        # PeticionAmistad + amigos de todos (no estaban en caché)
+        with self.assertNumQueries(2):
+            respuesta = client.post(reverse('estados-relacion'), {'usuarios': ids}, format='json')
+        self.assertEqual(
+            {nombre: tuple(respuesta.data[self.u[nombre].id].values()) for nombre in ('ana', 'luis', 'pablo', 'marta', 'sara', 'jorge')},
+            {
+                'ana': ('yo', 0), 'luis': ('amigo', 0), 'pablo': ('ninguna', 2),
+                'marta': ('solicitud_enviada', 1), 'sara': ('ninguna', 1), 'jorge': ('ninguna', 0),
+            },
+        )
+        with self.assertNumQueries(1):
+            client.post(reverse('estados-relacion'), {'usuarios': ids}, format='json')
+
+        encontrados = client.get('/api/usuarios/buscar/', {'q': 'pab', 'relacion': 'true'}).data['results']
+        self.assertEqual([(u['username'], u['relacion'], u['amigos_comunes']) for u in encontrados], [('pablo', 'ninguna', 2)])
+
+
+class BusquedaUsuariosTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.lector = Usuario.objects.create_user(username='lector', password='Clave1234')
+        for nombre in ('mariana', 'anabel', 'ana', 'Ánade', 'juana', 'anatomia', 'pedro'):
+            Usuario.objects.create_user(username=nombre, password='Clave1234')
+        PeticionAmistad.objects.create(
+            de_usuario=Usuario.objects.get(username='anatomia'), a_usuario=self.lector, estado='BLOQUEADA'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.lector)
+
+    def test_exactos_prefijos_y_trigramas_paginados(self):
+        url = '/api/usuarios/buscar/'
+        respuesta = self.client.get(url, {'q': 'ANA', 'page_size': 3})
+        self.assertEqual(respuesta.data['count'], 5)
+        self.assertEqual([u['username'] for u in respuesta.data['results']], ['ana', 'Ánade', 'anabel'])
+        siguiente = self.client.get(respuesta.data['next'])
+        self.assertEqual([u['username'] for u in siguiente.data['results']], ['juana', 'mariana'])
+
+        self.assertEqual(self.client.get(url, {'q': 'an'}).data['count'], 0)
+        # Cambiar el username rehace sus trigramas
+        pedro = Usuario.objects.get(username='pedro')
+        pedro.username = 'pedro_banana'
+        pedro.save()
+        self.assertEqual(self.client.get(url, {'q': 'anana'}).data['results'][0]['username'], 'pedro_banana')
+
+    def test_reindexar_usuarios(self):
+        TrigramaUsuario.objects.all().delete()
+        Usuario.objects.update(username_normalizado='')
+        call_command('reindexar_usuarios', stdout=StringIO())
+        self.assertEqual(self.client.get('/api/usuarios/buscar/', {'q': 'ana'}).data['count'], 5)
+
+
+class IndiceUsuariosTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.lector = Usuario.objects.create_user(username='lector', password='Clave1234')
+        for nombre in ('mariana', 'anabel', 'ana', 'Ánade', 'anatomia'):
+            Usuario.objects.create_user(username=nombre, password='Clave1234')
+        PeticionAmistad.objects.create(
+            de_usuario=Usuario.objects.get(username='anatomia'), a_usuario=self.lector, estado='BLOQUEADA'
+        )
+        self.addCleanup(setattr, indice_usuarios, '_indice', None)
+        self.client = APIClient()
+        self.client.force_authenticate(self.lector)
+
+    def test_buscar_agregar_y_quitar(self):
+        indice = indice_usuarios.IndiceUsuarios([(1, 'ana'), (2, 'Ánade'), (3, 'mariana'), (4, 'ANABEL')])
+        self.assertEqual(indice.buscar('AN'), [(1, 'ana'), (4, 'ANABEL'), (2, 'Ánade')])
+        self.assertEqual(indice.buscar('án', limite=2, excluir={1}), [(4, 'ANABEL'), (2, 'Ánade')])
+        self.assertEqual(indice.buscar(''), [])
+        indice.agregar(5, 'anaconda')
+        indice.quitar(4)
+        self.assertEqual([u for _, u in indice.buscar('ana')], ['ana', 'anaconda', 'Ánade'])
+        # Repetir un alta no la duplica y un cambio de nombre sustituye la clave anterior
+        indice.agregar(5, 'anaconda')
+        indice.agregar(1, 'Ana')
+        self.assertEqual(indice.buscar('ana'), [(1, 'Ana'), (5, 'anaconda'), (2, 'Ánade')])
+        # Solo se mueve con lo leído de la base de datos
+        self.assertEqual(indice.ultimo_id, 4)
+
+    @override_settings(USUARIOS_INDICE_REFRESCO_SEGUNDOS=0)
+    def test_refresco_no_pierde_altas_de_otros_procesos(self):
+        indice_usuarios._cargar()
+        # "anita" llega de otro proceso (aquí no se ejecuta su señal); "anacleto", id mayor, de este
+        anita = Usuario.objects.create_user(username='anita', password='Clave1234')
+        with self.captureOnCommitCallbacks(execute=True):
+            anacleto = Usuario.objects.create_user(username='anacleto', password='Clave1234')
+        with self.assertNumQueries(1):
+            indice = indice_usuarios.obtener_indice()
+        # Una sola vez cada uno, aunque anacleto ya estuviera por su señal
+        self.assertEqual(indice.buscar('anac'), [(anacleto.id, 'anacleto')])
+        self.assertEqual(indice.buscar('ani'), [(anita.id, 'anita')])
+        self.assertEqual(indice.ultimo_id, anacleto.id)
+
+        # Un alta con id menor que el último leído (se confirmó más tarde) entra por el solape
+        indice.quitar(anita.id)
+        indice_usuarios.obtener_indice()
+        self.assertEqual(indice.buscar('ani'), [(anita.id, 'anita')])
+
+    def test_autocompletar_sin_queries_a_la_base_de_datos(self):
+        indice_usuarios._indice = indice_usuarios.IndiceUsuarios(Usuario.objects.values_list('pk', 'username'))
+        indice_usuarios._revisado = time.monotonic()
+        url = reverse('autocompletar-usuarios')
+        self.client.get(url, {'q': 'a'})  # calienta la caché de bloqueados
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(url, {'q': 'AN', 'limite': 3})
+        self.assertEqual([u['username'] for u in respuesta.data], ['ana', 'anabel', 'Ánade'])
+
+        # Las señales lo mantienen al día al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = Usuario.objects.create_user(username='anaconda', password='Clave1234')
+        with self.captureOnCommitCallbacks(execute=True):
+            Usuario.objects.filter(username='ana').delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            mariana = Usuario.objects.get(username='mariana')
+            mariana.username = 'anamaria'
+            mariana.save()
+        respuesta = self.client.get(url, {'q': 'ana'})
+        self.assertEqual(
+            [u['username'] for u in respuesta.data], ['anabel', 'anaconda', 'Ánade', 'anamaria']
+        )
+        self.assertEqual(respuesta.data[1]['id'], nuevo.id)
+
+        # Solo cambian mayúsculas: el normalizado es el mismo pero el nombre que se muestra no
+        with self.captureOnCommitCallbacks(execute=True):
+            anabel = Usuario.objects.get(username='anabel')
+            anabel.username = 'AnaBel'
+            anabel.save()
+        self.assertEqual(self.client.get(url, {'q': 'anab'}).data, [{'id': anabel.id, 'username': 'AnaBel'}])
+
+        # Guardar sin tocar el username no cambia la versión (los demás procesos no se reconstruyen)
+        version = cache.get(indice_usuarios.CLAVE_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            anabel = Usuario.objects.get(pk=anabel.pk)
+            anabel.biografia = 'Hola'
+            anabel.save()
+        self.assertEqual(cache.get(indice_usuarios.CLAVE_VERSION), version)
+
+    @override_settings(USUARIOS_INDICE_MEMORIA=False)
+    def test_autocompletar_sin_indice_usa_la_base_de_datos(self):
+        respuesta = self.client.get(reverse('autocompletar-usuarios'), {'q': 'an'})
+        self.assertEqual([u['username'] for u in respuesta.data], ['ana', 'anabel', 'Ánade'])
+
+
+class CacheTokensTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username='lector', password='Clave1234')
+        aplicacion = Application.objects.create(
+            name='BookRoomAPI', client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+        )
+        self.token = AccessToken.objects.create(
+            user=self.usuario, application=aplicacion, token='token-de-prueba',
+            expires=timezone.now() + timedelta(hours=1), scope='read write',
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer token-de-prueba')
+
+    def consultas_token(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('obtener_perfil'))
+        self.assertEqual(respuesta.status_code, 200)
+        return [q['sql'] for q in consultas.captured_queries if 'oauth2_provider_accesstoken' in q['sql']]
+
+    def test_segunda_peticion_sin_consultar_el_token(self):
+        self.assertEqual(len(self.consultas_token()), 1)
+        self.assertEqual(self.consultas_token(), [])
+        otro = APIClient()
+        otro.credentials(HTTP_AUTHORIZATION='Bearer otro')
+        self.assertEqual(otro.get(reverse('obtener_perfil')).status_code, 401)
+        self.assertEqual(metricas.resumen()['tokens'], {
+            'aciertos': 1, 'fallos': 1, 'rechazados': 1, 'purgados': 0, 'tasa_aciertos': 0.5,
+        })
+
+        # El WebSocket comparte la misma caché
+        self.assertEqual(async_to_sync(TokenAuthMiddleware(None).get_user)('token-de-prueba'), self.usuario)
+
+    def test_logout_y_cambios_invalidan_la_cache(self):
+        self.consultas_token()
+        usuario = Usuario.objects.get(pk=self.usuario.pk)
+        usuario.biografia = 'Nueva biografía'
+        with self.captureOnCommitCallbacks(execute=True):
+            usuario.save()
+        self.assertEqual(len(self.consultas_token()), 1)
+        self.assertEqual(self.client.get(reverse('obtener_perfil')).data['biografia'], 'Nueva biografía')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('logout_usuario')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('obtener_perfil')).status_code, 401)
+        self.assertIsNone(resolver_token('token-de-prueba'))
+
+    def test_ttl_corto_con_cache_del_proceso(self):
+        # Con locmem el logout no llega a otros workers: la copia dura poco
+        with mock.patch('BookRoomAPI.cache_tokens.cache') as falsa:
+            falsa.get.return_value = None
+            resolver_token('token-de-prueba')
+            self.assertEqual(falsa.set.call_args.args[2], settings.TOKENS_CACHE_TTL_LOCAL)
+            directorio = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, directorio, True)
+            compartida = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                      'LOCATION': directorio}}
+            with override_settings(CACHES={**settings.CACHES, **compartida}):
+                resolver_token('token-de-prueba')
+            self.assertEqual(falsa.set.call_args.args[2], settings.TOKENS_CACHE_TTL)
+
+    def test_token_caducado(self):
+        AccessToken.objects.filter(pk=self.token.pk).update(expires=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(resolver_token('token-de-prueba'))
+        self.assertEqual(self.client.get(reverse('obtener_perfil')).status_code, 401)
+
+    def test_caducidad_forzada_y_purga_invalidan_la_cache(self):
+        resolver_token('token-de-prueba')
+        token = AccessToken.objects.get(pk=self.token.pk)
+        token.expires = timezone.now() - timedelta(seconds=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            token.save()
+        self.assertIsNone(resolver_token('token-de-prueba'))
+
+        # Caducado con UPDATE (sin señales) y purgado: la purga lo quita de la caché
+        token.expires = timezone.now() + timedelta(hours=1)
+        token.save()
+        resolver_token('token-de-prueba')
+        AccessToken.objects.filter(pk=self.token.pk).update(expires=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purgar_tokens_caducados(pausa=0), 1)
+        self.assertIsNone(cache.get(f"token:{token.token_checksum}"))
+
+    def test_metricas_solo_para_administradores(self):
+        self.client.credentials()
+        self.client.force_authenticate(self.usuario)
+        self.assertEqual(self.client.get(reverse('admin-metricas')).status_code, 403)
+        admin = Usuario.objects.create_superuser(username='admin', password='Clave1234')
+        self.client.force_authenticate(admin)
+        self.assertIn('tokens', self.client.get(reverse('admin-metricas')).data)
+
+
+class TokensTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username='lector', password='Clave1234')
+        self.aplicacion = Application.objects.create(
+            name='BookRoomAPI', client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+        )
+        ahora = timezone.now()
+        for i in range(7):
+            self.crear_token(f'caducado-{i}', ahora - timedelta(hours=i + 1))
+        self.vigente = self.crear_token('vigente', ahora + timedelta(hours=1))
+
+    def crear_token(self, token, expires):
+        return AccessToken.objects.create(
+            user=self.usuario, application=self.aplicacion, token=token, expires=expires, scope='read write',
+        )
+
+    def test_purga_por_lotes(self):
+        # 3 lotes (3 + 3 + 1): SELECT de ids + DELETE en cada uno, sin tocar el vigente
+        self.assertEqual(purgar_tokens_caducados(lote=3, pausa=0), 7)
+        self.assertEqual(list(AccessToken.objects.values_list('token', flat=True)), ['vigente'])
+        self.assertEqual(metricas.resumen()['tokens']['purgados'], 7)
+        self.assertEqual(purgar_tokens_caducados(lote=3, pausa=0), 0)
+
+    def test_comando_guarda_la_metrica(self):
+        salida = StringIO()
+        call_command('purgar_tokens', '--margen-horas', '3.5', '--pausa', '0', stdout=salida)
+        self.assertEqual(AccessToken.objects.count(), 4)
+        metrica = MetricaTokens.objects.get()
+        self.assertEqual((metrica.total, metrica.activos, metrica.purgados), (4, 1, 4))
+
+        admin = Usuario.objects.create_superuser(username='admin', password='Clave1234')
+        client = APIClient()
+        client.force_authenticate(admin)
+        self.assertEqual(client.get(reverse('admin-metricas-tokens')).data[0]['total'], 4)
+
+    def test_login_reutiliza_el_token_vigente(self):
+        aplicacion_oauth()
+        # Usuario (authenticate) + token vigente por el índice: la Application ya está en memoria
+        with self.assertNumQueries(2):
+            respuesta = self.client.post(reverse('login_usuario'), {'username': 'lector', 'password': 'Clave1234'})
+        self.assertEqual(respuesta.data['access_token'], 'vigente')
+
+        # A punto de caducar no se reutiliza: se emite uno nuevo
+        AccessToken.objects.filter(pk=self.vigente.pk).update(expires=timezone.now() + timedelta(minutes=5))
+        self.assertNotEqual(emitir_token(self.usuario).token, 'vigente')
+
+    def test_aplicacion_cacheada_y_refrescada_al_cambiar(self):
+        self.assertEqual(aplicacion_oauth(), self.aplicacion)
+        with self.assertNumQueries(0):
+            aplicacion_oauth()
+        self.aplicacion.delete()
+        with self.assertRaises(Http404):
+            aplicacion_oauth()
+
+
+# Recarga de un intento por minuto: ningún cubo se rellena durante el test aunque el hasher sea lento
+@override_settings(
+    THROTTLE_LIMITES={'login_ip': (3, 1), 'login_usuario': (2, 1), 'registro_ip': (1, 1)},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class ThrottleLoginTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['throttle'].clear()
+        # Los cubos no se deshacen con la transacción del test: que no afecten a otros tests de login
+        self.addCleanup(caches['throttle'].clear)
+        Usuario.objects.create_user(username='lector', password='Clave1234')
+
+    def login(self, username, ip):
+        return self.client.post(
+            reverse('login_usuario'), {'username': username, 'password': 'mala'}, REMOTE_ADDR=ip,
+        )
+
+    def test_cubo_de_tokens(self):
+        # 2 seguidos, después uno por segundo
+        self.assertEqual([consumir('prueba', 2, 1, ahora=100) for _ in range(3)], [0, 0, 1])
+        self.assertEqual(consumir('prueba', 2, 1, ahora=100.5), 0.5)
+        self.assertEqual(consumir('prueba', 2, 1, ahora=101), 0)
+
+    def test_muchas_ips_no_vacian_los_cubos_agotados(self):
+        self.assertEqual(consumir('agotado', 1, 1 / 60), 0)
+        self.assertGreater(consumir('agotado', 1, 1 / 60), 0)
+        for i in range(1000):
+            consumir(f'ip-{i}', 1, 1 / 60)
+        self.assertGreater(consumir('agotado', 1, 1 / 60), 0)
+
+    def test_limite_por_usuario_y_por_ip(self):
+        # El mismo usuario desde dos IPs: al tercer intento, 429 sin llegar a authenticate()
+        self.assertEqual(self.login('lector', '10.0.0.1').status_code, 401)
+        self.assertEqual(self.login('LECTOR', '10.0.0.2').status_code, 401)
+        with mock.patch('BookRoomAPI.views.auth_views.authenticate') as authenticate:
+            respuesta = self.login('lector', '10.0.0.3')
+        authenticate.assert_not_called()
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta['Retry-After'], '60')
+
+        # Una IP: usuarios distintos hasta agotar su cubo
+        self.assertEqual(self.login('otro', '10.0.0.1').status_code, 401)
+        self.assertEqual(self.login('otro2', '10.0.0.1').status_code, 401)
+        self.assertEqual(self.login('otro3', '10.0.0.1').status_code, 429)
+
+        contadores = metricas.resumen()['throttle']
+        self.assertEqual(contadores['login_usuario.rechazadas'], 1)
+        self.assertEqual(contadores['login_ip.rechazadas'], 1)
+
+    def test_x_forwarded_for_no_da_un_cubo_nuevo(self):
+        # Sin proxies de confianza (NUM_PROXIES=0) la IP es REMOTE_ADDR, no la cabecera del cliente
+        for i in range(3):
+            self.client.post(reverse('login_usuario'), {'username': f'u{i}', 'password': 'x'},
+                             REMOTE_ADDR='10.0.0.9', HTTP_X_FORWARDED_FOR=f'1.2.3.{i}')
+        respuesta = self.client.post(reverse('login_usuario'), {'username': 'u9', 'password': 'x'},
+                                     REMOTE_ADDR='10.0.0.9', HTTP_X_FORWARDED_FOR='1.2.3.99')
+        self.assertEqual(respuesta.status_code, 429)
+
+    def test_limite_de_registro(self):
+        datos = {'username': 'nuevo', 'password1': 'x', 'password2': 'y'}
+        self.assertEqual(self.client.post(reverse('registrar_usuario'), datos).status_code, 400)
+        self.assertEqual(self.client.post(reverse('registrar_usuario'), datos).status_code, 429)
+
+
+class VotosComentariosTest(TestCase):
+
+    def setUp(self):
+        self.lector = Usuario.objects.create_user(username='lector', password='Clave1234')
+        autor = Usuario.objects.create_user(username='autor', password='Clave1234')
+        self.relato = Relato.objects.create(titulo="Relato", descripcion="Descripción", estado='PUBLICADO')
+        self.comentarios = [
+            Comentario.objects.create(usuario=autor, relato=self.relato, texto=f"Comentario {i}") for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.lector)
+
+    def url(self, nombre, comentario):
+        return reverse(nombre, args=[self.relato.id, comentario.id])
+
+    def test_votar_cambiar_y_quitar(self):
+        comentario = self.comentarios[0]
+        # SELECT comentario, SELECT voto, INSERT, UPDATE (+ SAVEPOINT/RELEASE de la transacción)
+        with self.assertNumQueries(6):
+            respuesta = self.client.post(self.url('votar-comentario', comentario))
+        self.assertEqual(respuesta.data, {'comentario': comentario.id, 'votos': 1, 'mi_voto': 1})
+        self.assertEqual(self.client.post(self.url('votar-comentario', comentario)).status_code, 400)
+
+        respuesta = self.client.post(self.url('quitar-voto-comentario', comentario))
+        self.assertEqual((respuesta.data['votos'], respuesta.data['mi_voto']), (-1, -1))
+
+        respuesta = self.client.delete(self.url('eliminar-voto-comentario', comentario))
+        self.assertEqual((respuesta.data['votos'], respuesta.data['mi_voto']), (0, 0))
+        self.assertEqual(self.client.delete(self.url('eliminar-voto-comentario', comentario)).status_code, 404)
+        self.assertFalse(ComentarioVoto.objects.exists())
+
+    def test_votos_en_lote(self):
+        a, b, c = self.comentarios
+        self.client.post(self.url('votar-comentario', b))
+        self.client.post(self.url('votar-comentario', c))
+
+        with self.assertNumQueries(8):
+            respuesta = self.client.post(
+                reverse('votar-comentarios-lote', args=[self.relato.id]),
+                {'votos': [
+                    {'comentario': a.id, 'valor': 1},
+                    {'comentario': b.id, 'valor': -1},
+                    {'comentario': c.id, 'valor': 0},
+                    {'comentario': 9999, 'valor': 1},
+                ]},
+                format='json',
+            )
+        self.assertEqual(
+            sorted((r['comentario'], r['votos'], r['mi_voto']) for r in respuesta.data['resultados']),
+            [(a.id, 1, 1), (b.id, -1, -1), (c.id, 0, 0)],
+        )
+        self.assertEqual(respuesta.data['no_encontrados'], [9999])
+        self.assertEqual(
+            dict(Comentario.objects.values_list('id', 'votos')), {a.id: 1, b.id: -1, c.id: 0}
+        )
+        self.assertEqual(
+            dict(ComentarioVoto.objects.values_list('comentario_id', 'valor')), {a.id: 1, b.id: -1}
+        )
+
+    def test_orden_best_y_hot(self):
+        a, b, c = self.comentarios
+        # c es de hace 10 días: el mejor valorado, pero ya no "hot"
+        Comentario.objects.filter(pk=c.pk).update(fecha=timezone.now() - timedelta(days=10))
+        votos = {a.id: [1], b.id: [1] * 8 + [-1], c.id: [1] * 10}
+        for i in range(10):
+            votante = Usuario.objects.create_user(username=f'votante{i}', password='Clave1234')
+            lote = {comentario_id: valores[i] for comentario_id, valores in votos.items() if i < len(valores)}
+            aplicar_votos_comentarios(votante, self.relato.id, lote)
+        # Cambiar un voto también mueve las puntuaciones
+        aplicar_votos_comentarios(Usuario.objects.get(username='votante8'), self.relato.id, {b.id: 1})
+
+        def orden(ordering):
+            respuesta = APIClient().get(reverse('listar-comentarios-relato', args=[self.relato.id]), {'ordering': ordering})
+            return [comentario['id'] for comentario in respuesta.data['otros']]
+
+        self.assertEqual(orden('best'), [c.id, b.id, a.id])
+        self.assertEqual(orden('hot'), [b.id, a.id, c.id])
+
+        incrementales = list(Comentario.objects.order_by('pk').values_list(
+            'votos', 'votos_positivos', 'votos_negativos', 'puntuacion_best', 'puntuacion_hot'))
+        self.assertEqual(incrementales[1][:3], (9, 9, 0))
+        recalcular_puntuaciones(Comentario.objects.all())
+        for antes, despues in zip(incrementales, Comentario.objects.order_by('pk').values_list(
+                'votos', 'votos_positivos', 'votos_negativos', 'puntuacion_best', 'puntuacion_hot')):
+            self.assertEqual(antes[:3], despues[:3])
+            self.assertAlmostEqual(antes[3], despues[3])
+            self.assertAlmostEqual(antes[4], despues[4])
+
+
+
+class BufferVotosTest(TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, True)
+        self.autor = Usuario.objects.create_user(username='autor', password='Clave1234')
+        self.votantes = [Usuario.objects.create_user(username=f'votante{i}', password='Clave1234') for i in range(3)]
+        self.relato = Relato.objects.create(titulo="Relato", descripcion="Descripción", estado='PUBLICADO')
+        Estadistica.objects.create(relato=self.relato)
+        ParticipacionRelato.objects.create(usuario=self.autor, relato=self.relato, orden=1)
+
+    def test_volcado_por_lotes_y_recuperacion_del_diario(self):
+        buffer = BufferVotos(self.directorio, 250, iniciar_worker=False)
+        a, b, c = self.votantes
+        buffer.registrar(a.id, self.relato.id, 2)
+        buffer.registrar(a.id, self.relato.id, 5)  # revoto antes del volcado: cuenta el último
+        buffer.registrar(b.id, self.relato.id, 3)
+
+        # El proceso "muere" sin volcar: otro buffer recupera el diario
+        recuperado = BufferVotos(self.directorio, 250, iniciar_worker=False)
+        self.assertEqual(recuperado.pendiente(a.id, self.relato.id), 5)
+        recuperado.registrar(c.id, self.relato.id, 4)
+        self.assertEqual(recuperado.vaciar(), 3)
+
+        self.assertEqual(
+            dict(Voto.objects.values_list('usuario__username', 'puntuacion')),
+            {'votante0': 5, 'votante1': 3, 'votante2': 4},
+        )
+        estad = Estadistica.objects.get(relato=self.relato)
+        self.assertEqual((estad.distribucion(), estad.promedio_votos), ({1: 0, 2: 0, 3: 1, 4: 1, 5: 1}, 4.0))
+        self.autor.refresh_from_db()
+        self.assertEqual(self.autor.total_votos_recibidos, 3)
+
+        # Volcar otra vez lo mismo no cuenta nada dos veces
+        recuperado.registrar(c.id, self.relato.id, 4)
+        recuperado.vaciar()
+        self.autor.refresh_from_db()
+        self.assertEqual(self.autor.total_votos_recibidos, 3)
+        recuperado.cerrar()
+        self.assertEqual(os.listdir(self.directorio), [])
+
+    def test_diario_recuperado_por_dos_workers(self):
+        a = self.votantes[0]
+        BufferVotos(self.directorio, 250, iniciar_worker=False).registrar(a.id, self.relato.id, 4)
+        # Dos workers recuperan el mismo diario huérfano: el segundo en volcar ya no lo encuentra
+        uno = BufferVotos(self.directorio, 250, iniciar_worker=False)
+        otro = BufferVotos(self.directorio, 250, iniciar_worker=False)
+        self.assertEqual(uno.vaciar(), 1)
+        self.assertEqual(otro.vaciar(), 1)
+        otro.registrar(a.id, self.relato.id, 5)
+        self.assertEqual(otro.vaciar(), 1)
+        self.assertEqual(Voto.objects.get(usuario=a).puntuacion, 5)
+        uno.cerrar()
+        otro.cerrar()
+
+    def test_votos_de_relatos_borrados_no_bloquean_el_volcado(self):
+        otro = Relato.objects.create(titulo="Otro", descripcion="Descripción", estado='PUBLICADO')
+        buffer = BufferVotos(self.directorio, 250, iniciar_worker=False)
+        buffer.registrar(self.votantes[0].id, otro.id, 3)
+        buffer.registrar(self.votantes[1].id, self.relato.id, 4)
+        otro.delete()
+        self.assertEqual(buffer.vaciar(), 2)
+        self.assertEqual(list(Voto.objects.values_list('relato_id', 'puntuacion')), [(self.relato.id, 4)])
+        self.assertIsNone(buffer.pendiente(self.votantes[0].id, otro.id))
+        buffer.cerrar()
+
+    def test_diario_antiguo_no_pisa_un_voto_mas_nuevo(self):
+        a = self.votantes[0]
+        BufferVotos(self.directorio, 250, iniciar_worker=False).registrar(a.id, self.relato.id, 2)
+        # Mientras el diario sigue huérfano, el usuario vuelve a votar por la vía directa
+        client = APIClient()
+        client.force_authenticate(a)
+        client.post(reverse('votar-relato', args=[self.relato.id]), {'puntuacion': 5}, format='json')
+        recuperado = BufferVotos(self.directorio, 250, iniciar_worker=False)
+        recuperado.vaciar()
+        self.assertEqual(Voto.objects.get(usuario=a).puntuacion, 5)
+        self.assertEqual(Estadistica.objects.get(relato=self.relato).distribucion()[5], 1)
+        recuperado.cerrar()
+
+    @override_settings(VOTOS_FLUSH_MAX_INTENTOS=2)
+    def test_voto_que_siempre_falla_pasa_a_cuarentena(self):
+        buffer = BufferVotos(self.directorio, 250, iniciar_worker=False)
+        buffer.registrar(self.votantes[0].id, self.relato.id, 4)
+        with mock.patch('BookRoomAPI.buffer_votos.guardar_votos', side_effect=RuntimeError):
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    buffer.vaciar()
+        self.assertIsNone(buffer.pendiente(self.votantes[0].id, self.relato.id))
+        cuarentena = [n for n in os.listdir(self.directorio) if n.startswith('cuarentena-')]
+        self.assertEqual(len(cuarentena), 1)
+        with open(os.path.join(self.directorio, cuarentena[0]), encoding='utf-8') as f:
+            self.assertEqual(json.loads(f.readline())[:3], [self.votantes[0].id, self.relato.id, 4])
+        buffer.cerrar()
+
+    def test_vista_en_modo_write_behind(self):
+        client = APIClient()
+        client.force_authenticate(self.votantes[0])
+        with override_settings(VOTOS_WRITE_BEHIND=True, VOTOS_BUFFER_DIR=self.directorio, VOTOS_FLUSH_MS=60000):
+            respuesta = client.post(reverse('votar-relato', args=[self.relato.id]), {'puntuacion': 4}, format='json')
+            self.assertEqual(respuesta.status_code, 202)
+            self.assertFalse(Voto.objects.exists())
+            self.assertEqual(client.get(reverse('mi-voto-relato', args=[self.relato.id])).data['puntuacion'], 4)
+            cerrar_buffer()
+        self.assertEqual(Voto.objects.get().puntuacion, 4)
@@ -0,0 +1,104 @@
+"""
+Límites de intentos para login y registro (throttles de DRF).
+
+login_usuario y registrar_usuario calculan el hash de la contraseña
+(PBKDF2, ~0,5 s de CPU cada uno), así que una ráfaga de intentos puede
+ocupar todos los hilos de los workers. DRF comprueba los throttles antes
+de ejecutar la vista, es decir, antes de authenticate() / create_user().
+
+Cada límite es un cubo de tokens: caben `capacidad` intentos seguidos y se
+recupera `por_minuto` intentos por minuto. Los cubos se guardan en la
+caché local del proceso (alias THROTTLE_CACHE, locmem): no cuestan ninguna
+ida a la red, a cambio de que cada worker lleve su propia cuenta (el límite
+efectivo es el configurado por el número de workers).
+
+Una petición rechazada devuelve 429 con Retry-After (lo pone DRF a partir
+de wait()). Los contadores de permitidas y rechazadas por límite salen en
+GET /api/admin/metricas/ (grupo "throttle").
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from . import metricas
+
+# Un solo lock por proceso: leer y actualizar un cubo tiene que ser atómico entre hilos
+_lock = threading.Lock()
+
+
+class CuboTokensThrottle(BaseThrottle):
+    """
+    Base: las subclases definen `ambito` (clave en THROTTLE_LIMITES) y
+    `identificador(request)`; si devuelve None la petición no cuenta.
+    """
+    ambito = None
+
+    def identificador(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.espera = 0
+        ident = self.identificador(request)
+        if ident is None:
+            return True
+        capacidad, por_minuto = settings.THROTTLE_LIMITES[self.ambito]
+        self.espera = consumir(f"throttle:{self.ambito}:{ident}", capacidad, por_minuto / 60)
+        metricas.incrementar('throttle', f"{self.ambito}.{'rechazadas' if self.espera else 'permitidas'}")
+        return not self.espera
+
+    def wait(self):
+        return self.espera
+
+
+def consumir(clave, capacidad, recarga, ahora=None):
+    """
+    Gasta un token del cubo `clave` (`recarga` tokens por segundo). Devuelve 0
+    si había token o los segundos que faltan para el siguiente.
+    """
+    cache = caches[settings.THROTTLE_CACHE]
+    ahora = time.time() if ahora is None else ahora
+    with _lock:
+        tokens, ultimo = cache.get(clave, (capacidad, ahora))
+        tokens = min(capacidad, tokens + (ahora - ultimo) * recarga)
+        if tokens >= 1:
+            espera = 0
+            tokens -= 1
+        else:
+            espera = (1 - tokens) / recarga
+        # Sin uso, el cubo se llena solo: al caducar la clave vuelve a estar lleno
+        cache.set(clave, (tokens, ahora), int((capacidad - tokens) / recarga) + 1)
+    return espera
+
+
+# get_ident usa REMOTE_ADDR, o X-Forwarded-For solo a través de los NUM_PROXIES de confianza
+class LoginIPThrottle(CuboTokensThrottle):
+    ambito = 'login_ip'
+
+    def identificador(self, request):
+        return self.get_ident(request)
+
+
+class LoginUsuarioThrottle(CuboTokensThrottle):
+    # Frena el ataque a una cuenta desde muchas IPs
+    ambito = 'login_usuario'
+
+    def identificador(self, request):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        return username.strip().lower()[:150] if isinstance(username, str) and username.strip() else None
+
+
+class RegistroIPThrottle(CuboTokensThrottle):
+    ambito = 'registro_ip'
+
+    def identificador(self, request):
+        return self.get_ident(request)
+
+
+metricas.registrar('throttle', *(
+    f"{ambito}.{resultado}"
+    for ambito in ('login_ip', 'login_usuario', 'registro_ip')
+    for resultado in ('permitidas', 'rechazadas')
+))
@@ -0,0 +1,161 @@
+"""
+Mantenimiento de la tabla de access tokens de OAuth2.
+
+Login y login con Google reutilizan el token vigente del usuario
+(user, application, expires > ahora) y si no hay crean otro, así que los
+caducados se acumulan para siempre. `purgar_tokens_caducados` los borra
+por lotes de `lote` filas, cada lote en su propia transacción corta (y con
+una pausa entre lotes), para no bloquear la tabla ni llenar el binlog con
+un único DELETE gigante. Los lotes salen del índice por `expires`
+(migración 0012, que añade también el de (user, application, expires) del
+login).
+
+Cada pasada guarda una MetricaTokens con el tamaño de la tabla.
+
+Emisión (registro, login y login con Google):
+- la Application "BookRoomAPI" se carga una vez por proceso; las señales
+  de Application suben una versión en la caché compartida y cada proceso
+  la mira cada OAUTH_APLICACION_REFRESCO_SEGUNDOS;
+- emitir_token reutiliza el token vigente con una sola lectura por el
+  índice (user, application, expires) y solo inserta si no hay ninguno.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from oauthlib.common import generate_token
+
+from . import metricas
+from .cache_tokens import olvidar_tokens
+from .models import MetricaTokens
+
+metricas.registrar('tokens', 'purgados')
+
+_local = threading.local()
+
+
+@contextmanager
+def purgando():
+    """Mientras dura, la señal de AccessToken no invalida token a token (lo hace la purga por lotes)."""
+    _local.purgando = True
+    try:
+        yield
+    finally:
+        _local.purgando = False
+
+
+def en_purga():
+    return getattr(_local, 'purgando', False)
+
+
+def purgar_tokens_caducados(lote=None, pausa=None, antes_de=None):
+    """Borra los tokens caducados antes de `antes_de` (por defecto, ahora). Devuelve cuántos."""
+    lote = lote or settings.TOKENS_PURGA_LOTE
+    pausa = settings.TOKENS_PURGA_PAUSA if pausa is None else pausa
+    antes_de = antes_de or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic(), purgando():
+            filas = list(
+                AccessToken.objects
+                .filter(expires__lt=antes_de)
+                .order_by('expires')
+                .values_list('pk', 'token_checksum')[:lote]
+            )
+            if not filas:
+                break
+            ids = [pk for pk, _ in filas]
+            # delete() del ORM: respeta los SET_NULL de RefreshToken / IDToken
+            AccessToken.objects.filter(pk__in=ids).delete()
+        # Un solo delete_many por lote en vez de una invalidación por token (señal)
+        olvidar_tokens([checksum for _, checksum in filas])
+        total += len(ids)
+        metricas.incrementar('tokens', 'purgados', len(ids))
+        if len(ids) < lote:
+            break
+        if pausa:
+            time.sleep(pausa)
+    return total
+
+
+def registrar_metrica(purgados=0, segundos_purga=0):
+    ahora = timezone.now()
+    return MetricaTokens.objects.create(
+        total=AccessToken.objects.count(),
+        activos=AccessToken.objects.filter(expires__gt=ahora).count(),
+        purgados=purgados,
+        segundos_purga=round(segundos_purga, 3),
+    )
+
+
+# ——— Emisión —————————————————————————————————————————————————————————
+
+NOMBRE_APLICACION = 'BookRoomAPI'
+CLAVE_VERSION_APLICACION = 'oauth_aplicacion:version'
+
+_aplicacion = None
+_version_aplicacion = None
+_revisado = 0.0
+
+
+def _version_compartida():
+    return cache.get_or_set(CLAVE_VERSION_APLICACION, int(time.time() * 1000), timeout=None)
+
+
+def aplicacion_oauth():
+    """La Application de la API, cargada una vez por proceso. Http404 si no existe."""
+    global _aplicacion, _version_aplicacion, _revisado
+    if _aplicacion is not None and time.monotonic() - _revisado < settings.OAUTH_APLICACION_REFRESCO_SEGUNDOS:
+        return _aplicacion
+    version = _version_compartida()
+    if _aplicacion is None or version != _version_aplicacion:
+        _aplicacion = get_object_or_404(Application, name=NOMBRE_APLICACION)
+        _version_aplicacion = version
+    _revisado = time.monotonic()
+    return _aplicacion
+
+
+def invalidar_aplicacion():
+    global _aplicacion
+    _aplicacion = None
+    try:
+        cache.incr(CLAVE_VERSION_APLICACION)
+    except ValueError:
+        cache.set(CLAVE_VERSION_APLICACION, int(time.time() * 1000), timeout=None)
+
+
+def emitir_token(usuario, reutilizar=True):
+    """
+    Access token para el usuario: el vigente que más dura (si le quedan al
+    menos TOKENS_VIDA_MINIMA_MINUTOS) o uno nuevo de TOKENS_DURACION_HORAS.
+    """
+    aplicacion = aplicacion_oauth()
+    ahora = timezone.now()
+    if reutilizar:
+        token = (
+            AccessToken.objects
+            .filter(
+                user=usuario,
+                application=aplicacion,
+                expires__gt=ahora + timedelta(minutes=settings.TOKENS_VIDA_MINIMA_MINUTOS),
+            )
+            .order_by('-expires')
+            .only('token', 'expires')
+            .first()
+        )
+        if token is not None:
+            return token
+    return AccessToken.objects.create(
+        user=usuario,
+        token=generate_token(),
+        application=aplicacion,
+        expires=ahora + timedelta(hours=settings.TOKENS_DURACION_HORAS),
+        scope='read write'
+    )
@@ -0,0 +1,56 @@
+"""
+Top de relatos publicados por puntuacion_ranking (media bayesiana de los
+votos, indexada en Estadistica).
+
+Cada "rebanada" del top (general, por género, por idioma o ambos) se guarda
+ya serializada en caché durante TOP_RELATOS_CACHE_TTL segundos.
+`precalcular_top_relatos()` las genera todas de golpe para que las
+peticiones no tengan que calcular ninguna (comando precalcular_top_relatos).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Estadistica, Relato
+from .serializers import EstadisticaSerializer
+
+GENEROS = dict(Relato.GENERO)
+IDIOMAS = dict(Relato.IDIOMAS)
+
+
+def _clave(genero, idioma):
+    return f"top_relatos:{genero or '*'}:{idioma or '*'}"
+
+
+def calcular_top_relatos(genero=None, idioma=None):
+    estadisticas = (
+        Estadistica.objects
+        .select_related('relato')
+        .filter(relato__estado='PUBLICADO', puntuacion_ranking__gt=0)
+        .order_by('-puntuacion_ranking', 'relato_id')
+    )
+    if genero:
+        estadisticas = estadisticas.filter(relato__generos=genero)
+    if idioma:
+        estadisticas = estadisticas.filter(relato__idioma=idioma)
+    return EstadisticaSerializer(estadisticas[:settings.TOP_RELATOS_LIMITE], many=True).data
+
+
+def top_relatos(genero=None, idioma=None):
+    clave = _clave(genero, idioma)
+    top = cache.get(clave)
+    if top is None:
+        top = calcular_top_relatos(genero, idioma)
+        cache.set(clave, top, settings.TOP_RELATOS_CACHE_TTL)
+    return top
+
+
+def precalcular_top_relatos():
+    """Guarda en caché el top general y el de cada género e idioma."""
+    rebanadas = [(None, None)]
+    rebanadas += [(genero, None) for genero in GENEROS]
+    rebanadas += [(None, idioma) for idioma in IDIOMAS]
+    cache.set_many(
+        {_clave(genero, idioma): calcular_top_relatos(genero, idioma) for genero, idioma in rebanadas},
+        settings.TOP_RELATOS_CACHE_TTL,
+    )
+    return len(rebanadas)
@@ -51,6 +51,7 @@ urlpatterns = [
 
     #BUSCADOR USUARIOS----------------------------------------------------------------------------------------
     path('usuarios/buscar/', api_buscar_usuarios),
+    path('usuarios/autocompletar/', api_autocompletar_usuarios, name='autocompletar-usuarios'),
 
     #PETICIONES AMISTAD----------------------------------------------------------------------------------------
     path('amigos/enviar/', api_enviar_solicitud_amistad),
@@ -62,13 +63,17 @@ urlpatterns = [
     path('amigos/bloqueados/', api_listar_bloqueados),
     path('amigos/desbloquear/<int:usuario_id>/', api_desbloquear_usuario),
     path('amigos/eliminar/<int:usuario_id>/', api_eliminar_amigo),
+    path('amigos/sugerencias/', api_sugerencias_amistad, name='sugerencias-amistad'),
+    path('amigos/estados/', api_estados_relacion, name='estados-relacion'),
 
     #COMENTARIOS----------------------------------------------------------------------------------------
     path('relatos/<int:relato_id>/comentarios/',api_listar_comentarios_relato,name='listar-comentarios-relato'),
+    path('relatos/<int:relato_id>/comentarios/feed/',ComentariosFeed.as_view(),name='feed-comentarios-relato'),
     path('relatos/<int:relato_id>/comentarios/crear/',api_crear_comentario_relato,name='crear-comentario-relato'),
     path('relatos/<int:relato_id>/comentarios/<int:comentario_id>/editar/',api_editar_comentario_relato,name='editar-comentario'),
     path('relatos/<int:relato_id>/comentarios/<int:comentario_id>/borrar/',api_borrar_comentario_relato,name='borrar-comentario'),
     path('relatos/<int:relato_id>/comentarios/<int:comentario_id>/votar/', api_votar_comentario, name='votar-comentario'),
+    path('relatos/<int:relato_id>/comentarios/votos/', api_votar_comentarios_lote, name='votar-comentarios-lote'),
     path('relatos/<int:relato_id>/comentarios/<int:comentario_id>/quitar-voto/',api_quitar_voto_comentario,name='quitar-voto-comentario'),
     path('relatos/<int:relato_id>/comentarios/<int:comentario_id>/voto/',api_eliminar_voto_comentario,name='eliminar-voto-comentario'),
 
@@ -80,8 +85,10 @@ urlpatterns = [
 
     #ESTADISTICAS----------------------------------------------------------------------------------------
     path('estadisticas/relatos/<int:relato_id>/', api_estadisticas_relato, name='estadisticas-relato'),
+    path('estadisticas/relatos/<int:relato_id>/distribucion/', api_distribucion_votos_relato, name='distribucion-votos-relato'),
     path('estadisticas/', api_listar_estadisticas, name='listar-estadisticas'),
     path('ranking-usuarios/', ranking_usuarios, name='ranking-usuarios'),
+    path('ranking-usuarios/posicion/', api_posicion_ranking, name='ranking-usuarios-posicion'),
 
     path('auth/google-login/', GoogleLoginAPIView.as_view(), name='google-login'),
 
@@ -90,6 +97,8 @@ urlpatterns = [
 
     #Dashboard de administrador
     path('admin/dashboard/', DashboardStatsView.as_view(), name='admin-dashboard'),
+    path('admin/metricas/', MetricasFuncionamientoView.as_view(), name='admin-metricas'),
+    path('admin/metricas/tokens/', MetricasTokensView.as_view(), name='admin-metricas-tokens'),
     # Listados generales
     path('admin/usuarios/', AdministradorUsuariosList.as_view(), name='admin-usuarios'),
     path('admin/relatos/', AdministradorRelatosList.as_view(), name='admin-relatos'),
@@ -2,8 +2,16 @@ import cloudinary
 from rest_framework.response import Response
 from rest_framework import status
 import traceback
-from django.db.models import Avg
-from .models import Voto
+import re
+from html import unescape
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+from django.db import transaction
+from django.db.models import (
+    Case, Count, F, FloatField, IntegerField, Prefetch, Q, Value, When,
+)
+from django.db.models.functions import Cast
+from .models import Voto, ParticipacionRelato, Estadistica
 
 from django.conf import settings
 
@@ -35,19 +43,151 @@ def obtener_relato_de_usuario(relato_id, usuario):
     except Relato.DoesNotExist:
         return None
     
+# Caracteres de contenido HTML que se leen de la BD para montar el extracto
+LONGITUD_EXTRACTO_HTML = 1000
+LONGITUD_EXTRACTO = 300
+
+def relatos_con_participaciones(queryset, con_fragmentos=True):
+    """
+    Precarga las participaciones (con su usuario) de cada relato del queryset,
+    de forma que RelatoSerializer saca autores y fragmentos sin una query por fila.
+    Con con_fragmentos=False solo se leen orden y username (para los autores).
+    """
+    participaciones = ParticipacionRelato.objects.select_related('usuario').order_by('orden')
+    if not con_fragmentos:
+        participaciones = participaciones.only('relato', 'orden', 'usuario__username')
+    return queryset.prefetch_related(
+        Prefetch('participacionrelato_set', queryset=participaciones)
+    )
+
+def generar_extracto(html):
+    # Quito una etiqueta que haya quedado cortada al final y después el resto del HTML
+    texto = strip_tags(re.sub(r'<[^>]*$', '', html or ''))
+    texto = ' '.join(unescape(texto).split())
+    return Truncator(texto).chars(LONGITUD_EXTRACTO)
+
+def contar_palabras(texto):
+    # Cada etiqueta cuenta como separador: así las palabras del relato
+    # publicado son la suma de las del contenido inicial y los fragmentos
+    return len(unescape(re.sub(r'<[^>]*>', ' ', texto or '')).split())
+
+def _sumar(campo, delta):
+    # F(campo) + delta sin bajar de 0 (las columnas son unsigned en MySQL)
+    if delta >= 0:
+        return F(campo) + delta
+    return Case(
+        When(**{f"{campo}__gte": -delta}, then=F(campo) + delta),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+def ajustar_estadisticas(relato_id, **deltas):
+    """
+    Suma deltas a los contadores de Estadistica en un único UPDATE atómico,
+    p. ej. ajustar_estadisticas(relato.id, num_comentarios=1).
+    Cuesta lo mismo tenga el relato 10 o 10.000 comentarios/votos.
+    """
+    cambios = {campo: _sumar(campo, delta) for campo, delta in deltas.items() if delta}
+    if cambios:
+        Estadistica.objects.filter(relato_id=relato_id).update(**cambios)
+
+def columna_votos(estrellas):
+    return f"votos_{estrellas}"
+
+def _num_votos_sql():
+    # votos_1 + ... + votos_5
+    return sum((F(columna_votos(e)) for e in Estadistica.ESTRELLAS[1:]), F(columna_votos(1)))
+
+def _suma_votos_sql():
+    # 1*votos_1 + ... + 5*votos_5
+    return sum((F(columna_votos(e)) * e for e in Estadistica.ESTRELLAS[1:]), F(columna_votos(1)))
+
+def _sin_votos():
+    return Q(**{columna_votos(e): 0 for e in Estadistica.ESTRELLAS})
+
+def puntuacion_bayesiana(suma_votos, num_votos):
+    """
+    Media de los votos "suavizada" con TOP_RELATOS_VOTOS_PREVIOS votos
+    ficticios de TOP_RELATOS_MEDIA_PREVIA: con un solo 5 un relato no pasa
+    por delante de otro con cientos de votos de 4,5. Sin votos vale 0.
+    """
+    if not num_votos:
+        return 0.0
+    previos = settings.TOP_RELATOS_VOTOS_PREVIOS
+    return (previos * settings.TOP_RELATOS_MEDIA_PREVIA + suma_votos) / (previos + num_votos)
+
+def _puntuacion_bayesiana_sql():
+    # La misma fórmula como expresión para el UPDATE
+    previos = settings.TOP_RELATOS_VOTOS_PREVIOS
+    return Case(
+        When(_sin_votos(), then=Value(0.0)),
+        default=(Value(previos * settings.TOP_RELATOS_MEDIA_PREVIA) + Cast(_suma_votos_sql(), FloatField()))
+        / (Value(float(previos)) + Cast(_num_votos_sql(), FloatField())),
+        output_field=FloatField(),
+    )
+
+def registrar_voto_estadisticas(relato_id, puntuacion, puntuacion_anterior=None):
+    """
+    Aplica un voto nuevo al histograma (+1 en su columna) o el cambio de uno
+    existente (-1 en la columna antigua, +1 en la nueva), y recalcula
+    promedio_votos y puntuacion_ranking a partir del histograma.
+    """
+    deltas = {columna_votos(puntuacion): 1}
+    if puntuacion_anterior is not None:
+        if puntuacion_anterior == puntuacion:
+            return
+        deltas[columna_votos(puntuacion_anterior)] = -1
+    aplicar_histograma_votos(relato_id, deltas)
+
+def aplicar_histograma_votos(relato_id, deltas):
+    """
+    Suma `deltas` ({'votos_4': 2, 'votos_1': -1...}) al histograma del relato
+    y recalcula promedio_votos y puntuacion_ranking. Sirve para uno o varios votos.
+    """
+    with transaction.atomic():
+        ajustar_estadisticas(relato_id, **deltas)
+        # En otro UPDATE: MySQL evalúa el SET en orden y vería valores ya cambiados
+        Estadistica.objects.filter(relato_id=relato_id).update(
+            promedio_votos=Case(
+                When(_sin_votos(), then=Value(0.0)),
+                default=Cast(_suma_votos_sql(), FloatField()) / Cast(_num_votos_sql(), FloatField()),
+                output_field=FloatField(),
+            ),
+            puntuacion_ranking=_puntuacion_bayesiana_sql(),
+        )
+
 def actualizar_estadisticas(relato):
-    estad = relato.estadisticas
-    estad.num_colaboradores = relato.autores.count()
-    estad.num_comentarios   = relato.comentarios.count()
-    texto = relato.contenido or ""
-    estad.total_palabras     = len(texto.split())
-    estad.promedio_votos     = (
-        Voto.objects
-            .filter(relato=relato)
-            .aggregate(avg=Avg('puntuacion'))['avg']
-        or 0
+    """
+    Recuento completo de las estadísticas de un relato. Es caro (cuenta
+    comentarios y votos y parte el contenido entero), así que no se hace
+    dentro de las peticiones: lo ejecuta la cola de recálculo
+    (cola_estadisticas) para cada relato encolado, y el comando
+    reconciliar_estadisticas para reparar desvíos.
+
+    Solo escribe las columnas que recalcula, con un UPDATE: save() volvería
+    a escribir también las demás (p. ej. tiempo_total) con lo leído al
+    principio, pisando lo que otra petición cambie mientras tanto.
+    """
+    estad, _ = Estadistica.objects.get_or_create(relato=relato)
+    histograma = dict(
+        Voto.objects.filter(relato=relato)
+        .values('puntuacion').annotate(n=Count('id')).values_list('puntuacion', 'n')
     )
-    estad.save()
+    campos = {columna_votos(estrellas): histograma.get(estrellas, 0) for estrellas in Estadistica.ESTRELLAS}
+    campos['num_colaboradores'] = relato.autores.count()
+    campos['num_comentarios']   = relato.comentarios.count()
+    campos['total_palabras']    = contar_palabras(relato.contenido)
+    if relato.estado != 'PUBLICADO':
+        # Hasta publicar, los fragmentos listos aún no están unidos al contenido
+        campos['total_palabras'] += sum(
+            contar_palabras(texto) for texto in relato.participacionrelato_set
+            .filter(listo_para_publicar=True).values_list('contenido_fragmento', flat=True)
+        )
+    num_votos = sum(histograma.values())
+    suma_votos = sum(estrellas * n for estrellas, n in histograma.items())
+    campos['promedio_votos']     = suma_votos / num_votos if num_votos else 0
+    campos['puntuacion_ranking'] = puntuacion_bayesiana(suma_votos, num_votos)
+    Estadistica.objects.filter(pk=estad.pk).update(**campos)
 
 def generar_factura_pdf(factura: Factura) -> str:
     """
@@ -10,7 +10,7 @@ from django.db.models import Count, Sum
 
 from BookRoomAPI.models import (
     ComentarioVoto, Usuario, Relato, ParticipacionRelato, Comentario, Voto,
-    Suscripcion, Factura, Mensaje, Estadistica, PeticionAmistad
+    Suscripcion, Factura, Mensaje, Estadistica, PeticionAmistad, MetricaTokens
 )
 from BookRoomAPI.serializers import (
     UsuarioSerializer,
@@ -24,6 +24,9 @@ from BookRoomAPI.serializers import (
     PeticionAmistadSerializer,
 )
 from BookRoomAPI.permissions import EsModeradorAdmin
+from BookRoomAPI import metricas
+from BookRoomAPI.utils import relatos_con_participaciones
+from BookRoomAPI.paginacion import PaginacionCursor
 
 # ——— Serializer Factura ———————————————————————————————
 
@@ -172,12 +175,54 @@ class DashboardStatsView(APIView):
         return Response(data)
 
 
+# ——— Métricas de funcionamiento ————————————————————————————————
+
+class MetricasFuncionamientoView(APIView):
+    permission_classes = [IsAuthenticated, EsModeradorAdmin]
+
+    @swagger_auto_schema(
+        operation_summary="Métricas de funcionamiento",
+        operation_description="""
+            Contadores de todos los procesos desde el último reinicio de la caché
+            (p. ej. `tokens`: aciertos, fallos y rechazos de la caché de tokens y su tasa de aciertos).
+        """,
+        responses={200: "{grupo: {contador: valor, ...}}"},
+        tags=["Administrador"]
+    )
+    def get(self, request):
+        return Response(metricas.resumen())
+
+
+class MetricasTokensView(APIView):
+    permission_classes = [IsAuthenticated, EsModeradorAdmin]
+
+    @swagger_auto_schema(
+        operation_summary="Evolución de la tabla de tokens",
+        operation_description="Últimas fotos (una por pasada de `purgar_tokens`) del número de access tokens, activos y purgados.",
+        manual_parameters=[
+            openapi.Parameter('limite', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Número de fotos (por defecto 30, máx. 365)'),
+        ],
+        tags=["Administrador"]
+    )
+    def get(self, request):
+        try:
+            limite = min(max(int(request.query_params.get('limite', 30)), 1), 365)
+        except ValueError:
+            limite = 30
+        return Response(list(
+            MetricaTokens.objects.values('fecha', 'total', 'activos', 'purgados', 'segundos_purga')[:limite]
+        ))
+
+
 # ——— Vistas de listado ——————————————————————————————————————
 
 class AdministradorUsuariosList(generics.ListAPIView):
     queryset = Usuario.objects.all()
     serializer_class = UsuarioSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('id',)
 
     @swagger_auto_schema(operation_summary="Listar usuarios", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
@@ -185,9 +230,11 @@ class AdministradorUsuariosList(generics.ListAPIView):
 
 
 class AdministradorRelatosList(generics.ListAPIView):
-    queryset = Relato.objects.all().order_by('-fecha_creacion')
+    queryset = relatos_con_participaciones(Relato.objects.all().order_by('-fecha_creacion'))
     serializer_class = RelatoSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-fecha_creacion', '-id')
 
     @swagger_auto_schema(operation_summary="Listar relatos", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
@@ -198,6 +245,8 @@ class AdministradorParticipacionesList(generics.ListAPIView):
     queryset = ParticipacionRelato.objects.select_related('usuario', 'relato').all().order_by('-fecha_ultima_aportacion')
     serializer_class = ParticipacionRelatoSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-fecha_ultima_aportacion', '-id')
 
     @swagger_auto_schema(operation_summary="Listar participaciones", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
@@ -208,6 +257,8 @@ class AdministradorComentariosList(generics.ListAPIView):
     queryset = Comentario.objects.select_related('usuario', 'relato').all().order_by('-fecha')
     serializer_class = ComentarioSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-fecha', '-id')
 
     @swagger_auto_schema(operation_summary="Listar comentarios", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
@@ -218,6 +269,8 @@ class AdministradorVotosList(generics.ListAPIView):
     queryset = Voto.objects.select_related('usuario', 'relato').all().order_by('-fecha')
     serializer_class = VotoSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-fecha', '-id')
 
     @swagger_auto_schema(operation_summary="Listar votos", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
@@ -228,6 +281,8 @@ class AdministradorSuscripcionesList(generics.ListAPIView):
     queryset = Suscripcion.objects.select_related('usuario').all().order_by('-fecha_inicio')
     serializer_class = SuscripcionSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-fecha_inicio', '-id')
 
     @swagger_auto_schema(operation_summary="Listar suscripciones", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
@@ -238,6 +293,8 @@ class AdministradorFacturasList(generics.ListAPIView):
     queryset = Factura.objects.select_related('suscripcion__usuario').all().order_by('-fecha')
     serializer_class = FacturaAdminSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-fecha', '-id')
 
     @swagger_auto_schema(operation_summary="Listar facturas", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
@@ -248,6 +305,8 @@ class AdministradorMensajesList(generics.ListAPIView):
     queryset = Mensaje.objects.select_related('autor', 'relato').all().order_by('-fecha_envio')
     serializer_class = MensajeSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-fecha_envio', '-id')
 
     @swagger_auto_schema(operation_summary="Listar mensajes", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
@@ -258,6 +317,8 @@ class AdministradorEstadisticasList(generics.ListAPIView):
     queryset = Estadistica.objects.select_related('relato').all().order_by('-promedio_votos')
     serializer_class = EstadisticaSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-promedio_votos', '-id')
 
     @swagger_auto_schema(operation_summary="Listar estadísticas de relatos", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
@@ -268,6 +329,8 @@ class AdministradorPeticionesAmistadList(generics.ListAPIView):
     queryset = PeticionAmistad.objects.select_related('de_usuario', 'a_usuario').all().order_by('-fecha_solicitud')
     serializer_class = PeticionAmistadSerializer
     permission_classes = [IsAuthenticated, EsModeradorAdmin]
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-fecha_solicitud', '-id')
 
     @swagger_auto_schema(operation_summary="Listar peticiones de amistad", tags=["Administrador"])
     def get(self, request, *args, **kwargs):
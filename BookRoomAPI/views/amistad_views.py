@@ -8,6 +8,7 @@ from django.db.models import Q
 from BookRoomAPI.models import *
 from BookRoomAPI.serializers import *
 from BookRoomAPI.utils import *
+from BookRoomAPI.amistades import estados_relacion, sugerencias_amistad
 
 #============================================================================================
 #PETICIONES AMISTAD----------------------------------------------------------------------------------------
@@ -289,4 +290,54 @@ def api_eliminar_amigo(request, usuario_id):
         return Response({"error": "No tienes una amistad con ese usuario."}, status=404)
 
     solicitud.delete()
-    return Response({"mensaje": "Amistad eliminada correctamente."})
\ No newline at end of file
+    return Response({"mensaje": "Amistad eliminada correctamente."})
+
+@swagger_auto_schema(
+    method='get',
+    tags=["Amistades"],
+    operation_summary="Sugerencias de amistad",
+    operation_description="""
+        Usuarios que quizá conozcas: amigos de tus amigos y coautores de tus relatos,
+        ordenados por amigos y relatos en común.
+        - No incluye a tus amigos ni a usuarios con una solicitud pendiente o un bloqueo contigo.
+        - Se recalcula como mucho cada 15 minutos o cuando cambian tus amistades.
+    """,
+    responses={
+        200: "Lista de usuarios sugeridos con `amigos_comunes` y `relatos_comunes`",
+        401: "Token no enviado o inválido"
+    }
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_sugerencias_amistad(request):
+    sugerencias = sugerencias_amistad(request.user.id)
+    usuarios = Usuario.objects.in_bulk([usuario_id for usuario_id, _, _ in sugerencias])
+    datos = [
+        {**UsuarioAmigoSerializer(usuarios[usuario_id]).data, 'amigos_comunes': amigos, 'relatos_comunes': relatos}
+        for usuario_id, amigos, relatos in sugerencias
+        if usuario_id in usuarios
+    ]
+    return Response(datos)
+
+
+@swagger_auto_schema(
+    method='post',
+    tags=["Amistades"],
+    operation_summary="Relación con varios usuarios",
+    operation_description="""
+        Para cada usuario indicado devuelve tu relación con él y cuántos amigos tenéis en común.
+        - `relacion`: `amigo`, `solicitud_enviada`, `solicitud_recibida`, `bloqueado` (lo has bloqueado tú), `yo` o `ninguna`.
+        - Pensado para pintar listados (búsquedas, autores de comentarios) sin una petición por usuario.
+    """,
+    request_body=EstadosRelacionSerializer,
+    responses={
+        200: "Objeto {usuario_id: {relacion, amigos_comunes}}",
+        400: "Lista de usuarios no válida"
+    }
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_estados_relacion(request):
+    serializer = EstadosRelacionSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return Response(estados_relacion(request.user.id, serializer.validated_data['usuarios']))
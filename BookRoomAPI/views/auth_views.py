@@ -3,14 +3,12 @@
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
 
-from oauth2_provider.models import Application, AccessToken
-from oauthlib.common import generate_token
+from oauth2_provider.models import AccessToken
 
-from datetime import timedelta
 from django.utils import timezone
 
 from django.contrib.auth import authenticate
@@ -23,6 +21,8 @@ from ..serializers import (
     UsuarioSerializerRegistro, UsuarioSerializer,
     UsuarioLoginResponseSerializer, LoginSerializer, MensajeSerializer
 )
+from ..throttles import LoginIPThrottle, LoginUsuarioThrottle, RegistroIPThrottle
+from ..tokens import emitir_token
 
 # 1) REGISTRAR USUARIO
 @swagger_auto_schema(
@@ -43,11 +43,13 @@ from ..serializers import (
             )
         ),
         400: "Errores de validación",
+        429: "Demasiados registros desde esta IP (cabecera Retry-After)",
         500: "Error interno al generar el token"
     }
 )
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RegistroIPThrottle])
 def registrar_usuario(request):
     serializer = UsuarioSerializerRegistro(data=request.data)
     if not serializer.is_valid():
@@ -71,14 +73,7 @@ def registrar_usuario(request):
         fecha_fin=None
     )
 
-    app = get_object_or_404(Application, name="BookRoomAPI")
-    token = AccessToken.objects.create(
-        user=user,
-        token=generate_token(),
-        application=app,
-        expires=timezone.now() + timedelta(hours=10),
-        scope='read write'
-    )
+    token = emitir_token(user, reutilizar=False)
 
     return Response(
         {
@@ -135,11 +130,13 @@ def obtener_usuario_por_token(request, token):
             )
         ),
         401: "Credenciales inválidas",
-        404: "Aplicación OAuth2 no encontrada"
+        404: "Aplicación OAuth2 no encontrada",
+        429: "Demasiados intentos para esta IP o este usuario (cabecera Retry-After)"
     }
 )
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginIPThrottle, LoginUsuarioThrottle])
 def login_usuario(request):
     serializer = LoginSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
@@ -150,20 +147,7 @@ def login_usuario(request):
     if user is None:
         return Response({"error": "Credenciales inválidas."}, status=status.HTTP_401_UNAUTHORIZED)
 
-    app = get_object_or_404(Application, name="BookRoomAPI")
-    token = AccessToken.objects.filter(
-        user=user,
-        application=app,
-        expires__gt=timezone.now()
-    ).first()
-    if not token:
-        token = AccessToken.objects.create(
-            user=user,
-            token=generate_token(),
-            application=app,
-            expires=timezone.now() + timedelta(hours=10),
-            scope='read write'
-        )
+    token = emitir_token(user)
 
     return Response({
         "mensaje": "Login correcto. Bienvenido/a." + f" {user.username}",
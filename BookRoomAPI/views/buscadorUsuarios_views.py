@@ -7,6 +7,10 @@ from drf_yasg import openapi
 from BookRoomAPI.models import *
 from BookRoomAPI.serializers import *
 from BookRoomAPI.utils import *
+from BookRoomAPI.amistades import estados_relacion, ids_bloqueados
+from BookRoomAPI.busqueda_usuarios import buscar_usuarios, normalizar
+from BookRoomAPI.indice_usuarios import obtener_indice
+from BookRoomAPI.paginacion import PaginacionBusquedaUsuarios
 #============================================================================================
 #BUSCADOR USUARIOS----------------------------------------------------------------------------------------
 #============================================================================================
@@ -17,8 +21,11 @@ from BookRoomAPI.utils import *
     operation_description="""
         Busca usuarios por nombre de usuario `username` a partir del parámetro `q`.  
         - La búsqueda requiere al menos 3 caracteres.  
-        - No devuelve al usuario autenticado.  
+        - No devuelve al usuario autenticado ni a usuarios con un bloqueo contigo.  
+        - Primero el nombre exacto, después los que empiezan por `q` y luego los que lo contienen.  
+        - Como mucho 50 resultados, paginados (`page`, `page_size`).  
         - Devuelve información básica del usuario.
+        - Con `relacion=true` añade a cada uno tu relación con él y los amigos en común.
     """,
     manual_parameters=[
         openapi.Parameter(
@@ -27,23 +34,80 @@ from BookRoomAPI.utils import *
             type=openapi.TYPE_STRING,
             required=True,
             description='Texto a buscar (mínimo 3 caracteres)'
+        ),
+        openapi.Parameter(
+            name='relacion',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_BOOLEAN,
+            required=False,
+            description='Si es true, cada usuario incluye `relacion` y `amigos_comunes`'
         )
     ],
     responses={
-        200: "Listado de usuarios encontrados",
+        200: "Página de usuarios encontrados (`count`, `next`, `previous`, `results`)",
     }
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def api_buscar_usuarios(request):
-    query = request.query_params.get('q', '').strip()
+    paginador = PaginacionBusquedaUsuarios()
+
+    # 1) Ids ordenados (exactos, prefijos y el resto) sin mí ni usuarios bloqueados
+    excluir = ids_bloqueados(request.user.id) | {request.user.id}
+    ids = buscar_usuarios(request.query_params.get('q', ''), excluir=excluir)
+
+    # 2) Solo se cargan los usuarios de la página pedida
+    pagina = paginador.paginate_queryset(ids, request)
+    usuarios = Usuario.objects.in_bulk(pagina)
+    datos = UsuarioAmigoSerializer([usuarios[pk] for pk in pagina if pk in usuarios], many=True).data
 
-    if not query or len(query) < 3:
-        return Response([])
+    # 3) Relación con cada resultado en bloque (una query + caché de amigos)
+    if request.query_params.get('relacion') in ('1', 'true', 'True'):
+        estados = estados_relacion(request.user.id, [u['id'] for u in datos])
+        for usuario in datos:
+            usuario.update(estados[usuario['id']])
+    return paginador.get_paginated_response(datos)
 
-    usuarios = Usuario.objects.filter(
-        username__icontains=query
-    ).exclude(id=request.user.id)
 
-    serializer = UsuarioAmigoSerializer(usuarios, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+@swagger_auto_schema(
+    method='get',
+    tags=["Amistades"],
+    operation_summary="Autocompletar usuarios",
+    operation_description="""
+        Usernames que empiezan por `q` (sin distinguir mayúsculas ni tildes), para el selector de usuarios.  
+        - Sale del índice en memoria del proceso, sin ir a la base de datos.  
+        - No devuelve al usuario autenticado ni a usuarios con un bloqueo contigo.  
+        - Devuelve solo `id` y `username`, en orden alfabético.
+    """,
+    manual_parameters=[
+        openapi.Parameter(name='q', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                          description='Comienzo del username'),
+        openapi.Parameter(name='limite', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False,
+                          description='Máximo de resultados (por defecto 10, máx. 20)'),
+    ],
+    responses={200: "Lista de {id, username}"}
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_autocompletar_usuarios(request):
+    q = request.query_params.get('q', '')
+    try:
+        limite = min(max(int(request.query_params.get('limite', 10)), 1), 20)
+    except ValueError:
+        limite = 10
+    excluir = ids_bloqueados(request.user.id) | {request.user.id}
+
+    indice = obtener_indice()
+    if indice is not None:
+        encontrados = indice.buscar(q, limite, excluir)
+    else:
+        # El índice todavía se está cargando: mismo resultado desde la base de datos
+        prefijo = normalizar(q)
+        encontrados = list(
+            Usuario.objects
+            .filter(username_normalizado__istartswith=prefijo)
+            .exclude(pk__in=excluir)
+            .order_by('username_normalizado', 'username')
+            .values_list('pk', 'username')[:limite]
+        ) if prefijo else []
+    return Response([{'id': pk, 'username': username} for pk, username in encontrados])
@@ -6,21 +6,37 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from django.db.models import F
+from django.db.models import Case, F, IntegerField, Value, When
+from rest_framework import generics
 
 from BookRoomAPI.models import *
 from BookRoomAPI.permissions import EsPropietarioOModerador
 from BookRoomAPI.serializers import *
 from BookRoomAPI.utils import *
+from BookRoomAPI.amistades import ids_amigos
+from BookRoomAPI.cola_estadisticas import encolar_recalculo
+from BookRoomAPI.paginacion import PaginacionComentarios
+from BookRoomAPI.votos_comentarios import aplicar_votos_comentarios, respuesta_voto
 #============================================================================================
 # COMENTARIOS
 #============================================================================================
 
+ORDENES_COMENTARIOS = {
+    'recientes': ('-fecha', '-id'),
+    'best': ('-puntuacion_best', '-id'),
+    'hot': ('-puntuacion_hot', '-id'),
+}
+
+
 @swagger_auto_schema(
     method='get',
     tags=["Comentarios"],
     operation_summary="Listar comentarios de un relato",
     operation_description="Devuelve dos listas: `amigos` y `otros`.",
+    manual_parameters=[
+        openapi.Parameter('ordering', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['recientes', 'best', 'hot'],
+                          description='best: mejor valorados (Wilson); hot: valorados y recientes. Por defecto recientes'),
+    ],
     responses={
         200: openapi.Schema(
             type=openapi.TYPE_OBJECT,
@@ -55,25 +71,32 @@ def api_listar_comentarios_relato(request, relato_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
-    # 2) Base queryset
-    todos = Comentario.objects.filter(relato=relato).order_by('-fecha')
+    # 2) Todos los comentarios con su autor en una sola query (best/hot recorren su índice)
+    orden = ORDENES_COMENTARIOS.get(request.query_params.get('ordering'), ORDENES_COMENTARIOS['recientes'])
+    todos = list(
+        Comentario.objects.filter(relato=relato).select_related('usuario').order_by(*orden)
+    )
 
-    # 3) Separar amigos y otros
+    # 3) Mis votos en una query y mis amigos desde la caché
     if request.user.is_authenticated:
-        ids_amigos = request.user.amigos().values_list('id', flat=True)
-        qs_amigos = todos.filter(usuario__in=ids_amigos)
-        qs_otros  = todos.exclude(usuario__in=ids_amigos)
+        mis_votos = dict(
+            ComentarioVoto.objects
+            .filter(usuario=request.user, comentario__relato=relato)
+            .values_list('comentario_id', 'valor')
+        )
+        amigos = ids_amigos(request.user.id)
     else:
-        qs_amigos = Comentario.objects.none()
-        qs_otros  = todos
+        mis_votos = {}
+        amigos = frozenset()
 
-    # 4) Serializar con contexto para `mi_voto`
-    serializer_amigos = ComentarioSerializer(
-        qs_amigos, many=True, context={'request': request}
-    )
-    serializer_otros = ComentarioSerializer(
-        qs_otros, many=True, context={'request': request}
-    )
+    # 4) Separar amigos y otros en una pasada (mantiene el orden pedido)
+    lista_amigos, otros = [], []
+    for comentario in todos:
+        (lista_amigos if comentario.usuario_id in amigos else otros).append(comentario)
+
+    contexto = {'request': request, 'mis_votos': mis_votos}
+    serializer_amigos = ComentarioSerializer(lista_amigos, many=True, context=contexto)
+    serializer_otros = ComentarioSerializer(otros, many=True, context=contexto)
 
     # 5) Devolver ambas listas
     return Response({
@@ -82,6 +105,80 @@ def api_listar_comentarios_relato(request, relato_id):
     }, status=status.HTTP_200_OK)
 
 
+class ComentariosFeed(generics.ListAPIView):
+    """
+    Comentarios de un relato paginados (por cursor por defecto): primero los
+    de mis amigos y después el resto, por fecha, por votos o por best/hot.
+    Todo el orden sale de una query con `es_amigo` = CASE usuario IN (amigos).
+    """
+    serializer_class = ComentarioSerializer
+    permission_classes = [AllowAny]
+    pagination_class = PaginacionComentarios
+    filter_backends = []
+    cursor_por_defecto = True
+
+    ORDENES = {
+        'recientes': ('-es_amigo', '-fecha', '-id'),
+        'votos': ('-es_amigo', '-votos', '-id'),
+        'best': ('-es_amigo', '-puntuacion_best', '-id'),
+        'hot': ('-es_amigo', '-puntuacion_hot', '-id'),
+    }
+
+    @property
+    def orden_cursor(self):
+        orden = self.request.query_params.get('orden')
+        return self.ORDENES.get(orden, self.ORDENES['recientes'])
+
+    def get_queryset(self):
+        relato = get_object_or_404(Relato, id=self.kwargs['relato_id'], estado='PUBLICADO')
+        if self.request.user.is_authenticated:
+            amigos = list(ids_amigos(self.request.user.id))
+        else:
+            amigos = []
+        es_amigo = (
+            Case(When(usuario_id__in=amigos, then=Value(1)), default=Value(0), output_field=IntegerField())
+            if amigos else Value(0, output_field=IntegerField())
+        )
+        return (
+            Comentario.objects
+            .filter(relato=relato)
+            .select_related('usuario')
+            .annotate(es_amigo=es_amigo)
+            .order_by(*self.orden_cursor)
+        )
+
+    def list(self, request, *args, **kwargs):
+        pagina = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        # Mis votos solo de los comentarios de esta página
+        mis_votos = {}
+        if request.user.is_authenticated and pagina:
+            mis_votos = dict(
+                ComentarioVoto.objects
+                .filter(usuario=request.user, comentario_id__in=[c.id for c in pagina])
+                .values_list('comentario_id', 'valor')
+            )
+        datos = self.get_serializer(pagina, many=True, context={'request': request, 'mis_votos': mis_votos}).data
+        for dato, comentario in zip(datos, pagina):
+            dato['es_amigo'] = bool(comentario.es_amigo)
+        return self.get_paginated_response(datos)
+
+    @swagger_auto_schema(
+        operation_summary="Feed paginado de comentarios de un relato",
+        operation_description="Comentarios de amigos primero y luego el resto. Paginado por cursor "
+                              "(`next`/`previous`); `?paginacion=paginas` para paginar por número.",
+        tags=["Comentarios"],
+        manual_parameters=[
+            openapi.Parameter('orden', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['recientes', 'votos', 'best', 'hot'],
+                              description='Orden dentro de cada grupo (por defecto recientes)'),
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Comentarios por página (máx. 100)'),
+        ],
+        responses={200: ComentarioSerializer(many=True), 404: "Relato no publicado"}
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
 @swagger_auto_schema(
     method='post',
     tags=["Comentarios"],
@@ -114,7 +211,8 @@ def api_crear_comentario_relato(request, relato_id):
     serializer.save(usuario=request.user, relato=relato)
 
     # 4) Actualizar las estadísticas del relato
-    actualizar_estadisticas(relato)
+    ajustar_estadisticas(relato.id, num_comentarios=1)
+    encolar_recalculo(relato.id)
 
     # 5) Devolver el comentario creado
     return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -148,8 +246,7 @@ def api_editar_comentario_relato(request, relato_id, comentario_id):
     serializer.is_valid(raise_exception=True)
     serializer.save()
 
-    # 5) Actualizar estadísticas y devolver
-    actualizar_estadisticas(comentario.relato)
+    # 5) Devolver (editar no cambia las estadísticas)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -177,9 +274,9 @@ def api_borrar_comentario_relato(request, relato_id, comentario_id):
         )
 
     # 4) Eliminar y actualizar estadísticas
-    relato = comentario.relato
     comentario.delete()
-    actualizar_estadisticas(relato)
+    ajustar_estadisticas(relato_id, num_comentarios=-1)
+    encolar_recalculo(relato_id)
 
     # 5) Confirmación
     return Response(
@@ -197,7 +294,7 @@ def api_borrar_comentario_relato(request, relato_id, comentario_id):
         openapi.Parameter("comentario_id", in_=openapi.IN_PATH, type=openapi.TYPE_INTEGER),
     ],
     responses={
-        200: ComentarioSerializer,
+        200: ResultadoVotoComentarioSerializer,
         400: "Ya has votado positivamente este comentario",
         404: "Comentario no encontrado"
     }
@@ -205,44 +302,25 @@ def api_borrar_comentario_relato(request, relato_id, comentario_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def api_votar_comentario(request, relato_id, comentario_id):
-    # 1) Recuperar el comentario validando relato
-    try:
-        comentario = Comentario.objects.get(pk=comentario_id, relato_id=relato_id)
-    except Comentario.DoesNotExist:
+    # 1) Voto positivo con el motor de votos (una transacción)
+    resultado = aplicar_votos_comentarios(
+        request.user, relato_id, {comentario_id: ComentarioVoto.VOTOARRIBA}
+    ).get(comentario_id)
+    if resultado is None:
         return Response(
             {"error": "Comentario no encontrado en este relato."},
             status=status.HTTP_404_NOT_FOUND
         )
 
-    # 2) Intentar recuperar voto existente
-    try:
-        voto = ComentarioVoto.objects.get(usuario=request.user, comentario=comentario)
-        if voto.valor == ComentarioVoto.VOTOARRIBA:
-            return Response(
-                {"error": "Ya has votado positivamente este comentario."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        # cambiar de down a up => +2
-        voto.valor = ComentarioVoto.VOTOARRIBA
-        voto.save(update_fields=['valor'])
-        comentario.votos = F('votos') + 2
-
-    except ComentarioVoto.DoesNotExist:
-        # primer up-vote => +1
-        ComentarioVoto.objects.create(
-            usuario=request.user,
-            comentario=comentario,
-            valor=ComentarioVoto.VOTOARRIBA
+    # 2) Ya estaba votado en positivo
+    if resultado.anterior == ComentarioVoto.VOTOARRIBA:
+        return Response(
+            {"error": "Ya has votado positivamente este comentario."},
+            status=status.HTTP_400_BAD_REQUEST
         )
-        comentario.votos = F('votos') + 1
 
-    comentario.save(update_fields=['votos'])
-    comentario.refresh_from_db()
-    serializer = ComentarioSerializer(
-    comentario,
-    context={'request': request}
-    )
-    return Response(serializer.data)
+    # 3) Nueva puntuación y mi voto
+    return Response(respuesta_voto(comentario_id, resultado))
 
 @swagger_auto_schema(
     method='post',
@@ -254,7 +332,7 @@ def api_votar_comentario(request, relato_id, comentario_id):
         openapi.Parameter("comentario_id", in_=openapi.IN_PATH, type=openapi.TYPE_INTEGER),
     ],
     responses={
-        200: ComentarioSerializer,
+        200: ResultadoVotoComentarioSerializer,
         400: "Ya has votado negativamente este comentario",
         404: "Comentario no encontrado"
     }
@@ -262,44 +340,25 @@ def api_votar_comentario(request, relato_id, comentario_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def api_quitar_voto_comentario(request, relato_id, comentario_id):
-    # 1) Recuperar el comentario validando relato
-    try:
-        comentario = Comentario.objects.get(pk=comentario_id, relato_id=relato_id)
-    except Comentario.DoesNotExist:
+    # 1) Voto negativo con el motor de votos (una transacción)
+    resultado = aplicar_votos_comentarios(
+        request.user, relato_id, {comentario_id: ComentarioVoto.VOTOABAJO}
+    ).get(comentario_id)
+    if resultado is None:
         return Response(
             {"error": "Comentario no encontrado en este relato."},
             status=status.HTTP_404_NOT_FOUND
         )
 
-    # 2) Intentar recuperar voto existente
-    try:
-        voto = ComentarioVoto.objects.get(usuario=request.user, comentario=comentario)
-        if voto.valor == ComentarioVoto.VOTOABAJO:
-            return Response(
-                {"error": "Ya has votado negativamente este comentario."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        # cambiar de up a down => -2
-        voto.valor = ComentarioVoto.VOTOABAJO
-        voto.save(update_fields=['valor'])
-        comentario.votos = F('votos') - 2
-
-    except ComentarioVoto.DoesNotExist:
-        # primer down-vote => -1
-        ComentarioVoto.objects.create(
-            usuario=request.user,
-            comentario=comentario,
-            valor=ComentarioVoto.VOTOABAJO
+    # 2) Ya estaba votado en negativo
+    if resultado.anterior == ComentarioVoto.VOTOABAJO:
+        return Response(
+            {"error": "Ya has votado negativamente este comentario."},
+            status=status.HTTP_400_BAD_REQUEST
         )
-        comentario.votos = F('votos') - 1
 
-    comentario.save(update_fields=['votos'])
-    comentario.refresh_from_db()
-    serializer = ComentarioSerializer(
-    comentario,
-    context={'request': request}
-    )
-    return Response(serializer.data)
+    # 3) Nueva puntuación y mi voto
+    return Response(respuesta_voto(comentario_id, resultado))
 
 @swagger_auto_schema(
     method='delete',
@@ -311,35 +370,59 @@ def api_quitar_voto_comentario(request, relato_id, comentario_id):
         openapi.Parameter("comentario_id", in_=openapi.IN_PATH, type=openapi.TYPE_INTEGER),
     ],
     responses={
-        200: ComentarioSerializer,
+        200: ResultadoVotoComentarioSerializer,
         404: "Comentario o voto no encontrado"
     }
 )
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def api_eliminar_voto_comentario(request, relato_id, comentario_id):
-    # 1) Recuperar comentario
-    try:
-        comentario = Comentario.objects.get(pk=comentario_id, relato_id=relato_id)
-    except Comentario.DoesNotExist:
+    # 1) Quitar el voto (valor 0) con el motor de votos
+    resultado = aplicar_votos_comentarios(request.user, relato_id, {comentario_id: 0}).get(comentario_id)
+    if resultado is None:
         return Response({"error": "Comentario no encontrado."},
                         status=status.HTTP_404_NOT_FOUND)
 
-    # 2) Recuperar voto del usuario
-    try:
-        voto = ComentarioVoto.objects.get(usuario=request.user, comentario=comentario)
-    except ComentarioVoto.DoesNotExist:
+    # 2) No había voto que quitar
+    if not resultado.anterior:
         return Response({"error": "No existía un voto tuyo en este comentario."},
                         status=status.HTTP_404_NOT_FOUND)
 
-    # 3) Ajustar contador neto
-    comentario.votos = F('votos') - voto.valor
-    comentario.save(update_fields=['votos'])
-    comentario.refresh_from_db()
+    # 3) Nueva puntuación y mi voto
+    return Response(respuesta_voto(comentario_id, resultado))
+
 
-    # 4) Borrar registro
-    voto.delete()
+@swagger_auto_schema(
+    method='post',
+    tags=["Comentarios"],
+    operation_summary="Votar varios comentarios a la vez",
+    operation_description="Aplica en una transacción una lista de votos `{comentario, valor}` "
+                          "(1, -1 o 0 para quitar) sobre comentarios del relato. Máximo 100.",
+    request_body=VotosComentariosLoteSerializer,
+    responses={
+        200: openapi.Response(
+            description="Resultado por comentario y comentarios no encontrados",
+            schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                'resultados': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                'no_encontrados': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)),
+            })
+        ),
+        400: "Errores de validación"
+    }
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_votar_comentarios_lote(request, relato_id):
+    # 1) Validar la lista (si un comentario se repite, vale el último voto)
+    serializer = VotosComentariosLoteSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    votos = {v['comentario']: v['valor'] for v in serializer.validated_data['votos']}
 
-    # 5) Responder con el comentario actualizado
-    serializer = ComentarioSerializer(comentario, context={'request': request})
-    return Response(serializer.data)
+    # 2) Aplicar todos los votos juntos
+    resultados = aplicar_votos_comentarios(request.user, relato_id, votos)
+
+    # 3) Devolver el resultado de cada comentario
+    return Response({
+        'resultados': [respuesta_voto(c, r) for c, r in resultados.items()],
+        'no_encontrados': [c for c in votos if c not in resultados],
+    })
@@ -3,10 +3,14 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import api_view, permission_classes
 from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+from django.conf import settings
 
 from BookRoomAPI.models import *
 from BookRoomAPI.serializers import *
 from BookRoomAPI.utils import *
+from BookRoomAPI.rankings import METRICAS, PERIODOS, top_ranking, posicion_usuario
+from BookRoomAPI.top_relatos import GENEROS, IDIOMAS, top_relatos
 #============================================================================================
 #ESTADISTICAS--------------------------------------------------------------------------------------
 #============================================================================================
@@ -45,33 +49,139 @@ def api_estadisticas_relato(request, relato_id):
 @swagger_auto_schema(
     method='get',
     tags=["Estadisticas"],
-    operation_summary="Listar estadísticas de todos los relatos",
-    responses={200: EstadisticaSerializer(many=True)}
+    operation_summary="Distribución de votos de un relato",
+    operation_description="Cuántos votos de 1 a 5 estrellas tiene el relato, con su porcentaje. "
+                          "Sale del histograma de Estadistica, sin recorrer los votos.",
+    responses={200: "Distribución", 404: "Sin estadísticas"}
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def api_distribucion_votos_relato(request, relato_id):
+    # 1) Una sola fila: el histograma de votos del relato
+    try:
+        estadisticas = Estadistica.objects.only(
+            'relato_id', 'promedio_votos', *[f'votos_{e}' for e in Estadistica.ESTRELLAS]
+        ).get(relato_id=relato_id)
+    except Estadistica.DoesNotExist:
+        return Response({"error": "Sin estadísticas."}, status=status.HTTP_404_NOT_FOUND)
+
+    # 2) Porcentajes sobre el total
+    total = estadisticas.num_votos
+    distribucion = [
+        {
+            'estrellas': estrellas,
+            'votos': votos,
+            'porcentaje': round(100 * votos / total, 1) if total else 0.0,
+        }
+        for estrellas, votos in estadisticas.distribucion().items()
+    ]
+    return Response({
+        'relato': relato_id,
+        'num_votos': total,
+        'promedio_votos': estadisticas.promedio_votos,
+        'distribucion': distribucion,
+    }, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='get',
+    tags=["Estadisticas"],
+    operation_summary="Top de relatos publicados",
+    operation_description="Los 10 relatos publicados mejor valorados según `puntuacion_ranking` "
+                          "(media bayesiana: pocos votos pesan menos). Se puede filtrar por género o idioma.",
+    manual_parameters=[
+        openapi.Parameter('genero', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(GENEROS)),
+        openapi.Parameter('idioma', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(IDIOMAS)),
+    ],
+    responses={200: EstadisticaSerializer(many=True), 400: "Género o idioma no válido"}
 )
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def api_listar_estadisticas(request):
-    # 1) Recuperar todas las estadísticas de los relatos publicados, ordenadas por promedio de votos y limitadas a 10
-    estadisticas = (
-    Estadistica.objects
-    .select_related('relato')
-    .filter(relato__estado='PUBLICADO')
-    .order_by('-promedio_votos')
-    )[:10]
-
-    # 2) Serializar y devolver
-    serializer = EstadisticaSerializer(estadisticas, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    # 1) Validar la rebanada pedida
+    genero = request.GET.get('genero') or None
+    idioma = request.GET.get('idioma') or None
+    if (genero and genero not in GENEROS) or (idioma and idioma not in IDIOMAS):
+        return Response({"error": "Género o idioma no válido."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # 2) Top desde la caché (se recalcula como mucho cada TOP_RELATOS_CACHE_TTL segundos)
+    return Response(top_relatos(genero, idioma), status=status.HTTP_200_OK)
+
+PARAMETROS_RANKING = [
+    openapi.Parameter('filtro', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(METRICAS),
+                      description='Métrica del ranking (por defecto relatos)'),
+    openapi.Parameter('periodo', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(PERIODOS),
+                      description='Ventana del ranking (por defecto total)'),
+]
+
+
+def leer_ranking(request):
+    filtro = request.GET.get('filtro', 'relatos')
+    periodo = request.GET.get('periodo', 'total')
+    return (filtro if filtro in METRICAS else 'relatos',
+            periodo if periodo in PERIODOS else 'total')
+
 
+@swagger_auto_schema(
+    method='get',
+    tags=["Estadisticas"],
+    operation_summary="Ranking de usuarios",
+    operation_description="Top de usuarios por relatos publicados, votos recibidos o palabras escritas, "
+                          "semanal, mensual o histórico. Cada usuario lleva `puntos` y `posicion`; "
+                          "los usuarios sin puntos en ese periodo no salen.",
+    manual_parameters=PARAMETROS_RANKING + [
+        openapi.Parameter('limite', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Número de usuarios (por defecto 10)'),
+    ],
+    responses={200: UsuarioRankingSerializer(many=True)}
+)
 @api_view(['GET'])
+@permission_classes([AllowAny])
 def ranking_usuarios(request):
-    filtro = request.GET.get('filtro', 'relatos')
-    map_ord = {
-        'relatos': '-total_relatos_publicados',
-        'votos': '-total_votos_recibidos',
-        'palabras': '-total_palabras_escritas',
-    }
-    ordering = map_ord.get(filtro, '-total_relatos_publicados')
-    usuarios = Usuario.objects.order_by(ordering)[:10]
-    serializer = UsuarioRankingSerializer(usuarios, many=True)
-    return Response(serializer.data)
+    # 1) Métrica, periodo y cuántos devolver
+    filtro, periodo = leer_ranking(request)
+    try:
+        limite = min(max(int(request.GET.get('limite', 10)), 1), settings.RANKING_TOP_K)
+    except ValueError:
+        limite = 10
+
+    # 2) Top precalculado (caché + PuntuacionRanking)
+    top = top_ranking(filtro, periodo, lambda usuarios: UsuarioRankingSerializer(usuarios, many=True).data)
+    return Response(top[:limite])
+
+
+@swagger_auto_schema(
+    method='get',
+    tags=["Estadisticas"],
+    operation_summary="Posición de un usuario en el ranking",
+    operation_description="Posición y puntos de `?usuario=` (o del usuario autenticado). "
+                          "`posicion` es null si no tiene puntos en ese ranking.",
+    manual_parameters=PARAMETROS_RANKING + [
+        openapi.Parameter('usuario', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Id del usuario (por defecto el autenticado)'),
+    ],
+    responses={200: "Posición", 400: "Falta el usuario", 404: "Usuario no encontrado"}
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def api_posicion_ranking(request):
+    # 1) Usuario del que se pide la posición
+    usuario_id = request.GET.get('usuario') or request.user.id
+    if not usuario_id:
+        return Response({"error": "Indica ?usuario= o inicia sesión."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        usuario = Usuario.objects.only('id', 'username').get(pk=usuario_id)
+    except (Usuario.DoesNotExist, ValueError):
+        return Response({"error": "Usuario no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+
+    # 2) Posición: cuántos usuarios tienen más puntos
+    filtro, periodo = leer_ranking(request)
+    posicion, puntos = posicion_usuario(usuario.id, filtro, periodo)
+    return Response({
+        'usuario': usuario.id,
+        'username': usuario.username,
+        'filtro': filtro,
+        'periodo': periodo,
+        'posicion': posicion,
+        'puntos': puntos,
+    })
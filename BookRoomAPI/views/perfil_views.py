@@ -5,9 +5,9 @@ from rest_framework.decorators import api_view, permission_classes, parser_class
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
-from django.db.models import Q
 from drf_yasg import openapi
-from BookRoomAPI.models import PeticionAmistad, Usuario
+from BookRoomAPI.models import Usuario
+from BookRoomAPI.amistades import son_amigos
 from ..serializers import UsuarioSerializer, UsuarioUpdateSerializer
 
 #============================================================================================
@@ -49,8 +49,10 @@ Permite modificar los siguientes campos del perfil:
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser])
 def obtener_perfil(request):
-    # 1) Usuario autenticado
+    # 1) Usuario autenticado (request.user puede venir de la caché de tokens:
+    #    se relee para no mostrar ni guardar encima contadores atrasados)
     user = request.user
+    user.refresh_from_db()
 
     # 2) GET: serializar y devolver datos
     if request.method == 'GET':
@@ -106,13 +108,8 @@ def obtener_perfil_usuario(request, usuario_id):
     if objetivo.pk == request.user.pk:
         return Response(UsuarioSerializer(objetivo).data)
 
-    # 3) Si no, compruebo amistad en dos queries sencillas
-    es_amigo = PeticionAmistad.objects.filter(
-        Q(de_usuario=request.user, a_usuario=objetivo, estado='ACEPTADA') |
-        Q(de_usuario=objetivo, a_usuario=request.user, estado='ACEPTADA')
-    ).exists()
-
-    if not es_amigo:
+    # 3) Si no, compruebo la amistad (caché de mis amigos)
+    if not son_amigos(request.user.id, objetivo.pk):
         return Response(
           {"error": "Solo puedes ver el perfil de tus amigos."},
           status=status.HTTP_403_FORBIDDEN
@@ -1,6 +1,8 @@
 from django.db import transaction
 from django.db.models import Count, F
+from django.db.models.functions import Substr
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 
 from rest_framework import status, generics
 from rest_framework.response import Response
@@ -11,32 +13,70 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from BookRoomAPI.filtros import RelatoFilter
+from BookRoomAPI.filtros import RelatoFilter, RelatoPublicadoFilter
+from BookRoomAPI.busqueda import BusquedaRelatosFilter
 from BookRoomAPI.models import Relato, ParticipacionRelato, Estadistica
 from BookRoomAPI.serializers import (
     RelatoSerializer,
+    RelatoResumenSerializer,
     RelatoCreateSerializer,
     RelatoUpdateSerializer,
     MiFragmentoSerializer
 )
-from BookRoomAPI.utils import api_errores, actualizar_estadisticas
+from BookRoomAPI.utils import (
+    api_errores,
+    ajustar_estadisticas,
+    contar_palabras,
+    relatos_con_participaciones,
+    LONGITUD_EXTRACTO_HTML,
+)
 from BookRoomAPI.permissions import EsPropietarioOModerador, EsModeradorAdmin
+from BookRoomAPI.proyecciones import ProyeccionCamposMixin
+from BookRoomAPI.paginacion import PaginacionCursor
+from BookRoomAPI.cache_relatos import obtener_relato_publicado, invalidar_relato_publicado
+from BookRoomAPI.cola_estadisticas import encolar_recalculo
+from BookRoomAPI.contadores import incrementar_contadores, incrementar_contadores_autores
 
 
 #============================================================================================
 # RELATOS
 #============================================================================================
 
-class RelatosPublicadosList(generics.ListAPIView):
+class RelatoListadoMixin(ProyeccionCamposMixin):
+    """
+    Listados de relatos con RelatoResumenSerializer y ?fields=/?expand=.
+    Solo se leen las columnas y relaciones de los campos pedidos.
+    """
+    serializer_class = RelatoResumenSerializer
+    pagination_class = PaginacionCursor
+    orden_cursor = ('-fecha_creacion', '-id')
+    campos_expandibles = ('contenido', 'participaciones')
+    columnas_por_campo = {
+        'idioma_display': ('idioma',),
+        'generos_display': ('generos',),
+    }
+
+    def preparar_queryset(self, queryset, campos):
+        if 'extracto' in campos:
+            queryset = queryset.annotate(
+                extracto_html=Substr('contenido', 1, LONGITUD_EXTRACTO_HTML)
+            )
+        if 'participaciones' in campos:
+            queryset = relatos_con_participaciones(queryset)
+        elif 'autores' in campos:
+            queryset = relatos_con_participaciones(queryset, con_fragmentos=False)
+        return queryset
+
+
+class RelatosPublicadosList(RelatoListadoMixin, generics.ListAPIView):
     """
     Listar relatos en estado PUBLICADO. Público.
     """
     queryset = Relato.objects.filter(estado='PUBLICADO')
-    serializer_class = RelatoSerializer
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_class = RelatoFilter
-    search_fields = ['titulo', 'descripcion']
+    # La búsqueda va después de OrderingFilter para poder ordenar por relevancia
+    filter_backends = [DjangoFilterBackend, OrderingFilter, BusquedaRelatosFilter]
+    filterset_class = RelatoPublicadoFilter
     ordering_fields = ['fecha_creacion', 'num_escritores', 'titulo']
     ordering = ['-fecha_creacion']
 
@@ -44,22 +84,24 @@ class RelatosPublicadosList(generics.ListAPIView):
         operation_summary="Listar relatos publicados",
         operation_description=(
             "Listado paginado de relatos PUBLICADOS.\n"
-            "Parámetros opcionales: search, filtros, ordering."
+            "Parámetros opcionales: search, filtros, ordering, fields, expand.\n"
+            "`search` es una búsqueda de texto completo ordenada por relevancia.\n"
+            "Con ?paginacion=cursor se pagina por cursor (next/previous, sin count)."
         ),
+        manual_parameters=RelatoListadoMixin.parametros_swagger,
         responses={200: openapi.Response(
             description="Listado de relatos publicados",
-            schema=RelatoSerializer(many=True)
+            schema=RelatoResumenSerializer(many=True)
         )}
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
 
-class MisRelatosList(generics.ListAPIView):
+class MisRelatosList(RelatoListadoMixin, generics.ListAPIView):
     """
     Listar relatos en los que participa el usuario autenticado.
     """
-    serializer_class = RelatoSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_class = RelatoFilter
@@ -73,9 +115,10 @@ class MisRelatosList(generics.ListAPIView):
     @swagger_auto_schema(
         operation_summary="Listar mis relatos",
         operation_description="Devuelve listado de relatos donde el usuario es autor o colaborador.",
+        manual_parameters=RelatoListadoMixin.parametros_swagger,
         responses={200: openapi.Response(
             description="Listado de mis relatos",
-            schema=RelatoSerializer(many=True)
+            schema=RelatoResumenSerializer(many=True)
         )}
     )
     def get(self, request, *args, **kwargs):
@@ -93,7 +136,7 @@ class MisRelatosList(generics.ListAPIView):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def api_obtener_relato(request, relato_id):
-    relato = get_object_or_404(Relato, pk=relato_id)
+    relato = get_object_or_404(relatos_con_participaciones(Relato.objects.all()), pk=relato_id)
     permiso = EsPropietarioOModerador()
     if not permiso.has_object_permission(request, None, relato):
         return Response({"error": "No tienes acceso a este relato."}, status=status.HTTP_403_FORBIDDEN)
@@ -105,16 +148,32 @@ def api_obtener_relato(request, relato_id):
     method='get',
     tags=["Relatos"],
     operation_summary="Ver relato publicado (público)",
-    operation_description="Devuelve un relato si está en estado PUBLICADO. Público.",
+    operation_description=(
+        "Devuelve un relato si está en estado PUBLICADO. Público.\n"
+        "La respuesta sale de caché y lleva ETag: con If-None-Match devuelve 304 si no ha cambiado."
+    ),
     manual_parameters=[openapi.Parameter('relato_id', openapi.IN_PATH, type=openapi.TYPE_INTEGER)],
-    responses={200: RelatoSerializer, 404: "No publicado o no existe"}
+    responses={200: RelatoSerializer, 304: "Sin cambios", 404: "No publicado o no existe"}
 )
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def api_ver_relato_publicado(request, relato_id):
-    relato = get_object_or_404(Relato, pk=relato_id, estado='PUBLICADO')
-    serializer = RelatoSerializer(relato)
-    return Response(serializer.data)
+    # 1) Payload y ETag desde caché (solo se va a la BD si no está)
+    def generar():
+        relato = get_object_or_404(
+            relatos_con_participaciones(Relato.objects.all()), pk=relato_id, estado='PUBLICADO'
+        )
+        return RelatoSerializer(relato).data
+
+    etag, data = obtener_relato_publicado(relato_id, generar)
+    cabeceras = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+    # 2) Si el cliente ya tiene esta versión, 304 sin cuerpo
+    etags_cliente = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in etags_cliente or '*' in etags_cliente:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=cabeceras)
+
+    return Response(data, headers=cabeceras)
 
 
 @swagger_auto_schema(
@@ -141,7 +200,11 @@ def api_crear_relato(request):
 
     with transaction.atomic():
         relato = serializer.save()
-        Estadistica.objects.create(relato=relato)
+        Estadistica.objects.create(
+            relato=relato,
+            num_colaboradores=1,
+            total_palabras=contar_palabras(relato.contenido)
+        )
         ParticipacionRelato.objects.create(
             usuario=usuario,
             relato=relato,
@@ -149,7 +212,6 @@ def api_crear_relato(request):
             contenido_fragmento=''
         )
         relato.comprobar_estado_y_actualizar()
-        actualizar_estadisticas(relato)
 
     # añadimos "tipo": "success"
     return Response(
@@ -199,15 +261,22 @@ def api_marcar_relato_listo(request, relato_id):
 @api_view(['PUT', 'PATCH'])
 @permission_classes([IsAuthenticated, EsPropietarioOModerador])
 def api_editar_relato(request, relato_id):
-    return api_errores(
+    relato = get_object_or_404(Relato, pk=relato_id)
+    palabras_antes = contar_palabras(relato.contenido)
+    respuesta = api_errores(
         RelatoUpdateSerializer(
-            instance=get_object_or_404(Relato, pk=relato_id),
+            instance=relato,
             data=request.data,
             partial=True
         ),
         mensaje="Relato editado correctamente",
         status_success=status.HTTP_200_OK
     )
+    if respuesta.status_code == status.HTTP_200_OK:
+        ajustar_estadisticas(relato_id, total_palabras=contar_palabras(relato.contenido) - palabras_antes)
+        encolar_recalculo(relato_id)
+        invalidar_relato_publicado(relato_id)
+    return respuesta
 
 
 @swagger_auto_schema(
@@ -223,15 +292,22 @@ def api_editar_relato(request, relato_id):
 @permission_classes([IsAuthenticated, EsModeradorAdmin])
 def api_editar_relato_final(request, relato_id):
     print("EDITANDO RELATO FINAL")
-    return api_errores(
+    relato = get_object_or_404(Relato, pk=relato_id)
+    palabras_antes = contar_palabras(relato.contenido)
+    respuesta = api_errores(
         RelatoUpdateSerializer(
-            instance=get_object_or_404(Relato, pk=relato_id),
+            instance=relato,
             data=request.data,
             partial=True
         ),
         mensaje="Relato final editado correctamente",
         status_success=status.HTTP_200_OK
     )
+    if respuesta.status_code == status.HTTP_200_OK:
+        ajustar_estadisticas(relato_id, total_palabras=contar_palabras(relato.contenido) - palabras_antes)
+        encolar_recalculo(relato_id)
+        invalidar_relato_publicado(relato_id)
+    return respuesta
 
 
 @swagger_auto_schema(
@@ -252,15 +328,15 @@ def api_eliminar_relato(request, relato_id):
                         status=status.HTTP_403_FORBIDDEN)
 
     relato.delete()
+    invalidar_relato_publicado(relato_id)
     return Response({"mensaje": "Relato eliminado correctamente.", "tipo": "success"})
 
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-class RelatosDisponiblesList(generics.ListAPIView):
+class RelatosDisponiblesList(RelatoListadoMixin, generics.ListAPIView):
     """
     Listar relatos en CREACION con plazas libres. Público en lectura, 
     sólo requiere auth para futuros métodos de escritura.
     """
-    serializer_class   = RelatoSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends    = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_class    = RelatoFilter
@@ -279,9 +355,10 @@ class RelatosDisponiblesList(generics.ListAPIView):
     @swagger_auto_schema(
         operation_summary="Listar relatos disponibles",
         operation_description="Devuelve listado de relatos en creación con plazas libres. Público.",
+        manual_parameters=RelatoListadoMixin.parametros_swagger,
         responses={200: openapi.Response(
             description="Listado de relatos disponibles",
-            schema=RelatoSerializer(many=True)
+            schema=RelatoResumenSerializer(many=True)
         )}
     )
     def get(self, request, *args, **kwargs):
@@ -322,8 +399,9 @@ def api_unirse_a_relato(request, relato_id):
 
     ParticipacionRelato.objects.create(usuario=usuario, relato=relato,
                                       orden=relato.autores.count() + 1)
+    ajustar_estadisticas(relato.id, num_colaboradores=1)
+    encolar_recalculo(relato.id)
     relato.comprobar_estado_y_actualizar()
-    actualizar_estadisticas(relato)
 
     return Response({"mensaje": "Te has unido correctamente al relato.", "tipo": "success"},
                     status=status.HTTP_201_CREATED)
@@ -357,9 +435,17 @@ def api_mi_fragmento(request, relato_id):
         return Response(MiFragmentoSerializer(participacion).data)
 
     # PUT
+    palabras_antes = contar_palabras(participacion.contenido_fragmento)
     serializer = MiFragmentoSerializer(participacion, data=request.data, partial=True)
     serializer.is_valid(raise_exception=True)
     serializer.save()
+    # Si el fragmento ya contaba en las estadísticas, solo se suma la diferencia
+    if participacion.listo_para_publicar:
+        ajustar_estadisticas(
+            relato.id,
+            total_palabras=contar_palabras(participacion.contenido_fragmento) - palabras_antes
+        )
+        encolar_recalculo(relato.id)
     return Response(serializer.data)
 
 
@@ -375,12 +461,13 @@ def api_mi_fragmento(request, relato_id):
 def api_marcar_fragmento_listo(request, relato_id):
     participacion = get_object_or_404(ParticipacionRelato, relato_id=relato_id, usuario=request.user)
     if not participacion.listo_para_publicar:
-        texto = participacion.contenido_fragmento or ""
-        palabras = len(texto.split())
-        request.user.total_palabras_escritas = F('total_palabras_escritas') + palabras
-        request.user.save(update_fields=['total_palabras_escritas'])
+        palabras = contar_palabras(participacion.contenido_fragmento)
+        incrementar_contadores([request.user.id], total_palabras_escritas=palabras)
         participacion.listo_para_publicar = True
         participacion.save()
+        # Las palabras del fragmento pasan a contar en el relato
+        ajustar_estadisticas(relato_id, total_palabras=palabras)
+        encolar_recalculo(relato_id)
 
     relato = participacion.relato
     if not ParticipacionRelato.objects.filter(relato=relato, listo_para_publicar=False).exists():
@@ -389,10 +476,7 @@ def api_marcar_fragmento_listo(request, relato_id):
         relato.contenido = inicial + "".join(p.contenido_fragmento or "" for p in fragments)
         relato.estado = 'PUBLICADO'
         relato.save()
-        actualizar_estadisticas(relato)
-        for autor in relato.autores.all():
-            autor.total_relatos_publicados = F('total_relatos_publicados') + 1
-            autor.save(update_fields=['total_relatos_publicados'])
+        incrementar_contadores_autores(relato.id, total_relatos_publicados=1)
 
     # unificamos tipo success
     return Response({"mensaje": "Fragmento marcado como listo.", "tipo": "success"})
@@ -2,13 +2,18 @@ from rest_framework import  status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import F
+from django.db import transaction
+from django.utils import timezone
 
 from drf_yasg.utils import swagger_auto_schema
 
 from BookRoomAPI.models import *
 from BookRoomAPI.serializers import *
 from BookRoomAPI.utils import *
+from BookRoomAPI.cola_estadisticas import encolar_recalculo
+from BookRoomAPI.contadores import incrementar_contadores_autores
+from BookRoomAPI.buffer_votos import obtener_buffer
+from django.conf import settings
 
 #============================================================================================
 #VOTOS--------------------------------------------------------------------------------------
@@ -21,6 +26,7 @@ from BookRoomAPI.utils import *
     request_body=VotoSerializer,
     responses={
         201: "Voto registrado",
+        202: "Voto aceptado (modo write-behind, se guarda en unos milisegundos)",
         400: "Errores de validación o ya votado"
     }
 )
@@ -41,22 +47,36 @@ def api_votar_relato(request, relato_id):
     serializer.is_valid(raise_exception=True)
     puntuacion = serializer.validated_data['puntuacion']
 
-    # 3) Crear o actualizar el voto
-    voto, created = Voto.objects.update_or_create(
-        usuario=request.user,
-        relato=relato,
-        defaults={'puntuacion': puntuacion}
-    )
-    # 4) Actualizar estadísticas del relato
-    actualizar_estadisticas(relato)
+    # 2b) Modo write-behind: se apunta en el buffer y se guarda en el siguiente volcado
+    if settings.VOTOS_WRITE_BEHIND:
+        obtener_buffer().registrar(request.user.id, relato.id, puntuacion)
+        return Response(
+            {"relato": relato.id, "puntuacion": puntuacion, "pendiente": True},
+            status=status.HTTP_202_ACCEPTED
+        )
 
-    # 5) Si es la primera vez que este usuario vota,
+    # 3) Crear o actualizar el voto y aplicar la diferencia a las estadísticas
+    with transaction.atomic():
+        # Si otra petición crea el primer voto a la vez, get_or_create captura el
+        # IntegrityError y relee (y bloquea) su fila: se sigue por la actualización
+        voto, created = Voto.objects.select_for_update().get_or_create(
+            usuario=request.user, relato=relato, defaults={'puntuacion': puntuacion}
+        )
+        if created:
+            registrar_voto_estadisticas(relato.id, puntuacion)
+        elif voto.puntuacion != puntuacion:
+            anterior = voto.puntuacion
+            voto.puntuacion = puntuacion
+            voto.fecha_actualizacion = timezone.now()
+            voto.save(update_fields=['puntuacion', 'fecha_actualizacion'])
+            registrar_voto_estadisticas(relato.id, puntuacion, anterior)
+        encolar_recalculo(relato.id)
+
+    # 4) Si es la primera vez que este usuario vota,
     if created:
-        for autor in relato.autores.all():
-            autor.total_votos_recibidos = F('total_votos_recibidos') + 1
-            autor.save(update_fields=['total_votos_recibidos'])
+        incrementar_contadores_autores(relato.id, total_votos_recibidos=1)
 
-    # 6) Responder con el voto (200 si se modificó, 201 si es nuevo)
+    # 5) Responder con el voto (200 si se modificó, 201 si es nuevo)
     status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
     return Response(VotoSerializer(voto).data, status=status_code)
 
@@ -73,6 +93,12 @@ def api_votar_relato(request, relato_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def api_mi_voto_relato(request, relato_id):
+    # Un voto aún en el buffer write-behind es el más reciente
+    if settings.VOTOS_WRITE_BEHIND:
+        pendiente = obtener_buffer().pendiente(request.user.id, relato_id)
+        if pendiente is not None:
+            return Response({"relato": relato_id, "puntuacion": pendiente, "pendiente": True})
+
     try:
         voto = Voto.objects.get(relato_id=relato_id, usuario=request.user)
     except Voto.DoesNotExist:
@@ -2,18 +2,15 @@ import os
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.shortcuts import get_object_or_404
 
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 
-from oauth2_provider.models import AccessToken, Application
-from oauthlib.common import generate_token
 from django.utils import timezone
-from datetime import timedelta
 
 from .models import Suscripcion, Usuario
 from .serializers import UsuarioSerializer
+from .tokens import emitir_token
 
 import unicodedata
 import re
@@ -82,21 +79,7 @@ class GoogleLoginAPIView(APIView):
             )
 
         # Token OAuth2
-        app = get_object_or_404(Application, name="BookRoomAPI")
-        token_obj = AccessToken.objects.filter(
-            user=user,
-            application=app,
-            expires__gt=timezone.now()
-        ).first()
-
-        if not token_obj:
-            token_obj = AccessToken.objects.create(
-                user=user,
-                token=generate_token(),
-                application=app,
-                expires=timezone.now() + timedelta(hours=10),
-                scope='read write'
-            )
+        token_obj = emitir_token(user)
 
         return Response({
             'access_token': token_obj.token,
@@ -0,0 +1,164 @@
+"""
+Motor de votos de comentarios: crea, cambia o quita los ComentarioVoto de
+un usuario y ajusta Comentario.votos (y positivos, negativos, best y hot)
+en la misma transacción.
+
+Sirve igual para un voto que para un lote. Las queries son siempre las
+mismas, da igual el número de comentarios:
+1) SELECT ... FOR UPDATE de los comentarios (serializa los clics simultáneos),
+2) SELECT de mis votos anteriores,
+3) INSERT / UPDATE (CASE) / DELETE de los votos que cambian,
+4) un UPDATE con CASE que deja en cada comentario sus contadores y puntuaciones.
+
+Puntuaciones guardadas (con índice por relato, así ordenar es recorrer el índice):
+- best: límite inferior del intervalo de Wilson de la proporción de votos
+  positivos. Con pocos votos es prudente: 1 de 1 queda por debajo de 40 de 45.
+- hot: log2(max(best, COMENTARIOS_HOT_MINIMO)) + horas desde 1970 / vida media.
+  Ordenar por ahí es lo mismo que por best · 2^(-edad / vida media), pero el
+  término de la fecha no cambia con el tiempo y no hay que recalcular nada.
+"""
+import math
+from collections import namedtuple
+from datetime import datetime, timezone as tz
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Q, SmallIntegerField, Value, When
+
+from .models import Comentario, ComentarioVoto
+
+# votos: puntuación neta nueva; mi_voto: 1, -1 o 0; anterior: mi voto antes del cambio
+ResultadoVoto = namedtuple('ResultadoVoto', ['votos', 'mi_voto', 'anterior'])
+
+VALORES = (ComentarioVoto.VOTOARRIBA, ComentarioVoto.VOTOABAJO, 0)
+
+EPOCA = datetime(1970, 1, 1, tzinfo=tz.utc)
+
+
+def wilson(positivos, negativos):
+    n = positivos + negativos
+    if not n:
+        return 0.0
+    z = settings.COMENTARIOS_WILSON_Z
+    p = positivos / n
+    return (p + z * z / (2 * n) - z * math.sqrt((p * (1 - p) + z * z / (4 * n)) / n)) / (1 + z * z / n)
+
+
+def puntuaciones_comentario(positivos, negativos, fecha):
+    """Devuelve (best, hot) de un comentario."""
+    best = wilson(positivos, negativos)
+    horas = (fecha - EPOCA).total_seconds() / 3600
+    hot = math.log2(max(best, settings.COMENTARIOS_HOT_MINIMO)) + horas / settings.COMENTARIOS_HOT_VIDA_MEDIA_HORAS
+    return best, hot
+
+
+def recalcular_puntuaciones(comentarios):
+    """
+    Recuenta desde ComentarioVoto los votos de `comentarios`
+    (un queryset) y vuelve a calcular best y hot. Para la migración y para
+    cuando cambian los parámetros en settings.
+    """
+    comentarios = comentarios.annotate(
+        positivos=Count('votos_usuario', filter=Q(votos_usuario__valor=ComentarioVoto.VOTOARRIBA)),
+        negativos=Count('votos_usuario', filter=Q(votos_usuario__valor=ComentarioVoto.VOTOABAJO)),
+    ).only('id', 'fecha').order_by()
+    lote = []
+    for comentario in comentarios.iterator():
+        comentario.votos_positivos, comentario.votos_negativos = comentario.positivos, comentario.negativos
+        comentario.votos = comentario.positivos - comentario.negativos
+        comentario.puntuacion_best, comentario.puntuacion_hot = puntuaciones_comentario(
+            comentario.positivos, comentario.negativos, comentario.fecha
+        )
+        lote.append(comentario)
+    comentarios.model.objects.bulk_update(
+        lote, ['votos', 'votos_positivos', 'votos_negativos', 'puntuacion_best', 'puntuacion_hot'], batch_size=500
+    )
+    return len(lote)
+
+
+def _por_comentario(valores, campo, output_field):
+    return Case(
+        *[When(pk=c, then=Value(v)) for c, v in valores.items()],
+        default=F(campo),
+        output_field=output_field,
+    )
+
+
+def aplicar_votos_comentarios(usuario, relato_id, votos):
+    """
+    `votos` es {comentario_id: valor}, con valor 1, -1 o 0 (quitar el voto).
+    Devuelve {comentario_id: ResultadoVoto} de los comentarios que existen
+    en el relato; los demás se ignoran.
+    """
+    with transaction.atomic():
+        filas = (
+            Comentario.objects
+            .select_for_update()
+            .filter(relato_id=relato_id, pk__in=votos)
+            .order_by('pk')
+            .values_list('pk', 'votos', 'votos_positivos', 'votos_negativos', 'fecha')
+        )
+        actuales = {pk: resto for pk, *resto in filas}
+        if not actuales:
+            return {}
+        anteriores = dict(
+            ComentarioVoto.objects
+            .filter(usuario=usuario, comentario_id__in=actuales)
+            .values_list('comentario_id', 'valor')
+        )
+
+        nuevos, cambiados, quitados, deltas, contadores = [], {}, [], {}, {}
+        for comentario_id, (_, positivos, negativos, fecha) in actuales.items():
+            valor, anterior = votos[comentario_id], anteriores.get(comentario_id, 0)
+            if valor == anterior:
+                continue
+            if not anterior:
+                nuevos.append(ComentarioVoto(usuario=usuario, comentario_id=comentario_id, valor=valor))
+            elif not valor:
+                quitados.append(comentario_id)
+            else:
+                cambiados[comentario_id] = valor
+            deltas[comentario_id] = valor - anterior
+            positivos += (valor == ComentarioVoto.VOTOARRIBA) - (anterior == ComentarioVoto.VOTOARRIBA)
+            negativos += (valor == ComentarioVoto.VOTOABAJO) - (anterior == ComentarioVoto.VOTOABAJO)
+            contadores[comentario_id] = (positivos, negativos, *puntuaciones_comentario(positivos, negativos, fecha))
+
+        mis_votos = ComentarioVoto.objects.filter(usuario=usuario)
+        if nuevos:
+            ComentarioVoto.objects.bulk_create(nuevos)
+        if quitados:
+            mis_votos.filter(comentario_id__in=quitados).delete()
+        if cambiados:
+            mis_votos.filter(comentario_id__in=cambiados).update(valor=Case(
+                *[When(comentario_id=c, then=Value(v)) for c, v in cambiados.items()],
+                default=F('valor'),
+                output_field=SmallIntegerField(),
+            ))
+        if deltas:
+            # Con la fila bloqueada los contadores y puntuaciones se escriben ya calculados
+            columnas = zip(*contadores.values())
+            positivos, negativos, best, hot = (dict(zip(contadores, col)) for col in columnas)
+            Comentario.objects.filter(pk__in=deltas).update(
+                votos=F('votos') + Case(
+                    *[When(pk=c, then=Value(d)) for c, d in deltas.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+                votos_positivos=_por_comentario(positivos, 'votos_positivos', IntegerField()),
+                votos_negativos=_por_comentario(negativos, 'votos_negativos', IntegerField()),
+                puntuacion_best=_por_comentario(best, 'puntuacion_best', FloatField()),
+                puntuacion_hot=_por_comentario(hot, 'puntuacion_hot', FloatField()),
+            )
+
+    return {
+        comentario_id: ResultadoVoto(
+            votos=fila[0] + deltas.get(comentario_id, 0),
+            mi_voto=votos[comentario_id],
+            anterior=anteriores.get(comentario_id, 0),
+        )
+        for comentario_id, fila in actuales.items()
+    }
+
+
+def respuesta_voto(comentario_id, resultado):
+    return {'comentario': comentario_id, 'votos': resultado.votos, 'mi_voto': resultado.mi_voto}
@@ -11,6 +11,10 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from BookRoomAPI.middleware import TokenAuthMiddleware
 from BookRoomAPI.routing import websocket_urlpatterns
+from BookRoomAPI.indice_usuarios import precargar_indice
+
+# 3) Cargar en segundo plano el índice de usernames del autocompletado
+precargar_indice()
 
 
 application = ProtocolTypeRouter({
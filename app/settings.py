@@ -142,7 +142,8 @@ CORS_ALLOWED_ORIGINS = env.list('CORS_ALLOWED_ORIGINS')
 # ─── 12) DJANGO REST FRAMEWORK ─────────────────────────────────────────────────
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        # OAuth2Authentication con caché de tokens (BookRoomAPI/cache_tokens.py)
+        'BookRoomAPI.autenticacion.OAuth2AuthenticationCacheada',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
@@ -154,6 +155,9 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # Proxies delante de daphne en los que se confía para X-Forwarded-For. Con 0 la IP
+    # del cliente (throttles de login y registro) es REMOTE_ADDR: la cabecera la puede inventar
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=0),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
 }
@@ -205,3 +209,118 @@ cloudinary.config(
 PAYPAL_CLIENT_ID = env('PAYPAL_CLIENT_ID')
 PAYPAL_CLIENT_SECRET = env('PAYPAL_CLIENT_SECRET')
 PAYPAL_MODE = env('PAYPAL_MODE')  # 'sandbox' (dinero de mentira)
+
+# ─── 20) CACHÉ ──────────────────────────────────────────────────────────────────
+# Por defecto en memoria del proceso (vale con un solo worker de Daphne).
+# Con varios workers hay que apuntar CACHE_URL a una caché compartida (redis://host:6379/0,
+# cliente `redis` en requirements.txt): sin ella un logout o una invalidación solo llega a un worker.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://bookroom'),
+    # Local de cada proceso: cubos de tokens de los throttles (sección 33). Con el
+    # MAX_ENTRIES por defecto (300) una ráfaga desde muchas IPs haría sitio borrando
+    # cubos agotados, es decir, devolviendo los intentos al atacante
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+        'OPTIONS': {'MAX_ENTRIES': 200_000, 'CULL_FREQUENCY': 10},
+    },
+}
+
+# Segundos que se guarda en caché el JSON de un relato publicado
+RELATO_PUBLICADO_CACHE_TTL = 60 * 60
+
+# ─── 21) COLA DE RECÁLCULO DE ESTADÍSTICAS ─────────────────────────────────────
+# 'local': hilo dentro de cada proceso. 'db': tabla en MySQL procesada por
+# `python manage.py procesar_recalculos` (para varios workers).
+ESTADISTICAS_BROKER = env('ESTADISTICAS_BROKER', default='local')
+# Como mucho un recálculo completo por relato cada estos segundos
+ESTADISTICAS_RECALCULO_SEGUNDOS = env.int('ESTADISTICAS_RECALCULO_SEGUNDOS', default=30)
+
+# ─── 22) RANKINGS DE USUARIOS ──────────────────────────────────────────────────
+# Cuántas posiciones se precalculan por ranking y cuánto duran en caché
+RANKING_TOP_K = 100
+RANKING_CACHE_TTL = 60
+
+# ─── 23) TOP DE RELATOS ────────────────────────────────────────────────────────
+# Media bayesiana: se cuenta como si cada relato tuviera ya estos votos previos
+TOP_RELATOS_VOTOS_PREVIOS = 5
+TOP_RELATOS_MEDIA_PREVIA = 3.0
+TOP_RELATOS_LIMITE = 10
+TOP_RELATOS_CACHE_TTL = 30
+
+# ─── 24) VOTOS WRITE-BEHIND ────────────────────────────────────────────────────
+# Si está activo, los votos de relatos se responden al momento y se guardan
+# por lotes cada VOTOS_FLUSH_MS ms. El diario en disco de cada proceso va a
+# VOTOS_BUFFER_DIR (debe sobrevivir a los reinicios).
+VOTOS_WRITE_BEHIND = env.bool('VOTOS_WRITE_BEHIND', default=False)
+VOTOS_FLUSH_MS = env.int('VOTOS_FLUSH_MS', default=250)
+VOTOS_BUFFER_DIR = env('VOTOS_BUFFER_DIR', default=os.path.join(BASE_DIR, 'var', 'votos'))
+# Volcados fallidos seguidos tras los que un voto pasa a cuarentena (fichero aparte en VOTOS_BUFFER_DIR)
+VOTOS_FLUSH_MAX_INTENTOS = 5
+
+# ─── 25) ORDEN DE COMENTARIOS (best / hot) ─────────────────────────────────────
+# best: límite inferior de Wilson de los votos positivos con este z (95 %).
+# hot: best con decaimiento exponencial; cada COMENTARIOS_HOT_VIDA_MEDIA_HORAS
+# un comentario vale la mitad. Si se cambian, `recalcular_puntuaciones_comentarios`.
+COMENTARIOS_WILSON_Z = 1.96
+COMENTARIOS_HOT_VIDA_MEDIA_HORAS = 24
+COMENTARIOS_HOT_MINIMO = 0.05
+
+# ─── 26) AMISTADES ─────────────────────────────────────────────────────────────
+# Segundos que se guarda en caché el conjunto de amigos de cada usuario
+# (se invalida al aceptar, borrar o bloquear; esto es solo el tope)
+AMISTADES_CACHE_TTL = 60 * 10
+
+# ─── 27) SUGERENCIAS DE AMISTAD ────────────────────────────────────────────────
+# Cuántas sugerencias se devuelven y cada cuánto se recalculan
+SUGERENCIAS_LIMITE = 20
+SUGERENCIAS_CACHE_TTL = 60 * 15
+# Tope del recorrido: amigos de partida y candidatos por cada fuente
+SUGERENCIAS_MAX_AMIGOS = 500
+SUGERENCIAS_MAX_CANDIDATOS = 200
+# Puntuación = amigos en común * PESO_AMIGO + relatos en común * PESO_RELATO
+SUGERENCIAS_PESO_AMIGO = 1
+SUGERENCIAS_PESO_RELATO = 2
+
+# ─── 28) BÚSQUEDA DE USUARIOS ──────────────────────────────────────────────────
+# Tope de resultados de una búsqueda (se paginan de 10 en 10)
+BUSQUEDA_USUARIOS_MAX_RESULTADOS = 50
+
+# ─── 29) ÍNDICE DE USUARIOS EN MEMORIA (autocompletado) ────────────────────────
+# Cada worker guarda los usernames ordenados en memoria (~160 bytes por usuario,
+# ver `medir_indice_usuarios`) y cada estos segundos mira si hay cambios de otros procesos
+USUARIOS_INDICE_MEMORIA = env.bool('USUARIOS_INDICE_MEMORIA', default=True)
+USUARIOS_INDICE_REFRESCO_SEGUNDOS = 30
+# Ids por debajo del último visto que se vuelven a leer en cada refresco (altas confirmadas fuera de orden)
+USUARIOS_INDICE_SOLAPE_IDS = 200
+
+# ─── 30) CACHÉ DE ACCESS TOKENS ────────────────────────────────────────────────
+# Segundos que un token resuelto (con su usuario) se sirve desde la caché; nunca
+# más allá de su `expires`. Logout, borrado del token o cambios en el usuario lo invalidan al momento
+TOKENS_CACHE_TTL = 300
+# Con la caché por defecto (locmem, de cada proceso) el logout no llega a los demás workers:
+# ahí el token se guarda solo estos segundos. Con varios workers, CACHE_URL=redis://...
+TOKENS_CACHE_TTL_LOCAL = 5
+
+# ─── 31) PURGA DE ACCESS TOKENS ────────────────────────────────────────────────
+# `python manage.py purgar_tokens` (cron): caducados borrados de TOKENS_PURGA_LOTE
+# en TOKENS_PURGA_LOTE, cada lote en su transacción y con esta pausa entre lotes
+TOKENS_PURGA_LOTE = 1000
+TOKENS_PURGA_PAUSA = 0.1
+
+# ─── 32) EMISIÓN DE ACCESS TOKENS (registro y login) ───────────────────────────
+# Duración de un token nuevo; en el login se reutiliza el vigente si le queda al
+# menos TOKENS_VIDA_MINIMA_MINUTOS. La Application se relee como mucho cada estos segundos
+TOKENS_DURACION_HORAS = 10
+TOKENS_VIDA_MINIMA_MINUTOS = 30
+OAUTH_APLICACION_REFRESCO_SEGUNDOS = 60
+
+# ─── 33) LÍMITES DE LOGIN Y REGISTRO (BookRoomAPI/throttles.py) ────────────────
+# Cubos de tokens por proceso: (intentos seguidos, intentos recuperados por minuto).
+# Se comprueban antes de calcular el hash de la contraseña; al pasarse, 429 + Retry-After
+THROTTLE_CACHE = 'throttle'
+THROTTLE_LIMITES = {
+    'login_ip': (20, 10),
+    'login_usuario': (10, 5),
+    'registro_ip': (5, 2),
+}
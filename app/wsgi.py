@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+# Índice de usernames del autocompletado, cargado en segundo plano al arrancar
+from BookRoomAPI.indice_usuarios import precargar_indice  # noqa: E402
+precargar_indice()